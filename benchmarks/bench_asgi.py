@@ -0,0 +1,127 @@
+# Benchmark of the async (ASGI) serving mode against the sync Flask app. Both serve the same
+# routes from a SQLite database and an in-memory Redis (fakeredis, needed for this benchmark
+# only), and every Redis round trip of the cached read path is delayed by --latency to stand
+# in for a remote Redis. The sync app runs on a pool of --threads threads like a gthread
+# worker, the ASGI app is called directly on one event loop. For every concurrency level all
+# the clients send their requests at once, the report gives throughput and latency percentiles.
+#
+# Usage: python benchmarks/bench_asgi.py [--concurrency 100 1000 5000] [--latency 0.005]
+#                                        [--threads 8] [--path /api/players] [--players 1000]
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def setup_environment(players):
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_asgi.db"
+    os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+    os.environ.setdefault("SECRET_KEY", "bench")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench" * 8)
+    os.environ["ADMISSION_MAX_IN_FLIGHT"] = "1000000"
+
+    # Both Redis clients share one in-memory server
+    import fakeredis
+    import redis
+    import redis.asyncio
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kw: fakeredis.FakeRedis(server=server, **kw))
+    redis.asyncio.BlockingConnectionPool.from_url = classmethod(lambda cls, url, **kw: fakeredis.FakeAsyncRedis(
+        server=server, connection_pool_class=cls, **kw).connection_pool)
+
+    from sqlalchemy import insert
+    from src.db import init_db
+    from src.migrate import upgrade
+    from src.models import Player, Team
+    engine = init_db()
+    upgrade(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Team), [{"name": f"Team {i}"} for i in range(1, 21)])
+        connection.execute(insert(Player), [{"name": f"Player number {i}", "team_id": (i % 20) + 1} for i in range(players)])
+
+# Delaying the cache reads of both apps by the simulated Redis latency
+def add_latency(latency):
+    from src import cache
+    from src.aio import cache as aio_cache
+    from src.routes import players, teams
+
+    sync_get_cached, async_get_cached = cache.get_cached, aio_cache.get_cached
+
+    def slow_get_cached(key):
+        time.sleep(latency)
+        return sync_get_cached(key)
+
+    async def slow_async_get_cached(key):
+        await asyncio.sleep(latency)
+        return await async_get_cached(key)
+
+    players.get_cached = teams.get_cached = slow_get_cached
+    aio_cache.get_cached = slow_async_get_cached
+
+def report(name, concurrency, elapsed, latencies, errors):
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<6} {concurrency:>6} clients  {concurrency / elapsed:10.1f} req/s  "
+          f"p50 {statistics.median(latencies) * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms  errors {errors}")
+
+def bench_sync(app, path, concurrency, threads):
+    def request(sent_at):
+        with app.test_client() as client:
+            status = client.get(path).status_code
+        return time.perf_counter() - sent_at, status
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(request, [time.perf_counter() for _ in range(concurrency)]))
+        elapsed = time.perf_counter() - start
+    report("sync", concurrency, elapsed, [latency for latency, _ in results], sum(status >= 500 for _, status in results))
+
+async def bench_async(app, path, concurrency):
+    async def request():
+        sent_at = time.perf_counter()
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": path, "headers": [], "query_string": b""}
+        await app(scope, receive, send)
+        return time.perf_counter() - sent_at, messages[0]["status"]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(request() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    report("async", concurrency, elapsed, [latency for latency, _ in results], sum(status >= 500 for _, status in results))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--path", default="/api/players")
+    parser.add_argument("--players", type=int, default=1000)
+    args = parser.parse_args()
+
+    setup_environment(args.players)
+    add_latency(args.latency)
+
+    from src import create_app
+    from src.aio.app import app as asgi_app
+    flask_app = create_app()
+
+    async def run_async():
+        for concurrency in args.concurrency:
+            await bench_async(asgi_app, args.path, concurrency)
+
+    print(f"{args.path}, Redis latency {args.latency * 1000:.1f} ms, sync app on {args.threads} threads")
+    for concurrency in args.concurrency:
+        bench_sync(flask_app, args.path, concurrency, args.threads)
+    asyncio.run(run_async())
@@ -0,0 +1,61 @@
+# Benchmark of the streaming export: builds SQLite databases of growing size, streams the
+# players export through the same generators as /api/export/players and reports the
+# throughput and the peak Python memory, which must stay flat as the row count grows.
+#
+# Usage: python benchmarks/bench_export.py [--rows 1000 100000 1000000] [--format csv] [--gzip]
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, insert
+from src.models import Base, Player, Team
+from src.routes.export import EXPORTS, stream_rows, gzip_stream
+
+def build_database(path, rows, teams=50, batch=50000):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Team), [{"name": f"Team {i}"} for i in range(1, teams + 1)])
+        for start in range(0, rows, batch):
+            connection.execute(insert(Player), [
+                {"name": f"Player number {i}", "team_id": (i % teams) + 1}
+                for i in range(start, min(start + batch, rows))
+            ])
+    return engine
+
+def run_export(engine, format, gzip):
+    columns, statement = EXPORTS["players"]
+    chunks = stream_rows(engine, statement(), columns, format)
+    if gzip:
+        chunks = gzip_stream(chunks)
+
+    size = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for chunk in chunks:
+        size += len(chunk)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, size
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="ndjson")
+    parser.add_argument("--gzip", action="store_true")
+    args = parser.parse_args()
+
+    print(f"players export, {args.format}{' + gzip' if args.gzip else ''}")
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            engine = build_database(os.path.join(directory, f"export_{rows}.db"), rows)
+            elapsed, peak, size = run_export(engine, args.format, args.gzip)
+            engine.dispose()
+            print(f"{rows:>10} rows   {rows / elapsed:10.0f} rows/s   peak memory {peak / 1024 / 1024:7.2f} MiB   "
+                  f"output {size / 1024 / 1024:8.2f} MiB")
@@ -0,0 +1,50 @@
+# Benchmark of the encode throughput of a players list: the previous path (ORM objects,
+# Player.to_dict, stdlib json / Flask jsonify) against the compiled schema of
+# src/serializers.py encoding row tuples. No database is needed, rows are built in memory.
+#
+# Usage: python benchmarks/bench_serialization.py [--rows 10000] [--repeat 20]
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from src.models import Player, Team
+from src import serializers
+
+def build_rows(count, teams=20):
+    team_objects = [Team(id=i, name=f"Team {i}") for i in range(1, teams + 1)]
+    team_names = {team.id: team.name for team in team_objects}
+    players = [Player(id=i, name=f"Player number {i}", team_id=(i % teams) + 1, team=team_objects[i % teams])
+               for i in range(1, count + 1)]
+    rows = [(player.id, player.name, player.team_id) for player in players]
+    return players, rows, team_names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    players, rows, team_names = build_rows(args.rows)
+    app = Flask(__name__)
+
+    def previous_cache_write():
+        return json.dumps([player.to_dict() for player in players])
+
+    def previous_response():
+        with app.app_context():
+            return jsonify({"data": [player.to_dict() for player in players], "source": "database"}).get_data()
+
+    def compiled_encode():
+        return serializers.envelope(serializers.PLAYER.encode(rows, team=team_names), "database")
+
+    print(f"{args.rows} players, best of {args.repeat}, encoder: {'orjson' if serializers.orjson else 'json'}")
+    for name, function in [("to_dict + json.dumps", previous_cache_write),
+                           ("to_dict + jsonify", previous_response),
+                           ("compiled schema", compiled_encode)]:
+        best = min(timeit.repeat(function, number=1, repeat=args.repeat))
+        print(f"{name:<22} {best * 1000:8.2f} ms   {args.rows / best:12.0f} rows/s")
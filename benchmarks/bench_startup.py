@@ -0,0 +1,47 @@
+# Benchmark of the import time of the app package and the startup time of a worker
+# (import + create_app), each sample runs in a fresh interpreter like a new worker does.
+#
+# Usage: python benchmarks/bench_startup.py [--runs 20]
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import src
+print(time.perf_counter() - start)
+"""
+
+STARTUP_SNIPPET = """
+import time
+start = time.perf_counter()
+from src import create_app
+create_app()
+print(time.perf_counter() - start)
+"""
+
+def sample(snippet, runs):
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", snippet], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+def report(name, timings):
+    print(f"{name:<10} median {statistics.median(timings) * 1000:8.2f} ms   "
+          f"min {min(timings) * 1000:8.2f} ms   max {max(timings) * 1000:8.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    report("import", sample(IMPORT_SNIPPET, args.runs))
+    report("startup", sample(STARTUP_SNIPPET, args.runs))
@@ -0,0 +1,85 @@
+# Benchmark of the gunicorn worker models. For every model it starts gunicorn with the
+# shipped gunicorn.conf.py, hammers one endpoint with concurrent keep-alive clients and
+# reports throughput and latency percentiles.
+#
+# Usage: python benchmarks/bench_workers.py [--modes sync gthread gevent] [--path /api/players]
+#                                           [--clients 64] [--duration 10] [--workers 2]
+import argparse
+import http.client
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+def client(port, path, stop_at, latencies, errors):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    while time.monotonic() < stop_at:
+        start = time.perf_counter()
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append(None)
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+def run_mode(mode, args):
+    env = dict(os.environ, GUNICORN_WORKER_CLASS=mode, APP_PORT=str(args.port),
+               GUNICORN_WORKERS=str(args.workers))
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app"], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(args.port)
+        latencies, errors = [], []
+        stop_at = time.monotonic() + args.duration
+        threads = [threading.Thread(target=client, args=(args.port, args.path, stop_at, latencies, errors))
+                   for _ in range(args.clients)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000 if latencies else 0
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0
+    print(f"{mode:<8} {len(latencies) / args.duration:10.1f} req/s   p50 {p50:8.2f} ms   "
+          f"p99 {p99:8.2f} ms   errors {len(errors)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", nargs="+", default=["sync", "gthread", "gevent"])
+    parser.add_argument("--path", default="/api/players")
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients, {args.workers} workers, GET {args.path}, {args.duration:.0f}s per mode")
+    for mode in args.modes:
+        run_mode(mode, args)
@@ -0,0 +1,55 @@
+# Gunicorn configuration, loaded automatically from the working directory.
+# Every setting can be overridden with the environment variables below.
+import multiprocessing
+import os
+
+# Worker model: sync (one request per worker), gthread (a thread pool per worker)
+# or gevent (greenlets, thousands of concurrent connections per worker)
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+_worker_model = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+if _worker_model not in WORKER_CLASSES:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be one of {', '.join(WORKER_CLASSES)}")
+
+# gevent has to patch the standard library before the app (and its locks) is imported
+if _worker_model == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+_cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.getenv('APP_PORT', '5000')}"
+worker_class = _worker_model
+
+# Workers: one per core for gevent (a single worker multiplexes its connections),
+# 2 x cores + 1 for the blocking models
+workers = int(os.getenv("GUNICORN_WORKERS", _cpus if _worker_model == "gevent" else _cpus * 2 + 1))
+
+# Threads per worker, only used by gthread
+threads = int(os.getenv("GUNICORN_THREADS", _cpus * 2 if _worker_model == "gthread" else 1))
+
+# Concurrent greenlets per worker, only used by gevent
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Recycling workers after a number of requests to bound memory growth, the jitter keeps
+# them from restarting all at once
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 100))
+
+# Importing the app once in the master so workers boot faster and share memory. src/db.py
+# and src/cache.py drop the connections a worker inherits (os.register_at_fork)
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Sizing the database pool to the concurrency of one worker, so threads or greenlets wait
+# on the pool instead of opening connections past what MySQL allows
+if _worker_model == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+elif _worker_model == "gevent":
+    os.environ.setdefault("DB_POOL_SIZE", "10")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "20")
+else:
+    os.environ.setdefault("DB_POOL_SIZE", "1")
+    os.environ.setdefault("DB_MAX_OVERFLOW", "2")
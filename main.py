@@ -1,9 +1,6 @@
 from src import create_app
-from dotenv import load_dotenv
 import os
 
-load_dotenv()
-
 app = create_app()
 
 debug = os.getenv('DEBUG') or True
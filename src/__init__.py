@@ -1,16 +1,30 @@
-from flask import Flask
+from flask import Flask, url_for
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 from .routes.auth import auth
 from .routes.teams import teams
 from .routes.players import players
+from .routes.export import export
+from .routes.imports import imports
+from .routes.leaderboards import leaderboards as leaderboards_routes # src.leaderboards is the module
+from .routes.batch import batch
+from .db import init_db, create_schema, session
+from .cache import init_cache
+from .sharding import init_sharding
+from .purge import init_purge
+from .tracing import init_tracing
+from .ratelimit import init_rate_limits
+from .idempotency import init_idempotency
+from .admission import init_admission
+from .jobs import enqueue_populate, get_job
+from .readiness import init_readiness
 import os
 
-# Loading environment variables
-load_dotenv()
-
 # Function to create the app with all the configurations
 def create_app():
+    # Loading environment variables
+    load_dotenv()
+
     app = Flask(__name__)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
@@ -19,6 +33,42 @@ def create_app():
     # Initialize JWT Manager
     jwt = JWTManager(app)
 
+    # Initialize database and cache clients, connections are opened lazily on first use
+    init_db()
+    init_cache()
+
+    # Routing players to the shards of SHARD_URLS, when it is set
+    router = init_sharding(init_db())
+
+    # Mirroring cache invalidations to the nginx micro-cache, when PROXY_PURGE_URL is set
+    init_purge(app)
+
+    # Giving the session of each request back to the pool once the request ends
+    @app.teardown_appcontext
+    def remove_session(exception=None):
+        session.remove()
+
+    # Rate limiting per client first (cheap rejections), then replaying the responses of
+    # retried writes (Idempotency-Key), then per-worker admission control
+    init_rate_limits(app)
+    init_idempotency(app)
+    init_admission(app)
+
+    # Probes of the readiness check, built once .env is loaded
+    readiness = init_readiness(app)
+
+    # Command applying the pending migrations: flask --app main migrate
+    # (python -m src.migrate up|down|status for the full migrations CLI)
+    @app.cli.command('migrate')
+    def migrate():
+        for version in create_schema():
+            print(f'Applied {version}')
+        if router is not None:
+            for shard, versions in router.create_schema().items():
+                for version in versions:
+                    print(f'Applied {version} on shard {shard}')
+        print('Database schema is up to date')
+
     # health check route
     @app.route('/health', methods=['GET'])
     def health_check():
@@ -26,17 +76,61 @@ def create_app():
             return {'status': 'healthy'}, 200
         except Exception as e:
             return {'status': 'unhealthy', 'error': str(e)}, 500
-        
-    @app.route('/populate', methods=['GET'])
+
+    # Readiness check route, 503 while the database or Redis is unusable so the worker is
+    # taken out of rotation. Probe results are cached for a short interval
+    @app.route('/ready', methods=['GET'])
+    def readiness_check():
+        try:
+            ready, checks = readiness.check()
+            return {'status': 'ready' if ready else 'not ready', 'checks': checks}, 200 if ready else 503
+        except Exception as e:
+            return {'status': 'not ready', 'error': str(e)}, 503
+
+    # Enqueuing the import of the data files, it runs in the job worker
+    @app.route('/populate', methods=['GET', 'POST'])
     def populate():
-        from .populatedb import import_players, import_teams
-        import_teams('teams.json')
-        import_players('players.json')
-        return {'status': 'database populated'}, 200
+        try:
+            job = enqueue_populate('teams.json', 'players.json')
+            job['status_url'] = url_for('job_status', job_id=job['id'])
+            return job, 202
+        except Exception as e:
+            return {'Error': 'An Error occurred while enqueuing the import', 'message': str(e)}, 500
+
+    # Progress of a background job
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def job_status(job_id):
+        try:
+            job = get_job(job_id)
+            if job is None:
+                return {'message': 'Job Not Found'}, 404
+            return job, 200
+        except Exception as e:
+            return {'Error': 'An Error occurred while fetching the job', 'message': str(e)}, 500
     
     # Importing routes from routes folder
     app.register_blueprint(auth, url_prefix='/')
     app.register_blueprint(teams, url_prefix='/api')
     app.register_blueprint(players, url_prefix='/api')
+    app.register_blueprint(export, url_prefix='/api')
+    app.register_blueprint(imports, url_prefix='/api')
+    app.register_blueprint(leaderboards_routes, url_prefix='/api')
+    app.register_blueprint(batch, url_prefix='/api')
+
+    # Refreshing hot cached views in a background thread of each worker, started on the
+    # first request so it never runs in a preloading master. The refresher can run as a
+    # sidecar process instead (python -m src.refresher)
+    if os.getenv('CACHE_REFRESHER') == 'thread':
+        from .refresher import ensure_refresher_started
+        app.before_request(ensure_refresher_started)
+
+    # Running queued jobs in a background thread of each worker, the job worker can run
+    # as a sidecar process instead (python -m src.jobs)
+    if os.getenv('JOBS_WORKER') == 'thread':
+        from .jobs import ensure_worker_started
+        app.before_request(ensure_worker_started)
+
+    # Tracing sampled requests when TRACE_EXPORTER is set, once every route is registered
+    init_tracing(app)
 
     return app
@@ -0,0 +1,66 @@
+import os
+import threading
+import time
+from flask import g, request, jsonify
+
+# Routes that must answer even when the worker is saturated
+EXEMPT_ENDPOINTS = {"health_check", "readiness_check", "static"}
+
+# Per-worker admission control. A worker admits at most as many requests as its database
+# pool can serve at once, the others wait for a slot up to a budget and are shed with a
+# 503 past it, instead of queueing until nginx times out
+class AdmissionController:
+    def __init__(self, max_in_flight, wait_budget):
+        self.max_in_flight = max_in_flight
+        self.wait_budget = wait_budget
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+    def admit(self):
+        if request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        if not self._slots.acquire(timeout=self.wait_budget):
+            return overloaded()
+        g.admitted = True
+        return None
+
+    # Taking more slots for an admitted request doing the work of several (e.g. a batch), at
+    # most all the slots of the worker. Returns False if they were not free within the wait
+    # budget, the slots taken so far are given back
+    def admit_extra(self, count):
+        if not g.get("admitted", False):
+            return True
+        count = min(count, self.max_in_flight - 1)
+        deadline = time.monotonic() + self.wait_budget
+        taken = 0
+        while taken < count:
+            if not self._slots.acquire(timeout=max(0, deadline - time.monotonic())):
+                for _ in range(taken):
+                    self._slots.release()
+                return False
+            taken += 1
+        g.admitted_extra = g.get("admitted_extra", 0) + taken
+        return True
+
+    def release(self, exception=None):
+        for _ in range(g.pop("admitted_extra", 0)):
+            self._slots.release()
+        if g.pop("admitted", False):
+            self._slots.release()
+
+# Response of a request shed by admission control
+def overloaded():
+    response = jsonify({ "message": "Service Unavailable: server is overloaded, retry later" })
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+# Function to enable admission control on the app, sized to the database pool by default
+def init_admission(app):
+    pool_capacity = int(os.getenv("DB_POOL_SIZE", 5)) + int(os.getenv("DB_MAX_OVERFLOW", 10))
+    controller = AdmissionController(
+        max_in_flight=int(os.getenv("ADMISSION_MAX_IN_FLIGHT", pool_capacity)),
+        wait_budget=float(os.getenv("ADMISSION_WAIT_BUDGET", 1.0)),
+    )
+    app.before_request(controller.admit)
+    app.teardown_request(controller.release)
+    app.extensions["admission"] = controller
+    return controller
@@ -0,0 +1,2 @@
+# Async (ASGI) serving mode: the read routes and player creation served by an asyncio app
+# over SQLAlchemy's async engine and redis.asyncio, run with: uvicorn src.aio.app:app
@@ -0,0 +1,271 @@
+import asyncio
+import re
+from urllib.parse import parse_qsl
+from sqlalchemy import select, insert, exists, literal, func
+from ..models import Player, Team
+from ..cache import PLAYERS_KEY, TEAMS_KEY, TEAMS_AND_PLAYERS_KEY, PLAYERS_TAG, TEAMS_TAG, team_tag, view_options, player_key, team_key
+from ..counts import TABLES, wants_total
+from ..directory import team_directory
+from ..purge import init_purge
+from ..sharding import shard_urls
+from ..concurrency import etag, etag_matches
+from ..serializers import PLAYER, TEAM, dumps, loads, envelope, parse_ids, encode_entities
+from ..routes.players import load_players_by_id
+from ..routes.teams import build_rosters, load_teams_by_id
+from . import db as aio_db, cache as aio_cache
+
+# ASGI app serving the public read routes and player creation with the same URLs and
+# responses as the Flask app. A request waiting on MySQL or Redis only holds a coroutine,
+# so one process keeps thousands of slow clients in flight. Run with:
+#   uvicorn src.aio.app:app --host 0.0.0.0 --port 5000
+# It is a separate, limited surface: none of the hooks of the Flask app run here (rate
+# limits, admission control, idempotency keys, tracing), writes other than player creation
+# and routes other than those of ROUTES stay on the Flask app
+
+# Minimal request: headers (lowercase names) and the whole body
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {name.decode().lower(): value.decode() for name, value in scope["headers"]}
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode()))
+        self.body = body
+
+    def json(self):
+        try:
+            return loads(self.body) if self.body else None
+        except ValueError:
+            return None
+
+# Function returning the team directory at the current teams version, the database is only
+# used when the teams changed since it was loaded
+async def team_names(db, version):
+    names = team_directory.loaded(version)
+    if names is None:
+        names = await db.run_sync(team_directory.names, version)
+    return names
+
+# Loaders of the cached views, the Redis version read and the database query are independent
+# and run concurrently
+async def load_players(db):
+    version, result = await asyncio.gather(
+        aio_cache.get_version(TEAMS_TAG),
+        db.execute(select(Player.id, Player.name, Player.team_id).order_by(Player.id)),
+    )
+    return PLAYER.to_list(result.all(), team=await team_names(db, version))
+
+async def load_teams(db):
+    result = await db.execute(select(Team.id, Team.name).order_by(Team.id))
+    return TEAM.to_list(result.all())
+
+async def load_teams_and_players(db):
+    version, result = await asyncio.gather(
+        aio_cache.get_version(TEAMS_TAG),
+        db.execute(select(Player.id, Player.name, Player.team_id).order_by(Player.id)),
+    )
+    return build_rosters(await team_names(db, version), result.all())
+
+VIEWS = {
+    PLAYERS_KEY: load_players,
+    TEAMS_KEY: load_teams,
+    TEAMS_AND_PLAYERS_KEY: load_teams_and_players,
+}
+
+# Function serving a cached view, recomputing and caching it on a miss
+async def cached_view(key, error, total=None):
+    try:
+        data = await aio_cache.get_cached(key)
+        if data is not None:
+            return 200, envelope(data, "cache", total), {}
+
+        async with aio_db.Session() as db:
+            data = dumps(await VIEWS[key](db))
+        tags, ex = view_options(key)
+        await aio_cache.set_cached(key, data, tags, ex)
+        return 200, envelope(data, "database", total), {}
+
+    except Exception as e:
+        return 500, dumps({ "Error": error, "message": str(e) }), {}
+
+# Function answering a multi-get (?ids=1,2,3) like the Flask routes, the sync loaders of the
+# routes run on the connection of the async session
+async def get_by_id(value, key, loader):
+    ids, error = parse_ids(value)
+    if error:
+        return 400, dumps({ "message": f"Bad Request: {error}" }), {}
+    async with aio_db.Session() as db:
+        entities, from_database = await aio_cache.get_entities(ids, key, lambda missing: db.run_sync(loader, missing))
+    return 200, envelope(encode_entities(ids, entities), "database" if from_database else "cache"), {}
+
+# Function returning the exact total of a resource when asked for with ?total=1
+async def collection_total(request, resource):
+    if not wants_total(request.args):
+        return None
+    async def count():
+        async with aio_db.Session() as db:
+            return await db.scalar(select(func.count()).select_from(TABLES[resource]))
+    return await aio_cache.exact_total(resource, count)
+
+async def get_players(request):
+    try:
+        if "ids" in request.args:
+            return await get_by_id(request.args["ids"], player_key, load_players_by_id)
+        total = await collection_total(request, "players")
+    except Exception as e:
+        return 500, dumps({ "Error": "An Error occurred while fetching players", "message": str(e) }), {}
+    return await cached_view(PLAYERS_KEY, "An Error occurred while fetching players", total)
+
+async def get_teams(request):
+    try:
+        if "ids" in request.args:
+            return await get_by_id(request.args["ids"], team_key, load_teams_by_id)
+        total = await collection_total(request, "teams")
+    except Exception as e:
+        return 500, dumps({ "Error": "An Error occurred while fetching teams", "message": str(e) }), {}
+    return await cached_view(TEAMS_KEY, "An Error occurred while fetching teams", total)
+
+async def get_teams_and_players(request):
+    return await cached_view(TEAMS_AND_PLAYERS_KEY, "An Error occurred while fetching teams")
+
+async def get_player(request, _id):
+    try:
+        async with aio_db.Session() as db:
+            version, result = await asyncio.gather(
+                aio_cache.get_version(TEAMS_TAG),
+                db.execute(select(Player.id, Player.name, Player.team_id, Player.version).where(Player.id == _id)),
+            )
+            player = result.first()
+            if not player:
+                return 404, dumps({ "message": "Player Not Found" }), {}
+
+            headers = { "ETag": etag(player.version) }
+            if etag_matches(request.headers.get("if-none-match", ""), player.version):
+                return 304, b"", headers
+
+            # Falling back to the database for a team missing from the directory
+            names = await team_names(db, version)
+            if player.team_id not in names:
+                names = { player.team_id: await db.scalar(select(Team.name).where(Team.id == player.team_id)) }
+
+        return 200, envelope(PLAYER.encode([player], team=names), "database"), headers
+
+    except Exception as e:
+        return 500, dumps({ "error" : "Error fetching the player", "message" : str(e) }), {}
+
+async def get_team(request, _id):
+    try:
+        async with aio_db.Session() as db:
+            team = (await db.execute(select(Team.name, Team.version).where(Team.id == _id))).first()
+        if not team:
+            return 404, dumps({ "message": "Team Not Found" }), {}
+        headers = { "ETag": etag(team.version) }
+        if etag_matches(request.headers.get("if-none-match", ""), team.version):
+            return 304, b"", headers
+        return 200, dumps({ "message": "Team Found Successfully", "Team": { 'name': team.name } }), headers
+
+    except Exception as e:
+        return 500, dumps({"Error": "An Error occurred while fetching a team", "message": str(e) }), {}
+
+async def create_player(request):
+    # Getting data form body and validating it
+    data, errors = PLAYER.validate(request.json())
+    if "is required" in errors.values():
+        return 400, dumps({ "message": "Bad Request: Player name and Team are required", "errors": errors }), {}
+    if errors:
+        return 400, dumps({ "message": "Bad Request: Invalid player data", "errors": errors }), {}
+
+    try:
+        # Inserting the player only if its team exists, the check and the insert are a single
+        # statement so the request waits on one database round trip
+        team_id = data["team_id"]
+        statement = insert(Player.__table__).from_select(
+            ["name", "team_id"],
+            select(literal(data["name"]), literal(team_id)).where(exists().where(Team.id == team_id)),
+        )
+        async with aio_db.Session() as db:
+            inserted = (await db.execute(statement)).rowcount
+            await db.commit()
+        if not inserted:
+            return 400, dumps({ "message": "Player cannot be inserted since Team does not exist"}), {}
+
+        # Clearing every cached view depending on players
+        await aio_cache.invalidate(PLAYERS_TAG, team_tag(team_id))
+        await aio_cache.adjust_count("players", 1)
+        return 200, dumps({ "message": "Player created successfully" }), {}
+
+    except Exception as e:
+        return 500, dumps({ "error": "Error inserting a new player", "message": str(e) }), {}
+
+async def health_check(request):
+    return 200, dumps({ "status": "healthy" }), {}
+
+ROUTES = [
+    ("GET", re.compile(r"^/health$"), health_check),
+    ("GET", re.compile(r"^/api/players$"), get_players),
+    ("POST", re.compile(r"^/api/players$"), create_player),
+    ("GET", re.compile(r"^/api/players/(\d+)$"), get_player),
+    ("GET", re.compile(r"^/api/teams$"), get_teams),
+    ("GET", re.compile(r"^/api/teams/players$"), get_teams_and_players),
+    ("GET", re.compile(r"^/api/teams/(\d+)$"), get_team),
+]
+
+# Routes reading or writing players, they only use the primary database so they are refused
+# while players are sharded (SHARD_URLS), the Flask app serves them through the shard router
+PLAYER_HANDLERS = {get_players, create_player, get_player, get_teams_and_players}
+
+# Function finding the handler of a request, returns (handler, path arguments, status)
+def route(method, path):
+    allowed = False
+    for route_method, pattern, handler in ROUTES:
+        match = pattern.match(path)
+        if match:
+            if route_method == method:
+                return handler, [int(value) for value in match.groups()], 200
+            allowed = True
+    return None, [], 405 if allowed else 404
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            aio_db.init_db()
+            aio_cache.init_cache()
+            init_purge()
+            await send({ "type": "lifespan.startup.complete" })
+        elif message["type"] == "lifespan.shutdown":
+            await aio_db.dispose_db()
+            await aio_cache.close_cache()
+            await send({ "type": "lifespan.shutdown.complete" })
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+
+    # Servers without lifespan support get the clients on the first request
+    aio_db.init_db()
+    aio_cache.init_cache()
+
+    handler, args, status = route(scope["method"], scope["path"])
+    if handler is None:
+        body, headers = dumps({ "message": "Not Found" if status == 404 else "Method Not Allowed" }), {}
+    elif handler in PLAYER_HANDLERS and shard_urls():
+        status, body, headers = 501, dumps({ "message": "Not Implemented: players are sharded, this route is served by the Flask app" }), {}
+    else:
+        request = Request(scope, await read_body(receive))
+        status, body, headers = await handler(request, *args)
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")] + [(name.encode(), value.encode()) for name, value in headers.items()],
+    })
+    await send({ "type": "http.response.body", "body": body })
@@ -0,0 +1,105 @@
+import os
+import redis.asyncio as redis
+from ..cache import (
+    INVALIDATE_LUA, INVALIDATED_CHANNEL, HITS_KEY, TAG_TTL, DEFAULT_TTL, ENTITY_TTL,
+    tag_key, version_key, invalidation_keys, notify_invalidated,
+)
+from ..counts import ADJUST_LUA, COUNT_TTL, count_key
+from ..serializers import dumps
+
+# asyncio counterpart of src/cache.py, same keys, tags and scripts so the sync and async
+# apps share the cache and invalidate each other
+
+# Redis client and scripts, created by init_cache() on the startup of the ASGI app
+redis_client = None
+_invalidate_script = None
+_adjust_script = None
+
+# Thousands of requests can be in flight at once, they share a bounded pool of connections
+# and wait for a free one instead of opening a connection each
+def init_cache():
+    global redis_client, _invalidate_script, _adjust_script
+    if redis_client is None:
+        pool = redis.BlockingConnectionPool.from_url(
+            os.getenv('REDIS_URL'),
+            max_connections=int(os.getenv('REDIS_MAX_CONNECTIONS', 50)),
+            timeout=float(os.getenv('REDIS_POOL_TIMEOUT', 5)),
+        )
+        redis_client = redis.Redis(connection_pool=pool)
+        _invalidate_script = redis_client.register_script(INVALIDATE_LUA)
+        _adjust_script = redis_client.register_script(ADJUST_LUA)
+    return redis_client
+
+async def close_cache():
+    global redis_client
+    if redis_client is not None:
+        await redis_client.aclose()
+        redis_client = None
+
+# Function to get the encoded JSON bytes of a cached view, returns None on a miss
+async def get_cached(key):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(key)
+    pipe.zincrby(HITS_KEY, 1, key)
+    cached_data, _ = await pipe.execute()
+    return cached_data
+
+# Function to cache a view and register its key under every dependency tag
+async def set_cached(key, data, tags, ex=DEFAULT_TTL):
+    pipe = redis_client.pipeline()
+    pipe.set(key, data if isinstance(data, bytes) else dumps(data), ex=ex)
+    for tag in tags:
+        pipe.sadd(tag_key(tag), key)
+        pipe.expire(tag_key(tag), max(ex, TAG_TTL))
+    await pipe.execute()
+
+# Function to invalidate all the cached views depending on any of the given tags
+async def invalidate(*tags):
+    if not tags:
+        return 0
+    deleted = await _invalidate_script(keys=invalidation_keys(tags), args=[INVALIDATED_CHANNEL, len(tags)])
+    notify_invalidated(tags)
+    return deleted
+
+# Function applying committed inserts or deletes to the total of a resource, if it is counted
+async def adjust_count(resource, delta):
+    if not delta:
+        return None
+    return await _adjust_script(keys=[count_key(resource)], args=[delta])
+
+# Function returning the exact total of a resource like src.counts.exact_total, count() is a
+# coroutine counting the table when the counter is missing. Returns (total, exact)
+async def exact_total(resource, count):
+    total = await redis_client.get(count_key(resource))
+    if total is not None:
+        return int(total), True
+    total = await count()
+    if not await redis_client.set(count_key(resource), total, nx=True, ex=COUNT_TTL):
+        total = int(await redis_client.get(count_key(resource)) or total)
+    return total, True
+
+# Function resolving many entities by id like src.cache.get_entities: one MGET, then the
+# misses from loader(ids), a coroutine, backfilled in one pipeline. Returns the encoded
+# entities in the order of ids (None for unknown ids) and whether the database was used
+async def get_entities(ids, key, loader, ex=ENTITY_TTL):
+    unique_ids = list(dict.fromkeys(ids))
+    found = dict(zip(unique_ids, await redis_client.mget([key(entity_id) for entity_id in unique_ids])))
+    missing = [entity_id for entity_id in unique_ids if found[entity_id] is None]
+
+    if missing:
+        loaded = await loader(missing)
+        pipe = redis_client.pipeline()
+        for entity_id, (data, tags) in loaded.items():
+            found[entity_id] = data
+            pipe.set(key(entity_id), data, ex=ex)
+            for tag in tags:
+                pipe.sadd(tag_key(tag), key(entity_id))
+                pipe.expire(tag_key(tag), max(ex, TAG_TTL))
+        await pipe.execute()
+
+    return [found[entity_id] for entity_id in ids], bool(missing)
+
+# Function to get the current version of a versioned tag
+async def get_version(tag):
+    version = await redis_client.get(version_key(tag))
+    return int(version) if version is not None else 0
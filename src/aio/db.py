@@ -0,0 +1,36 @@
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from ..db import get_db_uri, get_pool_options
+
+# Async database engine, created by init_db() on the startup of the ASGI app
+engine = None
+
+# Session factory bound to the async engine, one session per request
+Session = async_sessionmaker(expire_on_commit=False)
+
+# Async drivers of the database URLs used by the sync app
+ASYNC_DRIVERS = {
+    "mysql+pymysql": "mysql+aiomysql",
+    "mysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# Function to build the async database URI from the sync one
+def get_async_db_uri():
+    uri = get_db_uri()
+    scheme, separator, rest = uri.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{separator}{rest}"
+
+# Function to create the async engine and bind the session factory to it
+def init_db():
+    global engine
+    if engine is None:
+        uri = get_async_db_uri()
+        engine = create_async_engine(uri, **get_pool_options(uri))
+        Session.configure(bind=engine)
+    return engine
+
+async def dispose_db():
+    global engine
+    if engine is not None:
+        await engine.dispose()
+        engine = None
@@ -1,9 +1,199 @@
-import redis 
+import redis
 import os
-from dotenv import load_dotenv
+from .serializers import dumps
+from .tracing import span
 
-load_dotenv()
+# Redis connection and scripts, created by init_cache() when the app is created
+redis_client = None
+_invalidate_script = None
 
-# Setting up Redis connection
-REDIS_URL = os.getenv('REDIS_URL')
-redis_client = redis.Redis.from_url(REDIS_URL)
\ No newline at end of file
+# Default time to live (seconds) for cached views
+DEFAULT_TTL = 15
+
+# Time to live (seconds) of cached entities, they are invalidated precisely by their own tags
+ENTITY_TTL = 300
+
+# Tag sets outlive the keys they point to, so a key never loses its tag early
+TAG_TTL = 3600
+
+# Sorted set counting accesses per cache key, read by the refresher to find hot keys
+HITS_KEY = "cache:hits"
+
+# Channel where invalidated keys are announced so hot ones can be recomputed right away
+INVALIDATED_CHANNEL = "cache:invalidated"
+
+# Cache keys of the cached views
+PLAYERS_KEY = "get_players"
+TEAMS_KEY = "get_teams"
+TEAMS_AND_PLAYERS_KEY = "get_teams_and_players"
+
+# Cache keys of single entities, read and written in batches by the multi-get routes
+def player_key(player_id):
+    return f"get_player:{player_id}"
+
+def team_key(team_id):
+    return f"get_team:{team_id}"
+
+# Cache key of the roster of one team
+def team_players_key(team_id):
+    return f"get_team_players:{team_id}"
+
+# Dependency tags shared by cached views and write handlers
+PLAYERS_TAG = "players"
+TEAMS_TAG = "teams"
+
+# Bumped when teams move between shards, no cached view depends on it
+SHARDS_TAG = "shards"
+
+# Tags whose every invalidation also bumps a version counter, consumers holding data
+# outside Redis (e.g. the team directory, the shard directory) compare versions to know
+# when to reload
+VERSIONED_TAGS = (PLAYERS_TAG, TEAMS_TAG, SHARDS_TAG)
+
+def team_tag(team_id):
+    return f"team:{team_id}"
+
+def player_tag(player_id):
+    return f"player:{player_id}"
+
+def tag_key(tag):
+    return f"tag:{tag}"
+
+def version_key(tag):
+    return f"tagver:{tag}"
+
+# Registered views: cache key -> (loader, tags, ttl)
+_views = {}
+
+# Functions called with the tags of every invalidation, e.g. the proxy cache purge
+_invalidation_listeners = []
+
+# Deleting every key registered under the given tag sets, and the tag sets themselves,
+# in a single round trip, then bumping the versions and announcing the deleted keys.
+# KEYS holds ARGV[2] tag sets followed by the version counters to bump
+INVALIDATE_LUA = """
+local tag_count = tonumber(ARGV[2])
+local tags = {unpack(KEYS, 1, tag_count)}
+local keys = redis.call('SUNION', unpack(tags))
+for i = 1, #keys, 500 do
+    redis.call('DEL', unpack(keys, i, math.min(i + 499, #keys)))
+end
+redis.call('DEL', unpack(tags))
+for i = tag_count + 1, #KEYS do
+    redis.call('INCR', KEYS[i])
+end
+if #keys > 0 then
+    redis.call('PUBLISH', ARGV[1], cjson.encode(keys))
+end
+return #keys
+"""
+
+# Function to set up the Redis client, no connection is opened until the first command
+def init_cache():
+    global redis_client, _invalidate_script
+    if redis_client is None:
+        redis_client = redis.Redis.from_url(os.getenv('REDIS_URL'))
+        _invalidate_script = redis_client.register_script(INVALIDATE_LUA)
+    return redis_client
+
+def get_redis():
+    return init_cache()
+
+# Dropping the connections inherited from the parent process after a fork
+def reset_after_fork():
+    if redis_client is not None:
+        redis_client.connection_pool.reset()
+
+os.register_at_fork(after_in_child=reset_after_fork)
+
+# Decorator to register the loader of a cached view, the loader receives a database session
+def cached_view(key, tags, ex=DEFAULT_TTL):
+    def decorator(loader):
+        _views[key] = (loader, tags, ex)
+        return loader
+    return decorator
+
+def registered_views():
+    return list(_views)
+
+# Function returning the (tags, ttl) a registered view is cached with
+def view_options(key):
+    _, tags, ex = _views[key]
+    return tags, ex
+
+# Function to recompute a registered view from the database and cache it, returns the
+# encoded JSON bytes
+def load_view(key, db):
+    loader, tags, ex = _views[key]
+    with span("view.load", key=key):
+        view = loader(db)
+    with span("json.encode", key=key):
+        data = dumps(view)
+    set_cached(key, data, tags, ex)
+    return data
+
+# Function to get the encoded JSON bytes of a cached view, returns None on a miss. Every
+# access is counted in the same round trip so the refresher knows which keys are hot
+def get_cached(key):
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.get(key)
+    pipe.zincrby(HITS_KEY, 1, key)
+    cached_data, _ = pipe.execute()
+    return cached_data
+
+# Function to cache a view (an object or encoded JSON bytes) and register its key under
+# every dependency tag
+def set_cached(key, data, tags, ex=DEFAULT_TTL):
+    pipe = redis_client.pipeline()
+    pipe.set(key, data if isinstance(data, bytes) else dumps(data), ex=ex)
+    for tag in tags:
+        pipe.sadd(tag_key(tag), key)
+        pipe.expire(tag_key(tag), max(ex, TAG_TTL))
+    pipe.execute()
+
+def on_invalidate(listener):
+    if listener not in _invalidation_listeners:
+        _invalidation_listeners.append(listener)
+
+def notify_invalidated(tags):
+    for listener in _invalidation_listeners:
+        listener(tags)
+
+# KEYS of the invalidation script: the tag sets, then the versions to bump
+def invalidation_keys(tags):
+    return [tag_key(tag) for tag in tags] + [version_key(tag) for tag in tags if tag in VERSIONED_TAGS]
+
+# Function to invalidate all the cached views depending on any of the given tags
+def invalidate(*tags):
+    if not tags:
+        return 0
+    deleted = _invalidate_script(keys=invalidation_keys(tags), args=[INVALIDATED_CHANNEL, len(tags)])
+    notify_invalidated(tags)
+    return deleted
+
+# Function to get the current version of a versioned tag
+def get_version(tag):
+    version = redis_client.get(version_key(tag))
+    return int(version) if version is not None else 0
+
+# Function resolving many entities by id from the cache, then loading the misses and caching
+# them. One MGET reads every entry and one pipeline backfills the misses. loader(ids)
+# returns id -> (encoded JSON bytes, tags) for the ids it found. Returns the encoded
+# entities in the order of ids (None for unknown ids) and whether the database was used
+def get_entities(ids, key, loader, ex=ENTITY_TTL):
+    unique_ids = list(dict.fromkeys(ids))
+    found = dict(zip(unique_ids, redis_client.mget([key(entity_id) for entity_id in unique_ids])))
+    missing = [entity_id for entity_id in unique_ids if found[entity_id] is None]
+
+    if missing:
+        loaded = loader(missing)
+        pipe = redis_client.pipeline()
+        for entity_id, (data, tags) in loaded.items():
+            found[entity_id] = data
+            pipe.set(key(entity_id), data, ex=ex)
+            for tag in tags:
+                pipe.sadd(tag_key(tag), key(entity_id))
+                pipe.expire(tag_key(tag), max(ex, TAG_TTL))
+        pipe.execute()
+
+    return [found[entity_id] for entity_id in ids], bool(missing)
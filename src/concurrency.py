@@ -0,0 +1,30 @@
+from flask import request
+
+# Optimistic concurrency: players and teams carry a version, incremented by every update.
+# Responses expose it as the ETag and writes sent with If-Match only apply to that version
+
+# Function building the ETag of a version
+def etag(version):
+    return f'"{version}"'
+
+# Function returning the version required by the If-Match header, None when absent or "*".
+# A value that is not one of our ETags can never match, it gives -1
+def if_match_version():
+    value = request.headers.get("If-Match", "").strip()
+    if not value or value == "*":
+        return None
+    value = value.split(",")[0].strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        return -1
+
+# Function telling if an If-None-Match header lists the ETag of a version
+def etag_matches(header, version):
+    return etag(version) in [value.strip().removeprefix("W/") for value in header.split(",")]
+
+# Function telling if the client copy (If-None-Match) is still the current version
+def not_modified(version):
+    return etag_matches(request.headers.get("If-None-Match", ""), version)
@@ -0,0 +1,105 @@
+from flask import request
+from sqlalchemy import select, func, text
+from .cache import get_redis, set_cached, ENTITY_TTL
+from .serializers import dumps, loads
+from .models import Player, Team
+from . import sharding
+
+# Totals of the collections. A COUNT(*) on a large InnoDB table scans an index, so totals come
+# from Redis instead:
+#   count:{resource}                    exact counter, adjusted by every write once it exists
+#   count:{resource}:{column}={value}   filtered total, exact or estimated from the index
+#                                       statistics, cleared with the tags of the filter
+
+# Counted resources
+TABLES = {
+    "players": Player.__table__,
+    "teams": Team.__table__,
+}
+
+# An exact counter is recounted after this long, bounding the drift a lost adjustment causes
+COUNT_TTL = 3600
+
+# Filtered totals estimated above this many rows are not counted, the estimate is returned
+EXACT_COUNT_LIMIT = 10000
+
+# Adjusting a counter only if it exists, a missing counter is counted from the table on its
+# next read rather than starting from a wrong value
+ADJUST_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+"""
+
+_adjust_script = None
+
+def count_key(resource, column=None, value=None):
+    if column is None:
+        return f"count:{resource}"
+    return f"count:{resource}:{column}={value}"
+
+# Function applying committed inserts (delta > 0) or deletes (delta < 0) to a counter
+def adjust(resource, delta):
+    global _adjust_script
+    if not delta:
+        return None
+    if _adjust_script is None:
+        _adjust_script = get_redis().register_script(ADJUST_LUA)
+    return _adjust_script(keys=[count_key(resource)], args=[delta])
+
+# Function returning the exact total of a resource, counted from the table only when the
+# counter is missing. Returns (total, exact)
+def exact_total(db, resource):
+    redis_client = get_redis()
+    total = redis_client.get(count_key(resource))
+    if total is not None:
+        return int(total), True
+
+    if resource == "players" and sharding.router is not None:
+        total = sharding.router.count_players()
+    else:
+        total = db.execute(select(func.count()).select_from(TABLES[resource])).scalar()
+    # Another request may have counted and adjusted it in the meantime, its value wins
+    if not redis_client.set(count_key(resource), total, nx=True, ex=COUNT_TTL):
+        total = int(redis_client.get(count_key(resource)) or total)
+    return total, True
+
+# Function returning the total of a resource filtered on an indexed column, cached per value
+# under the given tags: the writes changing the filtered rows invalidate it. Filters matching
+# few rows are counted through the index, larger ones are estimated from the statistics of
+# the database. Returns (total, exact)
+def filtered_total(db, resource, column, value, tags):
+    key = count_key(resource, column, value)
+    cached = get_redis().get(key)
+    if cached is not None:
+        total, exact = loads(cached)
+        return total, exact
+
+    table = TABLES[resource]
+    if resource == "players" and column == "team_id" and sharding.router is not None:
+        total, exact = sharding.router.count_players_of_team(value), True
+    else:
+        total, exact = estimate_rows(db, table, column, value), False
+        if total is None or total <= EXACT_COUNT_LIMIT:
+            total = db.execute(select(func.count()).select_from(table).where(table.c[column] == value)).scalar()
+            exact = True
+    set_cached(key, dumps([total, exact]), tags, ENTITY_TTL)
+    return total, exact
+
+# Function estimating the rows matching a value of an indexed column without reading them:
+# MySQL plans the lookup with a dive into the index for that value and reports the rows it
+# expects. None if the database has no such estimate (e.g. SQLite)
+def estimate_rows(db, table, column, value):
+    if db.get_bind().dialect.name != "mysql":
+        return None
+    plan = db.execute(
+        text(f"EXPLAIN SELECT COUNT(*) FROM {table.name} WHERE {table.c[column].name} = :value"),
+        {"value": value},
+    ).mappings().first()
+    return int(plan["rows"]) if plan is not None and plan["rows"] is not None else None
+
+# Totals are only computed when asked for with ?total=1, args default to the Flask request's
+def wants_total(args=None):
+    args = request.args if args is None else args
+    return args.get("total", "").lower() in ("1", "true", "yes")
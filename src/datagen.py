@@ -0,0 +1,153 @@
+import argparse
+import bisect
+import csv
+import itertools
+import os
+import random
+import string
+import time
+from .serializers import dumps
+
+# Deterministic synthetic datasets for scale testing. The same seed and shape always give
+# the same files. Rows are generated one at a time and written as they come, so datasets of
+# tens of millions of players never sit in memory.
+#
+# Formats, all accepted by the importers:
+#   json   teams.json and players.json for /populate (players reference team ids 1..n, the
+#          ids the teams get when imported into an empty database)
+#   csv    players.csv for /api/import/players (name,team, teams referenced by name)
+#   ndjson players.ndjson for /api/import/players ({"name": ..., "team": ...} per line)
+
+FORMATS = ("json", "csv", "ndjson")
+DISTRIBUTIONS = ("uniform", "zipf")
+
+SYLLABLES = ["ba", "ce", "di", "fo", "gu", "ka", "le", "mi", "no", "pu", "ra", "se", "ti", "vo", "za", "lo", "ne", "ri"]
+
+# Function building a name of the given length, unique through its index (base 36 suffix)
+def make_name(rng, index, length):
+    suffix = " " + _base36(index)
+    letters = max(1, length - len(suffix))
+    body = "".join(rng.choice(SYLLABLES) for _ in range(letters // 2 + 1))[:letters]
+    return body.capitalize() + suffix
+
+def _base36(number):
+    digits = string.digits + string.ascii_uppercase
+    text = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+        if number == 0:
+            return text
+
+# Function returning the cumulative weights of the teams. With zipf the team of rank k gets a
+# share proportional to 1 / k ** skew, ranks are shuffled so team 1 is not always the largest
+def team_weights(rng, teams, distribution="zipf", skew=1.1):
+    if distribution == "uniform":
+        weights = [1.0] * teams
+    else:
+        weights = [1.0 / (rank ** skew) for rank in range(1, teams + 1)]
+        rng.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+# Generator of team names
+def generate_teams(seed, teams, name_length=(8, 24)):
+    rng = random.Random(f"{seed}:teams")
+    for index in range(teams):
+        yield make_name(rng, index, rng.randint(*name_length))
+
+# Generator of (name, team index) players, team indexes start at 0
+def generate_players(seed, teams, players, distribution="zipf", skew=1.1, name_length=(8, 24)):
+    rng = random.Random(f"{seed}:players")
+    cumulative = team_weights(random.Random(f"{seed}:weights"), teams, distribution, skew)
+    total = cumulative[-1]
+    for index in range(players):
+        team = bisect.bisect_left(cumulative, rng.random() * total)
+        yield make_name(rng, index, rng.randint(*name_length)), min(team, teams - 1)
+
+# Streaming writer of a JSON array, one object per line
+class JsonArrayWriter:
+    def __init__(self, f):
+        self.f = f
+        self.first = True
+        f.write("[\n")
+
+    def write(self, row):
+        if not self.first:
+            self.f.write(",\n")
+        self.f.write(dumps(row).decode())
+        self.first = False
+
+    def close(self):
+        self.f.write("\n]\n")
+
+# Function writing a dataset to output_dir in the given formats, returns the written paths
+def generate(output_dir, teams=20, players=1000, distribution="zipf", skew=1.1,
+             name_length=(8, 24), seed=0, formats=FORMATS):
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"distribution must be one of {', '.join(DISTRIBUTIONS)}")
+    if teams < 1:
+        raise ValueError("at least one team is needed")
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"unknown formats: {', '.join(sorted(unknown))}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+
+    # Team names are needed for every player row, they are the only thing kept in memory
+    team_names = list(generate_teams(seed, teams, name_length))
+    if "json" in formats:
+        path = os.path.join(output_dir, "teams.json")
+        with open(path, "w", encoding="utf-8") as f:
+            writer = JsonArrayWriter(f)
+            for name in team_names:
+                writer.write({"name": name})
+            writer.close()
+        paths.append(path)
+
+    files = {}
+    try:
+        for format in formats:
+            path = os.path.join(output_dir, f"players.{format}")
+            files[format] = open(path, "w", encoding="utf-8", newline="")
+            paths.append(path)
+        json_writer = JsonArrayWriter(files["json"]) if "json" in files else None
+        csv_writer = csv.writer(files["csv"]) if "csv" in files else None
+        if csv_writer:
+            csv_writer.writerow(["name", "team"])
+
+        for name, team in generate_players(seed, teams, players, distribution, skew, name_length):
+            if json_writer:
+                json_writer.write({"name": name, "team_id": team + 1})
+            if csv_writer:
+                csv_writer.writerow([name, team_names[team]])
+            if "ndjson" in files:
+                files["ndjson"].write(dumps({"name": name, "team": team_names[team]}).decode() + "\n")
+
+        if json_writer:
+            json_writer.close()
+    finally:
+        for f in files.values():
+            f.close()
+    return paths
+
+# Generating a dataset: python -m src.datagen --teams 1000 --players 10000000 --output src/data/generated
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m src.datagen")
+    parser.add_argument("--teams", type=int, default=20)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="zipf", help="players per team")
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent, higher is more skewed")
+    parser.add_argument("--name-length", type=int, nargs=2, default=[8, 24], metavar=("MIN", "MAX"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", nargs="+", choices=FORMATS, default=list(FORMATS), dest="formats")
+    parser.add_argument("--output", default="src/data/generated")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = generate(args.output, args.teams, args.players, args.distribution, args.skew,
+                     tuple(args.name_length), args.seed, args.formats)
+    elapsed = time.perf_counter() - start
+    for path in paths:
+        print(f"{path}  {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+    print(f"{args.players} players in {args.teams} teams in {elapsed:.1f} s")
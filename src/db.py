@@ -1,27 +1,70 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
-from .models import Base
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker, scoped_session
 import os
 
-# loading environment variables
-load_dotenv()
+# Database engine, created by init_db() when the app is created
+engine = None
 
-# Creating database engine URI
-_username = os.getenv("MYSQL_USER")
-_password = os.getenv("MYSQL_PASSWORD")
-_db = os.getenv("MYSQL_DATABASE")
-_host = os.getenv("MYSQL_HOST")
-_port = os.getenv("MYSQL_PORT")
+# Creating session factory, it gets bound to the engine by init_db()
+Session = sessionmaker()
 
-DB_URI = f"mysql+pymysql://{_username}:{_password}@{_host}:{_port}/{_db}"
+# Session used by the routes, one per thread (or greenlet under gevent) so gthread and
+# gevent workers never share a session, removed at the end of every request
+session = scoped_session(Session)
 
-# Creating database engine
-engine = create_engine(DB_URI)
+# Function to build the database engine URI from environment variables
+def get_db_uri():
+    # A full URL takes precedence (e.g. sqlite:///local.db for local runs)
+    if os.getenv("DATABASE_URL"):
+        return os.getenv("DATABASE_URL")
 
-# Creating tables from model
-Base.metadata.create_all(engine)
+    _username = os.getenv("MYSQL_USER")
+    _password = os.getenv("MYSQL_PASSWORD")
+    _db = os.getenv("MYSQL_DATABASE")
+    _host = os.getenv("MYSQL_HOST")
+    _port = os.getenv("MYSQL_PORT")
 
-# Creating session
-Session = sessionmaker(bind=engine)
-session = Session()
\ No newline at end of file
+    return f"mysql+pymysql://{_username}:{_password}@{_host}:{_port}/{_db}"
+
+# Connection pool settings, the pool should hold one connection per worker thread
+def get_pool_options(uri):
+    if uri.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", 5)),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", 10)),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 3600)),
+        "pool_pre_ping": True,
+    }
+
+# SQLite only enforces foreign keys (and their ON DELETE actions) when asked on every connection
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+# Function to create the database engine and bind the session to it, no connection is opened here
+def init_db():
+    global engine
+    if engine is None:
+        uri = get_db_uri()
+        engine = create_engine(uri, **get_pool_options(uri))
+        if uri.startswith("sqlite"):
+            event.listen(engine, "connect", enable_sqlite_foreign_keys)
+        Session.configure(bind=engine)
+    return engine
+
+# Function bringing the database schema up to date, run through the migrate command
+def create_schema():
+    from .migrate import upgrade
+    return upgrade(init_db())
+
+# Dropping the connections inherited from the parent process, a forked worker must
+# never share sockets with its parent or siblings
+def dispose_after_fork():
+    if engine is not None:
+        session.remove()
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=dispose_after_fork)
@@ -0,0 +1,41 @@
+from .models import Team
+from .cache import get_version, TEAMS_TAG
+
+# Per-worker directory of teams (id -> name). Teams rarely change, so the mapping is
+# loaded once and only reloaded when the version of the teams tag moves, which every
+# team write bumps through the cache invalidation
+class TeamDirectory:
+    def __init__(self):
+        # (version, names) swapped as a whole so threads never see a half built mapping
+        self._state = (None, {})
+
+    # Function returning the id -> name mapping, reloading it if the teams changed. The
+    # version can be passed by callers that already read it (e.g. the async app)
+    def names(self, db, version=None):
+        if version is None:
+            version = get_version(TEAMS_TAG)
+        loaded_version, names = self._state
+        if version != loaded_version:
+            names = {team_id: name for team_id, name in db.query(Team.id, Team.name).order_by(Team.id)}
+            self._state = (version, names)
+        return names
+
+    # Function returning the mapping if it is loaded at the given version, None otherwise
+    def loaded(self, version):
+        loaded_version, names = self._state
+        return names if version == loaded_version else None
+
+    # Function to get the name of a team, None if the team does not exist
+    def name(self, team_id, db):
+        name = self.names(db).get(team_id)
+        if name is None and team_id is not None:
+            # Not in the directory, checking the database in case the version bump was lost
+            team = db.query(Team.name).filter_by(id=team_id).first()
+            name = team.name if team else None
+        return name
+
+    # Function to check if a team exists
+    def exists(self, team_id, db):
+        return self.name(team_id, db) is not None
+
+team_directory = TeamDirectory()
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import time
+from flask import g, request, jsonify, Response
+from .cache import get_redis
+from .ratelimit import client_ip, client_user
+
+# Writes sent with an Idempotency-Key header run once: the first response is stored in Redis
+# and replayed to every retry with the same key, a retry arriving while the first request is
+# still running waits for its response instead of running the write again
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Routes accepting idempotency keys, the writes clients retry on timeouts
+IDEMPOTENT_ENDPOINTS = {
+    "players.create_player",
+    "players.update_player",
+    "teams.create_team",
+    "teams.update_team",
+    "leaderboards.record_player_stats",
+}
+
+MAX_KEY_LENGTH = 255
+
+# Response headers stored with the body and replayed
+REPLAYED_HEADERS = ("ETag", "Location")
+
+# Claiming a key: a new key is marked in flight with the fingerprint of its request, an
+# existing one is returned as it is. ARGV: fingerprint, in flight TTL in seconds
+CLAIM_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('HGETALL', KEYS[1])
+end
+redis.call('HSET', KEYS[1], 'state', 'in_flight', 'fingerprint', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return nil
+"""
+
+# Storing the response of a claimed key, unless the claim expired in the meantime.
+# ARGV: TTL, then field and value pairs
+COMPLETE_LUA = """
+if redis.call('HGET', KEYS[1], 'state') ~= 'in_flight' then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', 'done', unpack(ARGV, 2))
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+class IdempotencyStore:
+    def __init__(self, ttl, in_flight_ttl, wait_budget, poll_interval=0.05):
+        self.ttl = ttl
+        self.in_flight_ttl = in_flight_ttl
+        self.wait_budget = wait_budget
+        self.poll_interval = poll_interval
+        self._claim = None
+        self._complete = None
+
+    def _scripts(self):
+        if self._claim is None:
+            self._claim = get_redis().register_script(CLAIM_LUA)
+            self._complete = get_redis().register_script(COMPLETE_LUA)
+
+    # Keys are scoped to the client, so two clients can never read each other's responses
+    def record_key(self, key):
+        client = client_user() or client_ip()
+        return f"idempotency:{client}:{request.method}:{request.path}:{key}"
+
+    # The same key sent with another request is a client bug, not a retry
+    def fingerprint(self):
+        return hashlib.sha256(request.get_data()).hexdigest()
+
+    def before_request(self):
+        key = request.headers.get(HEADER)
+        if key is None or request.endpoint not in IDEMPOTENT_ENDPOINTS:
+            return None
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return jsonify({ "message": f"Bad Request: {HEADER} must be 1 to {MAX_KEY_LENGTH} characters" }), 400
+
+        self._scripts()
+        record_key = self.record_key(key)
+        fingerprint = self.fingerprint()
+        deadline = time.monotonic() + self.wait_budget
+        while True:
+            record = self._claim(keys=[record_key], args=[fingerprint, self.in_flight_ttl])
+            if record is None:
+                g.idempotency_key = record_key
+                return None
+
+            record = dict(zip(record[::2], record[1::2]))
+            if record[b"fingerprint"].decode() != fingerprint:
+                return jsonify({ "message": f"Unprocessable Entity: {HEADER} was already used with another request" }), 422
+            if record[b"state"] == b"done":
+                return self.replay(record)
+
+            # The first request is still running, waiting for its response
+            if time.monotonic() >= deadline:
+                response = jsonify({ "message": f"Conflict: a request with this {HEADER} is still in progress" })
+                response.headers["Retry-After"] = "1"
+                return response, 409
+            time.sleep(self.poll_interval)
+
+    def replay(self, record):
+        response = Response(record[b"body"], status=int(record[b"status"]), mimetype=record[b"mimetype"].decode())
+        for header in REPLAYED_HEADERS:
+            value = record.get(header.lower().encode())
+            if value is not None:
+                response.headers[header] = value.decode()
+        response.headers[REPLAYED_HEADER] = "true"
+        return response
+
+    # Storing the response of the request holding the key. Server errors are not stored, the
+    # key is released so a retry runs the write again
+    def after_request(self, response):
+        record_key = g.pop("idempotency_key", None)
+        if record_key is None:
+            return response
+        if response.status_code >= 500 or response.is_streamed:
+            get_redis().delete(record_key)
+            return response
+
+        fields = ["status", response.status_code, "mimetype", response.mimetype, "body", response.get_data()]
+        for header in REPLAYED_HEADERS:
+            if header in response.headers:
+                fields += [header.lower(), response.headers[header]]
+        self._complete(keys=[record_key], args=[self.ttl, *fields])
+        return response
+
+    # Releasing the key of a request that failed before producing a response
+    def teardown_request(self, exception=None):
+        record_key = g.pop("idempotency_key", None)
+        if record_key is not None:
+            get_redis().delete(record_key)
+
+# Function to enable idempotency keys on the app
+def init_idempotency(app):
+    store = IdempotencyStore(
+        ttl=int(os.getenv("IDEMPOTENCY_TTL", 24 * 3600)),
+        in_flight_ttl=int(os.getenv("IDEMPOTENCY_IN_FLIGHT_TTL", 30)),
+        wait_budget=float(os.getenv("IDEMPOTENCY_WAIT_BUDGET", 5.0)),
+    )
+    app.before_request(store.before_request)
+    app.after_request(store.after_request)
+    app.teardown_request(store.teardown_request)
+    return store
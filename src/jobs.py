@@ -0,0 +1,238 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+from .cache import get_redis, invalidate, PLAYERS_TAG, TEAMS_TAG, team_tag
+from .db import Session
+from .models import PlayerStats
+from . import leaderboards, counts
+from .populatedb import DATA_DIR, load_dataset, chunks, import_teams_chunk, import_players_chunk
+
+# Redis list the job ids are queued on, consumed by the job worker
+QUEUE_KEY = "jobs:queue"
+
+# Job state is kept for a week
+JOB_TTL = 7 * 24 * 3600
+
+# A running job without progress for this long is considered dead and can be resumed
+STALE_AFTER = 60
+
+def job_key(job_id):
+    return f"job:{job_id}"
+
+def lock_key(job_id):
+    return f"job:{job_id}:lock"
+
+# The id of an import job is derived from the content of its files, so populating the
+# same dataset twice gives the same job
+def populate_job_id(teams_file, players_file):
+    digest = hashlib.sha1()
+    for json_file in (teams_file, players_file):
+        with open(os.path.join(DATA_DIR, json_file), 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return f"populate-{digest.hexdigest()[:16]}"
+
+def _decode(state):
+    return {key.decode(): value.decode() for key, value in state.items()}
+
+# Function returning the state of a job with its progress, None if the job is unknown
+def get_job(job_id):
+    state = _decode(get_redis().hgetall(job_key(job_id)))
+    if not state:
+        return None
+
+    rows_total = int(state.get("rows_total", 0))
+    rows_done = int(state.get("rows_done", 0))
+    job = {
+        "id": job_id,
+        "status": state["status"],
+        "rows_total": rows_total,
+        "rows_done": rows_done,
+        "chunks_done": int(state.get("chunks_done", 0)),
+        "rate": None,
+        "eta_seconds": None,
+    }
+    if "error" in state:
+        job["error"] = state["error"]
+
+    # Rate of the current run, a resumed job only counts the rows it imported itself
+    if state["status"] == "running" and "run_started_at" in state:
+        elapsed = time.time() - float(state["run_started_at"])
+        imported = rows_done - int(state.get("run_rows_start", 0))
+        if elapsed > 0 and imported > 0:
+            job["rate"] = round(imported / elapsed, 1)
+            job["eta_seconds"] = round((rows_total - rows_done) / job["rate"], 1)
+    return job
+
+def _is_stale(state):
+    return time.time() - float(state.get("updated_at", 0)) > STALE_AFTER
+
+# Function enqueuing the import of the data files. Idempotent: a dataset already queued,
+# running or imported is not queued again, a failed or dead job is resumed where it stopped
+def enqueue_populate(teams_file='teams.json', players_file='players.json'):
+    job_id = populate_job_id(teams_file, players_file)
+    redis_client = get_redis()
+    state = _decode(redis_client.hgetall(job_key(job_id)))
+
+    if state.get("status") == "completed":
+        return get_job(job_id)
+    if state.get("status") in ("queued", "running") and not _is_stale(state):
+        return get_job(job_id)
+
+    pipe = redis_client.pipeline()
+    pipe.hset(job_key(job_id), mapping={
+        "status": "queued",
+        "teams_file": teams_file,
+        "players_file": players_file,
+        "updated_at": time.time(),
+    })
+    pipe.hsetnx(job_key(job_id), "chunks_done", 0)
+    pipe.hsetnx(job_key(job_id), "rows_done", 0)
+    pipe.hdel(job_key(job_id), "error")
+    pipe.expire(job_key(job_id), JOB_TTL)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return get_job(job_id)
+
+# Id of the leaderboards rebuild, a single job that is enqueued again once completed
+LEADERBOARDS_JOB_ID = "rebuild-leaderboards"
+
+# Function enqueuing the rebuild of the leaderboards from the stats table, unless one is
+# already queued or running
+def enqueue_rebuild_leaderboards():
+    job_id = LEADERBOARDS_JOB_ID
+    redis_client = get_redis()
+    state = _decode(redis_client.hgetall(job_key(job_id)))
+    if state.get("status") in ("queued", "running") and not _is_stale(state):
+        return get_job(job_id)
+
+    pipe = redis_client.pipeline()
+    pipe.delete(job_key(job_id))
+    pipe.hset(job_key(job_id), mapping={ "status": "queued", "kind": "leaderboards", "updated_at": time.time() })
+    pipe.expire(job_key(job_id), JOB_TTL)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return get_job(job_id)
+
+# Rebuilding the leaderboards, the lock is extended after every batch
+def run_leaderboards_job(job_id, state, db, redis_client):
+    key = job_key(job_id)
+    rows_total = db.query(PlayerStats).count()
+    redis_client.hset(key, mapping={
+        "status": "running",
+        "rows_total": rows_total,
+        "rows_done": 0,
+        "run_started_at": time.time(),
+        "run_rows_start": 0,
+        "updated_at": time.time(),
+    })
+
+    def progress(rows_done):
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={"rows_done": rows_done, "updated_at": time.time()})
+        pipe.expire(lock_key(job_id), STALE_AFTER)
+        pipe.execute()
+
+    leaderboards.rebuild(db, progress=progress)
+    redis_client.hset(key, mapping={"status": "completed", "updated_at": time.time()})
+
+# Function running a job: its kind picks the runner, imports by default
+def run_job(job_id):
+    redis_client = get_redis()
+
+    # Only one runner per job, the lock is extended after every chunk
+    if not redis_client.set(lock_key(job_id), os.getpid(), nx=True, ex=STALE_AFTER):
+        return
+
+    key = job_key(job_id)
+    db = Session()
+    try:
+        state = _decode(redis_client.hgetall(key))
+        runner = run_leaderboards_job if state.get("kind") == "leaderboards" else run_populate_job
+        runner(job_id, state, db, redis_client)
+
+    except Exception as e:
+        db.rollback()
+        redis_client.hset(key, mapping={"status": "failed", "error": str(e), "updated_at": time.time()})
+        print(f"Error running job {job_id}: {e}")
+    finally:
+        db.close()
+        redis_client.delete(lock_key(job_id))
+
+# Running an import job from its last completed chunk. The files are streamed chunk by chunk,
+# their row count is taken by a first pass and kept for resumed runs
+def run_populate_job(job_id, state, db, redis_client):
+    key = job_key(job_id)
+    if "rows_total" in state:
+        rows_total = int(state["rows_total"])
+    else:
+        rows_total = sum(1 for _ in load_dataset(state["teams_file"])) + sum(1 for _ in load_dataset(state["players_file"]))
+
+    # Teams go first, players reference them
+    work = itertools.chain(
+        ((import_teams_chunk, rows) for rows in chunks(load_dataset(state["teams_file"]))),
+        ((import_players_chunk, rows) for rows in chunks(load_dataset(state["players_file"]))),
+    )
+
+    chunks_done = int(state.get("chunks_done", 0))
+    rows_done = sum(len(rows) for _, rows in itertools.islice(work, chunks_done))
+    redis_client.hset(key, mapping={
+        "status": "running",
+        "rows_total": rows_total,
+        "rows_done": rows_done,
+        "run_started_at": time.time(),
+        "run_rows_start": rows_done,
+        "updated_at": time.time(),
+    })
+
+    for index, (import_chunk, rows) in enumerate(work, chunks_done):
+        # The marker of the chunk is written with its rows, a chunk that failed after its
+        # commit is replayed without writing them again
+        inserted = import_chunk(db, rows, (job_id, index))
+        rows_done += len(rows)
+
+        # Rosters of the teams the chunk added players to, and the totals
+        if import_chunk is import_players_chunk:
+            invalidate(*{team_tag(row['team_id']) for row in rows})
+        counts.adjust("players" if import_chunk is import_players_chunk else "teams", inserted)
+
+        # Checkpointing the chunk
+        pipe = redis_client.pipeline()
+        pipe.hset(key, mapping={"chunks_done": index + 1, "rows_done": rows_done, "updated_at": time.time()})
+        pipe.expire(lock_key(job_id), STALE_AFTER)
+        pipe.execute()
+
+    redis_client.hset(key, mapping={"status": "completed", "updated_at": time.time()})
+    invalidate(TEAMS_TAG, PLAYERS_TAG)
+
+# Loop consuming queued jobs until stop_event is set
+def run_worker(stop_event=None):
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        item = get_redis().brpop(QUEUE_KEY, timeout=1)
+        if item is not None:
+            run_job(item[1].decode())
+
+# Job worker thread of the current process, for deployments without the jobs sidecar
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+def ensure_worker_started():
+    global _worker_pid
+    if _worker_pid == os.getpid():
+        return
+    with _worker_lock:
+        if _worker_pid != os.getpid():
+            threading.Thread(target=run_worker, name="job-worker", daemon=True).start()
+            _worker_pid = os.getpid()
+
+# Running the job worker as a sidecar process: python -m src.jobs
+if __name__ == '__main__':
+    from . import create_app
+    create_app()
+    try:
+        run_worker()
+    except KeyboardInterrupt:
+        pass
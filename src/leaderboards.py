@@ -0,0 +1,159 @@
+from sqlalchemy import select
+from .cache import get_redis
+from .models import Player, PlayerStats
+
+# Leaderboards of the player statistics, kept in Redis sorted sets so top N and rank lookups
+# cost O(log n) instead of sorting the stats table. There is no league model, the global
+# leaderboards are the league ones:
+#   leaderboard:{stat}:global          every player with stats
+#   leaderboard:{stat}:team:{team_id}  the players of one team
+#   leaderboard:player_team            player id -> team id the player is ranked in
+
+STATS = ("goals", "assists", "appearances")
+
+PREFIX = "leaderboard:"
+PLAYER_TEAM_KEY = "leaderboard:player_team"
+
+# Suffix of the keys built by a rebuild before they replace the live ones
+REBUILD_SUFFIX = ":rebuild"
+
+def global_key(stat):
+    return f"{PREFIX}{stat}:global"
+
+def team_key(stat, team_id):
+    return f"{PREFIX}{stat}:team:{team_id}"
+
+# Applying stat increments of a player in one atomic step. The team leaderboards get the
+# global score, so a player whose team changed is moved with all its stats: removed from
+# the old team sets and added to the new ones. With ARGV[3] = 1 the player is only moved,
+# and only if it is already ranked. Keys are derived from ARGV[2] (single Redis instance)
+# ARGV: player id, team id, move only, then stat and increment pairs
+RECORD_LUA = """
+local player, team, move_only = ARGV[1], ARGV[2], ARGV[3] == '1'
+local old_team = redis.call('HGET', KEYS[1], player)
+if move_only and not old_team then
+    return 0
+end
+for i = 4, #ARGV, 2 do
+    local stat = ARGV[i]
+    local score = redis.call('ZINCRBY', KEYS[2] .. stat .. ':global', ARGV[i + 1], player)
+    if old_team and old_team ~= team then
+        redis.call('ZREM', KEYS[2] .. stat .. ':team:' .. old_team, player)
+    end
+    redis.call('ZADD', KEYS[2] .. stat .. ':team:' .. team, score, player)
+end
+redis.call('HSET', KEYS[1], player, team)
+return 1
+"""
+
+# Removing players from every leaderboard. ARGV: stats count, the stats, then player ids
+REMOVE_LUA = """
+local stat_count = tonumber(ARGV[1])
+for i = stat_count + 2, #ARGV do
+    local player = ARGV[i]
+    local team = redis.call('HGET', KEYS[1], player)
+    for s = 2, stat_count + 1 do
+        redis.call('ZREM', KEYS[2] .. ARGV[s] .. ':global', player)
+        if team then
+            redis.call('ZREM', KEYS[2] .. ARGV[s] .. ':team:' .. team, player)
+        end
+    end
+    redis.call('HDEL', KEYS[1], player)
+end
+return #ARGV - stat_count - 1
+"""
+
+_scripts = {}
+
+def _script(source):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+def _record(player_id, team_id, increments, move_only):
+    args = [player_id, team_id, 1 if move_only else 0]
+    for stat in STATS:
+        args += [stat, increments.get(stat, 0)]
+    return _script(RECORD_LUA)(keys=[PLAYER_TEAM_KEY, PREFIX], args=args)
+
+# Function applying committed stat increments of a player to the leaderboards
+def record(player_id, team_id, increments):
+    return _record(player_id, team_id, increments, move_only=False)
+
+# Function moving a ranked player to the leaderboards of its new team
+def move_player(player_id, team_id):
+    return _record(player_id, team_id, {}, move_only=True)
+
+# Function removing deleted players from the leaderboards
+def remove_players(*player_ids):
+    if not player_ids:
+        return 0
+    return _script(REMOVE_LUA)(keys=[PLAYER_TEAM_KEY, PREFIX], args=[len(STATS), *STATS, *player_ids])
+
+# Function removing the players of a deleted team, they are the members of its sets
+def remove_team(team_id):
+    player_ids = {member.decode() for stat in STATS for member in get_redis().zrange(team_key(stat, team_id), 0, -1)}
+    remove_players(*player_ids)
+    get_redis().delete(*(team_key(stat, team_id) for stat in STATS))
+
+# Function returning the top players of a leaderboard as (player id, score), best first
+def top(stat, team_id=None, limit=10):
+    key = global_key(stat) if team_id is None else team_key(stat, team_id)
+    return [(int(member), int(score)) for member, score in get_redis().zrevrange(key, 0, limit - 1, withscores=True)]
+
+# Function returning (rank starting at 1, score) of a player in a leaderboard, None if unranked
+def rank(stat, player_id, team_id=None):
+    key = global_key(stat) if team_id is None else team_key(stat, team_id)
+    pipe = get_redis().pipeline(transaction=False)
+    pipe.zrevrank(key, player_id)
+    pipe.zscore(key, player_id)
+    position, score = pipe.execute()
+    if position is None:
+        return None
+    return position + 1, int(score)
+
+# Function rebuilding every leaderboard from the stats table. The new sets are built under
+# temporary keys in batches, then replace the live ones, so readers never see a partial
+# leaderboard. Increments recorded while a rebuild runs may be missed by it, the next rebuild
+# picks them up from the database. progress(rows) is called after every batch
+def rebuild(db, batch_size=1000, progress=None):
+    redis_client = get_redis()
+    built = set()
+    rows_done = 0
+
+    def temporary(key):
+        built.add(key)
+        return key + REBUILD_SUFFIX
+
+    # Leftovers of an interrupted rebuild
+    stale = list(redis_client.scan_iter(match=f"{PREFIX}*{REBUILD_SUFFIX}", count=1000))
+    if stale:
+        redis_client.delete(*stale)
+
+    statement = (
+        select(PlayerStats.player_id, Player.team_id, *(getattr(PlayerStats, stat) for stat in STATS))
+        .join(Player, Player.id == PlayerStats.player_id)
+    )
+    result = db.connection().execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+    for batch in result.partitions():
+        pipe = redis_client.pipeline(transaction=False)
+        for player_id, team_id, *scores in batch:
+            for stat, score in zip(STATS, scores):
+                pipe.zadd(temporary(global_key(stat)), {player_id: score})
+                pipe.zadd(temporary(team_key(stat, team_id)), {player_id: score})
+            pipe.hset(temporary(PLAYER_TEAM_KEY), player_id, team_id)
+        pipe.execute()
+        rows_done += len(batch)
+        if progress is not None:
+            progress(rows_done)
+
+    # Swapping the new leaderboards in and dropping the sets of teams without stats anymore
+    live = {key.decode() for key in redis_client.scan_iter(match=f"{PREFIX}*", count=1000)}
+    pipe = redis_client.pipeline()
+    for key in built:
+        pipe.rename(key + REBUILD_SUFFIX, key)
+    for key in live - built:
+        if not key.endswith(REBUILD_SUFFIX):
+            pipe.delete(key)
+    pipe.execute()
+    return rows_done
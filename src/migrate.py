@@ -0,0 +1,91 @@
+import argparse
+import importlib
+import pkgutil
+import re
+from datetime import datetime, timezone
+from sqlalchemy import Table, Column, String, DateTime, MetaData, select, insert, delete
+from . import migrations
+
+# Table recording the applied migrations
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(64), primary_key=True),
+    Column('applied_at', DateTime),
+)
+
+# Migration scripts are the modules of src/migrations named NNNN_description.py, each one
+# with an up(connection) and a down(connection) function
+def load_migrations():
+    names = sorted(
+        module.name for module in pkgutil.iter_modules(migrations.__path__)
+        if re.match(r'^\d{4}_\w+$', module.name)
+    )
+    return [(name, importlib.import_module(f'{migrations.__name__}.{name}')) for name in names]
+
+def applied_versions(engine):
+    _metadata.create_all(engine, checkfirst=True)
+    with engine.connect() as connection:
+        return {version for (version,) in connection.execute(select(schema_migrations.c.version))}
+
+# Function applying the pending migrations in order, up to target if given
+def upgrade(engine, target=None):
+    applied = applied_versions(engine)
+    done = []
+    for version, module in load_migrations():
+        if version not in applied:
+            with engine.begin() as connection:
+                module.up(connection)
+                connection.execute(insert(schema_migrations).values(
+                    version=version, applied_at=datetime.now(timezone.utc)
+                ))
+            done.append(version)
+        if version == target:
+            break
+    return done
+
+# Function reverting the last applied migrations
+def downgrade(engine, steps=1):
+    applied = applied_versions(engine)
+    done = []
+    for version, module in reversed(load_migrations()):
+        if len(done) == steps:
+            break
+        if version in applied:
+            with engine.begin() as connection:
+                module.down(connection)
+                connection.execute(delete(schema_migrations).where(schema_migrations.c.version == version))
+            done.append(version)
+    return done
+
+# Function returning (version, applied) for every migration
+def status(engine):
+    applied = applied_versions(engine)
+    return [(version, version in applied) for version, _ in load_migrations()]
+
+# Migrations CLI: python -m src.migrate [up [--target VERSION] | down [--steps N] | status]
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    from .db import init_db
+
+    parser = argparse.ArgumentParser(prog='python -m src.migrate')
+    commands = parser.add_subparsers(dest='command')
+    up_parser = commands.add_parser('up', help='apply pending migrations')
+    up_parser.add_argument('--target', help='stop after this version')
+    down_parser = commands.add_parser('down', help='revert applied migrations')
+    down_parser.add_argument('--steps', type=int, default=1)
+    commands.add_parser('status', help='list migrations')
+    args = parser.parse_args()
+
+    load_dotenv()
+    engine = init_db()
+    if args.command == 'down':
+        for version in downgrade(engine, args.steps):
+            print(f'Reverted {version}')
+    elif args.command == 'status':
+        for version, applied in status(engine):
+            print(f"{'applied' if applied else 'pending'}  {version}")
+    else:
+        for version in upgrade(engine, getattr(args, 'target', None)):
+            print(f'Applied {version}')
+        print('Database schema is up to date')
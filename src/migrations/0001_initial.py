@@ -0,0 +1,40 @@
+# Initial schema: users, teams and players as they were first created by the models.
+# Tables are created only if missing, so databases created before migrations existed
+# adopt this version as they are
+from datetime import datetime, timezone
+from sqlalchemy import MetaData, Table, Column, Integer, String, Boolean, DateTime, ForeignKey
+
+metadata = MetaData()
+
+users = Table(
+    'users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(50), unique=True),
+    Column('password', String(400)),
+    Column('is_admin', Boolean, default=False),
+    Column('created_at', DateTime, default=datetime.now(timezone.utc)),
+    Column('updated_at', DateTime, default=datetime.now(timezone.utc)),
+)
+
+teams = Table(
+    'teams', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), unique=True),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+players = Table(
+    'players', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100)),
+    Column('team_id', Integer, ForeignKey('teams.id')),
+    Column('created_at', DateTime),
+    Column('updated_at', DateTime),
+)
+
+def up(connection):
+    metadata.create_all(connection, checkfirst=True)
+
+def down(connection):
+    metadata.drop_all(connection, checkfirst=True)
@@ -0,0 +1,29 @@
+# Indexes for the access patterns of the players and teams routes:
+# - rosters, WHERE team_id = ? ORDER BY id, covered by (team_id, id, name)
+# - imports, WHERE name IN (...) reading (name, team_id), covered by (name, team_id)
+# - changes since a point in time, WHERE updated_at > ?
+from sqlalchemy import inspect, Index, MetaData, Table
+
+INDEXES = [
+    ('players', 'ix_players_team_id_id_name', ('team_id', 'id', 'name')),
+    ('players', 'ix_players_name_team_id', ('name', 'team_id')),
+    ('players', 'ix_players_updated_at', ('updated_at',)),
+    ('teams', 'ix_teams_updated_at', ('updated_at',)),
+]
+
+def _index(connection, table_name, name, columns):
+    table = Table(table_name, MetaData(), autoload_with=connection)
+    return Index(name, *(table.c[column] for column in columns))
+
+def _existing(connection, table_name):
+    return {index['name'] for index in inspect(connection).get_indexes(table_name)}
+
+def up(connection):
+    for table_name, name, columns in INDEXES:
+        if name not in _existing(connection, table_name):
+            _index(connection, table_name, name, columns).create(connection)
+
+def down(connection):
+    for table_name, name, columns in reversed(INDEXES):
+        if name in _existing(connection, table_name):
+            _index(connection, table_name, name, columns).drop(connection)
@@ -0,0 +1,17 @@
+# Version counters for optimistic concurrency on players and teams, existing rows start at 1
+from sqlalchemy import inspect, text
+
+TABLES = ('players', 'teams')
+
+def _has_version(connection, table_name):
+    return 'version' in {column['name'] for column in inspect(connection).get_columns(table_name)}
+
+def up(connection):
+    for table_name in TABLES:
+        if not _has_version(connection, table_name):
+            connection.execute(text(f'ALTER TABLE {table_name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1'))
+
+def down(connection):
+    for table_name in TABLES:
+        if _has_version(connection, table_name):
+            connection.execute(text(f'ALTER TABLE {table_name} DROP COLUMN version'))
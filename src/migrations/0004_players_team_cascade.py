@@ -0,0 +1,28 @@
+# Players are deleted with their team by the database (ON DELETE CASCADE) instead of being
+# loaded and deleted one by one. SQLite cannot alter a constraint, tables it created keep
+# their foreign key and the team delete route removes the players itself
+from sqlalchemy import inspect, text
+
+CONSTRAINT = 'fk_players_team_id'
+
+def _team_foreign_key(connection):
+    for foreign_key in inspect(connection).get_foreign_keys('players'):
+        if foreign_key['referred_table'] == 'teams':
+            return foreign_key
+    return None
+
+def _replace_foreign_key(connection, on_delete):
+    if connection.dialect.name == 'sqlite':
+        return
+    foreign_key = _team_foreign_key(connection)
+    if foreign_key is not None:
+        connection.execute(text(f"ALTER TABLE players DROP FOREIGN KEY {foreign_key['name']}"))
+    connection.execute(text(
+        f'ALTER TABLE players ADD CONSTRAINT {CONSTRAINT} FOREIGN KEY (team_id) REFERENCES teams (id){on_delete}'
+    ))
+
+def up(connection):
+    _replace_foreign_key(connection, ' ON DELETE CASCADE')
+
+def down(connection):
+    _replace_foreign_key(connection, '')
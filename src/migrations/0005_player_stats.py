@@ -0,0 +1,21 @@
+# Per-player statistics, the leaderboards in Redis are rebuilt from this table
+from sqlalchemy import MetaData, Table, Column, Integer, DateTime, ForeignKey
+
+metadata = MetaData()
+
+Table('players', metadata, Column('id', Integer, primary_key=True))
+
+player_stats = Table(
+    'player_stats', metadata,
+    Column('player_id', Integer, ForeignKey('players.id', name='fk_player_stats_player_id', ondelete='CASCADE'), primary_key=True),
+    Column('goals', Integer, nullable=False, server_default='0'),
+    Column('assists', Integer, nullable=False, server_default='0'),
+    Column('appearances', Integer, nullable=False, server_default='0'),
+    Column('updated_at', DateTime),
+)
+
+def up(connection):
+    player_stats.create(connection, checkfirst=True)
+
+def down(connection):
+    player_stats.drop(connection, checkfirst=True)
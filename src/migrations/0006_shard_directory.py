@@ -0,0 +1,25 @@
+# Shard directory (team -> shard) and the player id sequence used when players are sharded
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+metadata = MetaData()
+
+team_shards = Table(
+    'team_shards', metadata,
+    Column('team_id', Integer, primary_key=True),
+    Column('shard', Integer, nullable=False),
+    Column('state', String(16), nullable=False, server_default='active'),
+    Column('updated_at', DateTime),
+)
+
+player_ids = Table(
+    'player_ids', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+)
+
+def up(connection):
+    team_shards.create(connection, checkfirst=True)
+    player_ids.create(connection, checkfirst=True)
+
+def down(connection):
+    player_ids.drop(connection, checkfirst=True)
+    team_shards.drop(connection, checkfirst=True)
@@ -0,0 +1,17 @@
+# Chunks of the import jobs already written, on the primary database and on every shard
+from sqlalchemy import MetaData, Table, Column, Integer, String, DateTime
+
+metadata = MetaData()
+
+import_chunks = Table(
+    'import_chunks', metadata,
+    Column('job_id', String(64), primary_key=True),
+    Column('chunk', Integer, primary_key=True),
+    Column('created_at', DateTime),
+)
+
+def up(connection):
+    import_chunks.create(connection, checkfirst=True)
+
+def down(connection):
+    import_chunks.drop(connection, checkfirst=True)
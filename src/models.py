@@ -1,5 +1,5 @@
 from datetime import datetime, timezone
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -24,9 +24,19 @@ class Team(Base):
     __tablename__ = 'teams'
     id = Column(Integer, primary_key=True)
     name = Column(String(100), unique=True)
-    player = relationship('Player', back_populates="team", cascade='all, delete')
+    # The database deletes the players of a deleted team (ON DELETE CASCADE), they are never loaded for it
+    player = relationship('Player', back_populates="team", cascade='all, delete', passive_deletes=True)
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    # Every ORM update or delete checks and increments the version (optimistic concurrency)
+    __mapper_args__ = { 'version_id_col': version }
+
+    # Indexes are created by the migrations (src/migrations), declared here to keep the models in sync
+    __table_args__ = (
+        Index('ix_teams_updated_at', 'updated_at'),
+    )
     
     def __repr__(self):
         return f'<Team {self.name}>'
@@ -42,18 +52,65 @@ class Player(Base):
     __tablename__ = 'players'
     id = Column(Integer, primary_key=True)
     name = Column(String(100))
-    team_id = Column(Integer, ForeignKey('teams.id'))
+    team_id = Column(Integer, ForeignKey('teams.id', name='fk_players_team_id', ondelete='CASCADE'))
     team = relationship("Team", back_populates="player")
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = { 'version_id_col': version }
+
+    __table_args__ = (
+        Index('ix_players_team_id_id_name', 'team_id', 'id', 'name'),
+        Index('ix_players_name_team_id', 'name', 'team_id'),
+        Index('ix_players_updated_at', 'updated_at'),
+    )
     
     def __repr__(self):
         return f'<Player {self.name}>'
     
-    def to_dict(self):
+    # team_names is an optional id -> name mapping (e.g. the team directory) that
+    # avoids loading the team relationship
+    def to_dict(self, team_names=None):
         return {
             'id': self.id,
             'name': self.name,
-            'team': self.team.name
+            'team': team_names.get(self.team_id) if team_names is not None else self.team.name
         }
-    
\ No newline at end of file
+    
+# Creating PlayerStats Model for database, one row per player, deleted with the player
+class PlayerStats(Base):
+    __tablename__ = 'player_stats'
+    player_id = Column(Integer, ForeignKey('players.id', name='fk_player_stats_player_id', ondelete='CASCADE'), primary_key=True)
+    goals = Column(Integer, nullable=False, default=0, server_default='0')
+    assists = Column(Integer, nullable=False, default=0, server_default='0')
+    appearances = Column(Integer, nullable=False, default=0, server_default='0')
+    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<PlayerStats {self.player_id}>'
+
+# Creating TeamShard Model for database, the shard directory of the primary database: the
+# shard of each team's players (src/sharding.py), teams without a row are on shard 0
+class TeamShard(Base):
+    __tablename__ = 'team_shards'
+    team_id = Column(Integer, primary_key=True)
+    shard = Column(Integer, nullable=False)
+    state = Column(String(16), nullable=False, default='active', server_default='active')
+    updated_at = Column(DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+
+    def __repr__(self):
+        return f'<TeamShard {self.team_id} on {self.shard}>'
+
+# Creating PlayerId Model for database, a sequence handing out player ids unique across shards
+class PlayerId(Base):
+    __tablename__ = 'player_ids'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+
+# Creating ImportChunk Model for database, the chunks of the import jobs already written. A
+# chunk inserts its row in the transaction of its players, so a replayed chunk is skipped
+class ImportChunk(Base):
+    __tablename__ = 'import_chunks'
+    job_id = Column(String(64), primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
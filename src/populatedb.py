@@ -1,45 +1,118 @@
+import itertools
 import json
-from .models import Player, Team
+import os
+from datetime import datetime, timezone
+from sqlalchemy import insert, select
+from .models import Player, Team, ImportChunk
 from .db import session
+from . import sharding
 
-def import_teams(json_file):
-    # Verifying if the data already exists in the database
-    teamsData = session.query(Team).first()
+# Folder of the dataset files
+DATA_DIR = "./src/data"
 
-    # If data exists, return
-    if teamsData is not None:
-        return
-    
-    try:
-        with open(f"./src/data/{json_file}", 'r') as f:
-            teams_data = json.load(f)
+# Rows imported per transaction, progress is checkpointed after every chunk
+CHUNK_SIZE = 1000
+
+# Characters read from a dataset file at a time
+READ_SIZE = 64 * 1024
+
+# Generator of the rows of a dataset file (a JSON array of objects) from the data folder.
+# Rows are decoded one at a time from a buffer refilled as needed, so datasets of millions of
+# rows never sit in memory
+def load_dataset(json_file, read_size=READ_SIZE):
+    decoder = json.JSONDecoder()
+    with open(os.path.join(DATA_DIR, json_file), 'r', encoding='utf-8') as f:
+        buffer = f.read(read_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{json_file} is not a JSON array")
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip()
+            if buffer.startswith(','):
+                buffer = buffer[1:].lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                row, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # The next row is not complete yet
+                data = f.read(read_size)
+                if not data:
+                    raise
+                buffer += data
+                continue
+            yield row
+            buffer = buffer[end:]
+
+# Function splitting rows (a list or any iterable) into lists of CHUNK_SIZE
+def chunks(rows, size=CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+# The marker of a chunk of an import job is its (job id, chunk index). It is written in the
+# transaction of the rows of the chunk, a replayed chunk finds it and writes nothing
+def chunk_written(db, marker):
+    job_id, chunk = marker
+    return db.execute(select(ImportChunk.job_id).where(
+        (ImportChunk.job_id == job_id) & (ImportChunk.chunk == chunk)
+    )).first() is not None
+
+def mark_chunk_written(db, marker):
+    job_id, chunk = marker
+    db.execute(insert(ImportChunk).values(job_id=job_id, chunk=chunk, created_at=datetime.now(timezone.utc)))
 
-        for team_data in teams_data:
-            new_team = Team(name=team_data['name'])
-            session.add(new_team)
-        session.commit()
+# Importing a chunk of teams, teams already present (same name) are skipped as names are
+# unique. Returns the number of inserted teams
+def import_teams_chunk(db, rows, marker=None):
+    if marker is not None and chunk_written(db, marker):
+        return 0
+    names = {row['name'] for row in rows}
+    existing = {name for (name,) in db.query(Team.name).filter(Team.name.in_(names))}
+    new_teams = [{'name': name} for name in dict.fromkeys(row['name'] for row in rows) if name not in existing]
+    if new_teams:
+        db.execute(insert(Team), new_teams)
+    if marker is not None:
+        mark_chunk_written(db, marker)
+    db.commit()
+    return len(new_teams)
+
+# Importing a chunk of players, every row is a new player (names are not unique). With a
+# marker a replayed chunk inserts nothing. Returns the number of inserted players
+def import_players_chunk(db, rows, marker=None):
+    new_players = [{'name': row['name'], 'team_id': row['team_id']} for row in rows]
+    # Players go to the shards of their teams with ids from the sequence, each shard keeps
+    # the marker of the rows it got
+    if sharding.router is not None:
+        ids = sharding.router.insert_players(new_players, marker)
+        return sum(1 for player_id in ids if player_id is not None)
+
+    if marker is not None and chunk_written(db, marker):
+        return 0
+    if new_players:
+        db.execute(insert(Player), new_players)
+    if marker is not None:
+        mark_chunk_written(db, marker)
+    db.commit()
+    return len(new_players)
+
+def import_teams(json_file, db=session):
+    try:
+        for rows in chunks(load_dataset(json_file)):
+            import_teams_chunk(db, rows)
 
     except FileNotFoundError as e:
-        session.rollback()
+        db.rollback()
         print(f"Error importing teams: {e}")
 
-def import_players(json_file):
-    # Verifying if the data already exists in the database
-    playersData = session.query(Player).first()
-
-    # If data exists, return
-    if playersData is not None:
-        return
-    
+def import_players(json_file, db=session):
     try:
-        with open(f"./src/data/{json_file}", 'r') as f:
-            players_data = json.load(f)
-
-        for player_data in players_data:
-            new_player = Player(name=player_data['name'], team_id=player_data['team_id'])
-            session.add(new_player)
-        session.commit()
-        
+        for rows in chunks(load_dataset(json_file)):
+            import_players_chunk(db, rows)
+
     except FileNotFoundError as e:
-        session.rollback()
-        print(f"Error importing players: {e}")
\ No newline at end of file
+        db.rollback()
+        print(f"Error importing players: {e}")
@@ -0,0 +1,105 @@
+import os
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from flask import g, has_request_context
+from .cache import on_invalidate, PLAYERS_TAG, TEAMS_TAG
+
+# nginx micro-caches the public GET routes for a second (nginx/nginx.conf). Every invalidation
+# is mirrored there: the cached URLs depending on the invalidated tags are fetched again through
+# the internal refresh listener of nginx, which bypasses the cache and stores the new response.
+# The client that wrote also gets a cookie making nginx skip the cache for it, so it reads its
+# own writes even before the refresh lands
+
+# Cookie telling nginx to skip the micro-cache, it lasts longer than a cached response
+BYPASS_COOKIE = "cache_bypass"
+BYPASS_SECONDS = 2
+
+# Cached URLs depending on each tag. Players embed their team name, so a team change
+# refreshes the players list too. Single players of a renamed team are not enumerated,
+# they expire with the micro-cache TTL
+TAG_URLS = {
+    PLAYERS_TAG: ["/api/players", "/api/teams/players"],
+    TEAMS_TAG: ["/api/teams", "/api/teams/players", "/api/players"],
+}
+ENTITY_URLS = {
+    "player": "/api/players/{}",
+    "team": "/api/teams/{}",
+}
+
+def urls_for_tags(tags):
+    urls = []
+    for tag in tags:
+        if tag in TAG_URLS:
+            urls.extend(TAG_URLS[tag])
+        else:
+            entity, _, entity_id = tag.partition(":")
+            if entity in ENTITY_URLS:
+                urls.append(ENTITY_URLS[entity].format(entity_id))
+    return list(dict.fromkeys(urls))
+
+class ProxyPurge:
+    def __init__(self, refresh_url, timeout=2.0, max_workers=4, max_pending=100):
+        self.refresh_url = refresh_url.rstrip("/")
+        self.timeout = timeout
+        # URLs queued and not fetched yet, each one at most once. Beyond max_pending the
+        # refreshes are dropped, the micro-cache TTL expires those responses anyway
+        self.max_pending = max_pending
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="proxy-purge")
+
+    def refresh(self, url):
+        # Leaving the pending set before the fetch: an invalidation arriving during it queues
+        # the URL again, this fetch may read the data from before the write
+        with self._lock:
+            self._pending.discard(url)
+        try:
+            with urllib.request.urlopen(f"{self.refresh_url}{url}", timeout=self.timeout) as response:
+                response.read()
+        except Exception as e:
+            print(f"Error refreshing proxy cache for {url}: {e}")
+
+    # Function queuing the refresh of a URL, unless it is already queued (a burst of writes
+    # refreshes the collections once) or the queue is full. Returns whether it was queued
+    def submit(self, url):
+        with self._lock:
+            if url in self._pending or len(self._pending) >= self.max_pending:
+                return False
+            self._pending.add(url)
+        self._executor.submit(self.refresh, url)
+        return True
+
+    # Listener of the cache invalidations, the refreshes run in the background so a write never
+    # waits for them (its worker may be the one serving them)
+    def __call__(self, tags):
+        for url in urls_for_tags(tags):
+            self.submit(url)
+        if has_request_context():
+            g.proxy_bypass = True
+
+    def set_bypass_cookie(self, response):
+        if g.pop("proxy_bypass", False):
+            response.set_cookie(BYPASS_COOKIE, "1", max_age=BYPASS_SECONDS, httponly=True)
+        return response
+
+# Proxy purge of the process, created by init_purge() when PROXY_PURGE_URL is set
+proxy_purge = None
+
+# Function to mirror the cache invalidations to the proxy cache, enabled by PROXY_PURGE_URL
+# (the internal refresh listener of nginx, e.g. http://soccer_proxy:8080)
+def init_purge(app=None):
+    global proxy_purge
+    refresh_url = os.getenv("PROXY_PURGE_URL")
+    if not refresh_url:
+        return None
+    if proxy_purge is None:
+        proxy_purge = ProxyPurge(
+            refresh_url,
+            timeout=float(os.getenv("PROXY_PURGE_TIMEOUT", 2.0)),
+            max_pending=int(os.getenv("PROXY_PURGE_MAX_PENDING", 100)),
+        )
+        on_invalidate(proxy_purge)
+    if app is not None:
+        app.after_request(proxy_purge.set_bypass_cookie)
+    return proxy_purge
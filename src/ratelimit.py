@@ -0,0 +1,104 @@
+import math
+import os
+import uuid
+from flask import current_app, request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from .cache import get_redis
+
+# Default limits per endpoint or blueprint name, as "requests/window seconds[:ip|user]".
+# Routes doing PBKDF2 or full imports are the expensive ones
+DEFAULT_RATE_LIMITS = {
+    "auth.login": "10/60:ip",
+    "auth.register": "5/60:ip",
+    "populate": "2/300:ip",
+    "leaderboards.rebuild_leaderboards": "2/300:ip",
+}
+
+# Sliding window log kept in a sorted set: drops the entries older than the window and
+# admits the request if there is room, all atomically on the Redis side.
+# Returns {allowed, remaining, retry after in ms}
+SLIDING_WINDOW_LUA = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local count = redis.call('ZCARD', KEYS[1])
+if count < limit then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return {0, 0, tonumber(oldest[2]) + window - now}
+"""
+
+_sliding_window_script = None
+
+# Parsing a limit like "10/60:ip" into (requests, window seconds, per)
+def parse_limit(value):
+    rate, _, per = value.partition(":")
+    requests, _, window = rate.partition("/")
+    per = per or "ip"
+    if per not in ("ip", "user"):
+        raise ValueError(f"Invalid rate limit key {per!r}, expected ip or user")
+    return int(requests), float(window or 1), per
+
+# Limits from the defaults, overridden by RATE_LIMITS, e.g. "auth.login=5/60:ip,players=200/10:user"
+def load_rate_limits():
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for item in filter(None, os.getenv("RATE_LIMITS", "").split(",")):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = value.strip()
+    return {name: parse_limit(value) for name, value in limits.items() if value}
+
+def client_ip():
+    # nginx forwards the client address, the app is never exposed directly
+    return request.headers.get("X-Real-IP") or request.remote_addr
+
+def client_user():
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+# Function checking a limit, returns (allowed, retry after seconds)
+def hit(name, requests, window, identity):
+    global _sliding_window_script
+    if _sliding_window_script is None:
+        _sliding_window_script = get_redis().register_script(SLIDING_WINDOW_LUA)
+    key = f"ratelimit:{name}:{identity}"
+    allowed, _, retry_after = _sliding_window_script(
+        keys=[key], args=[int(window * 1000), requests, uuid.uuid4().hex]
+    )
+    return bool(allowed), math.ceil(int(retry_after) / 1000)
+
+# Checking the limit of the current endpoint, falling back to the limit of its blueprint
+def check_rate_limit():
+    limits = current_app.config["RATE_LIMITS"]
+    name = request.endpoint if request.endpoint in limits else request.blueprint
+    if name not in limits:
+        return None
+
+    requests, window, per = limits[name]
+    user = client_user() if per == "user" else None
+    identity = f"user:{user}" if user is not None else f"ip:{client_ip()}"
+
+    try:
+        allowed, retry_after = hit(name, requests, window, identity)
+    except Exception as e:
+        # Failing open, an unavailable Redis must not take the API down
+        current_app.logger.warning(f"Rate limit check failed: {e}")
+        return None
+
+    if not allowed:
+        response = jsonify({ "message": "Too Many Requests", "retry_after": retry_after })
+        response.headers["Retry-After"] = str(max(retry_after, 1))
+        return response, 429
+    return None
+
+# Function to enable rate limiting on the app
+def init_rate_limits(app):
+    app.config.setdefault("RATE_LIMITS", load_rate_limits())
+    app.before_request(check_rate_limit)
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from sqlalchemy import event, text
+from . import db
+from .cache import get_redis
+
+# Readiness of a worker: can it serve requests right now. /health only says the process
+# answers, /ready also checks the database and Redis. Healthchecks come every few seconds
+# from every container, so probe results are cached per worker and the database is only
+# queried when the worker has not used it successfully lately
+
+class DatabaseProbe:
+    def __init__(self, fresh_for):
+        self.fresh_for = fresh_for
+        self.last_ok = None
+        self.last_error = None
+        self._listening = None
+
+    # Every connection checked out of the pool proves the database answers (the pool pings
+    # connections before handing them out), a disconnect error proves the opposite
+    def listen(self, engine):
+        if self._listening is engine:
+            return
+        event.listen(engine.pool, "checkout", self.on_checkout)
+        event.listen(engine, "handle_error", self.on_error)
+        self._listening = engine
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.last_ok = time.monotonic()
+
+    def on_error(self, context):
+        if context.is_disconnect:
+            self.last_error = time.monotonic()
+
+    # Pool usage, None for pools without a fixed size (e.g. SQLite)
+    def pool_usage(self, engine):
+        pool = engine.pool
+        if not hasattr(pool, "checkedout") or not hasattr(pool, "size"):
+            return None
+        capacity = int(os.getenv("DB_POOL_SIZE", 5)) + int(os.getenv("DB_MAX_OVERFLOW", 10))
+        return { "checked_out": pool.checkedout(), "capacity": capacity }
+
+    def check(self):
+        engine = db.init_db()
+        self.listen(engine)
+        result = { "status": "ok" }
+
+        usage = self.pool_usage(engine)
+        if usage is not None:
+            result["pool"] = usage
+            if usage["checked_out"] >= usage["capacity"]:
+                return { **result, "status": "failing", "error": "connection pool exhausted" }
+
+        now = time.monotonic()
+        recent = self.last_ok is not None and now - self.last_ok < self.fresh_for
+        failed_since = self.last_error is not None and (self.last_ok is None or self.last_error > self.last_ok)
+        if recent and not failed_since:
+            result["source"] = "traffic"
+            return result
+
+        # Idle or failing worker, asking the database directly
+        try:
+            with engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+        except Exception as e:
+            return { **result, "status": "failing", "error": str(e) }
+        result["source"] = "probe"
+        return result
+
+class RedisProbe:
+    def __init__(self, max_latency):
+        self.max_latency = max_latency
+
+    def check(self):
+        started = time.perf_counter()
+        try:
+            get_redis().ping()
+        except Exception as e:
+            return { "status": "failing", "error": str(e) }
+        latency = time.perf_counter() - started
+        result = { "status": "ok", "latency_ms": round(latency * 1000, 2) }
+        if latency > self.max_latency:
+            result.update(status="failing", error=f"latency above {self.max_latency * 1000:g} ms")
+        return result
+
+class Readiness:
+    def __init__(self, probes, ttl):
+        self.probes = probes
+        self.ttl = ttl
+        self._result = None
+        self._checked_at = 0
+        self._lock = threading.Lock()
+
+    # Function returning (ready, checks), probing at most once per ttl. Concurrent healthchecks
+    # share one probe
+    def check(self):
+        with self._lock:
+            if self._result is None or time.monotonic() - self._checked_at >= self.ttl:
+                checks = { name: probe.check() for name, probe in self.probes.items() }
+                ready = all(check["status"] == "ok" for check in checks.values())
+                self._result = (ready, checks)
+                self._checked_at = time.monotonic()
+            return self._result
+
+# Function to build the readiness checks of the app from the READY_* settings
+def init_readiness(app):
+    readiness = Readiness(
+        probes={
+            "database": DatabaseProbe(fresh_for=float(os.getenv("READY_DB_FRESH_FOR", 10))),
+            "redis": RedisProbe(max_latency=float(os.getenv("READY_REDIS_MAX_LATENCY", 0.25))),
+        },
+        ttl=float(os.getenv("READY_CACHE_TTL", 2)),
+    )
+    app.extensions["readiness"] = readiness
+    return readiness
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+import uuid
+from .cache import get_redis, registered_views, load_view, HITS_KEY, INVALIDATED_CHANNEL
+from .db import Session
+
+# Only one refresher (thread or sidecar) does the work at a time, the others stand by
+LOCK_KEY = "cache:refresher:lock"
+
+# Taking the leader lock or extending it if this refresher (ARGV[1]) already owns it, in a
+# single step so it never expires or changes hands in between. Returns 1 for the leader
+LEADER_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+# Background refresher recomputing hot cached views before they expire or right after
+# they are invalidated, so user requests keep hitting the cache
+class CacheRefresher(threading.Thread):
+    def __init__(self, interval=1.0, refresh_ahead=3.0, hot_threshold=5, decay_interval=30.0):
+        super().__init__(name="cache-refresher", daemon=True)
+        self.interval = interval
+        self.refresh_ahead = refresh_ahead
+        self.hot_threshold = hot_threshold
+        self.decay_interval = decay_interval
+        self.owner = str(uuid.uuid4())
+        self._stop_event = threading.Event()
+        self._last_decay = time.monotonic()
+        self._leader_script = None
+
+    def stop(self):
+        self._stop_event.set()
+
+    # Taking or extending the leader lock, returns True if this refresher owns it
+    def is_leader(self):
+        if self._leader_script is None:
+            self._leader_script = get_redis().register_script(LEADER_LUA)
+        ttl = int(max(self.interval * 5, 5) * 1000)
+        return self._leader_script(keys=[LOCK_KEY], args=[self.owner, ttl]) == 1
+
+    # Recomputing the given views with a dedicated database session
+    def refresh(self, keys):
+        if not keys:
+            return
+        db = Session()
+        try:
+            for key in keys:
+                try:
+                    load_view(key, db)
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error refreshing cache key {key}: {e}")
+        finally:
+            db.close()
+
+    # Registered views accessed at least hot_threshold times in the current window
+    def hot_keys(self):
+        hot = get_redis().zrangebyscore(HITS_KEY, self.hot_threshold, "+inf")
+        views = set(registered_views())
+        return [key.decode() for key in hot if key.decode() in views]
+
+    # Hot views that are missing or about to expire
+    def expiring_keys(self):
+        keys = self.hot_keys()
+        if not keys:
+            return []
+        pipe = get_redis().pipeline(transaction=False)
+        for key in keys:
+            pipe.pttl(key)
+        ttls = pipe.execute()
+        threshold = self.refresh_ahead * 1000
+        return [key for key, ttl in zip(keys, ttls) if ttl == -2 or 0 <= ttl <= threshold]
+
+    # Halving the access counters so frequency reflects recent traffic
+    def decay(self):
+        pipe = get_redis().pipeline()
+        pipe.zunionstore(HITS_KEY, {HITS_KEY: 0.5})
+        pipe.zremrangebyscore(HITS_KEY, "-inf", 1)
+        pipe.execute()
+        self._last_decay = time.monotonic()
+
+    # Warming every registered view
+    def warm(self):
+        self.refresh(registered_views())
+
+    # Waiting up to the interval for invalidations, then taking every other pending one, so a
+    # burst of writes leads to a single refresh. Returns the union of the invalidated keys
+    def invalidated_keys(self, pubsub):
+        invalidated = set()
+        message = pubsub.get_message(timeout=self.interval)
+        while message is not None:
+            invalidated.update(json.loads(message["data"]))
+            message = pubsub.get_message(timeout=0)
+        return invalidated
+
+    # Hot views that were invalidated, followed by the ones about to expire, each one once
+    def keys_to_refresh(self, invalidated):
+        keys = [key for key in self.hot_keys() if key in invalidated]
+        return keys + [key for key in self.expiring_keys() if key not in invalidated]
+
+    def run(self):
+        pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(INVALIDATED_CHANNEL)
+        warmed = False
+        try:
+            while not self._stop_event.is_set():
+                invalidated = self.invalidated_keys(pubsub)
+                try:
+                    if not self.is_leader():
+                        continue
+                    if not warmed:
+                        self.warm()
+                        warmed = True
+                    self.refresh(self.keys_to_refresh(invalidated))
+                    if time.monotonic() - self._last_decay >= self.decay_interval:
+                        self.decay()
+                except Exception as e:
+                    print(f"Error in cache refresher: {e}")
+        finally:
+            pubsub.close()
+
+# Function to build a refresher configured from environment variables
+def refresher_from_env():
+    return CacheRefresher(
+        interval=float(os.getenv('CACHE_REFRESH_INTERVAL', 1.0)),
+        refresh_ahead=float(os.getenv('CACHE_REFRESH_AHEAD', 3.0)),
+        hot_threshold=float(os.getenv('CACHE_HOT_THRESHOLD', 5)),
+        decay_interval=float(os.getenv('CACHE_DECAY_INTERVAL', 30.0)),
+    )
+
+# Refresher thread of the current process, threads do not survive a fork so it is
+# tracked together with the pid that started it
+_refresher = None
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+
+# Function starting the refresher thread once per process
+def ensure_refresher_started():
+    global _refresher, _refresher_pid
+    if _refresher_pid == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher_pid != os.getpid():
+            _refresher = refresher_from_env()
+            _refresher.start()
+            _refresher_pid = os.getpid()
+
+# Running the refresher as a sidecar process: python -m src.refresher
+if __name__ == '__main__':
+    from . import create_app
+    create_app()
+    refresher = refresher_from_env()
+    refresher.start()
+    try:
+        while refresher.is_alive():
+            refresher.join(1)
+    except KeyboardInterrupt:
+        refresher.stop()
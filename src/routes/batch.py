@@ -0,0 +1,147 @@
+from flask import Blueprint, current_app, request, jsonify
+from urllib.parse import urlsplit
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from ..admission import overloaded
+from ..cache import get_entities, player_key, team_key
+from ..db import session
+from ..serializers import dumps, loads, json_response
+from .players import load_players_by_id
+from .teams import load_teams_by_id
+
+# Adding blueprint to the routes
+batch = Blueprint('batch', __name__)
+
+# Most sub-requests a batch can hold
+MAX_BATCH_SIZE = 20
+
+# Routes that cannot run inside a batch: exports are streamed, populate enqueues a job on GET
+# and jobs are polled. Rate limited routes are refused too (see batchable), the hooks of the
+# app do not run for the sub-requests
+UNBATCHABLE_ENDPOINTS = {"export.export_resource", "populate", "job_status"}
+
+# Request headers passed on to the sub-requests, for the routes reading the JWT cookie
+FORWARDED_HEADERS = ("Cookie", "Authorization", "X-Real-IP")
+
+# Single entity routes resolved together, dataloader style: every id requested in the batch
+# is read with one MGET and the misses with one IN query, instead of one lookup per route.
+# endpoint -> (cache key, loader, encoder of the entity, body when not found)
+ENTITY_LOADERS = {
+    "players.get_player": (
+        player_key,
+        load_players_by_id,
+        lambda data, source: b'{"data":[' + data + b'],"source":' + dumps(source) + b'}',
+        { "message": "Player Not Found" },
+    ),
+    "teams.get_team": (
+        team_key,
+        load_teams_by_id,
+        lambda data, source: dumps({ "message": "Team Found Successfully", "Team": { "name": loads(data)["name"] } }),
+        { "message": "Team Not Found" },
+    ),
+}
+
+# Function parsing the body, returns (list of (id, path), error)
+def parse_batch(body):
+    if not isinstance(body, dict) or not isinstance(body.get("requests"), list):
+        return None, "requests must be a list of sub-requests"
+    if not body["requests"]:
+        return None, "requests must not be empty"
+    if len(body["requests"]) > MAX_BATCH_SIZE:
+        return None, f"at most {MAX_BATCH_SIZE} sub-requests can be sent at once"
+
+    sub_requests = []
+    for index, item in enumerate(body["requests"]):
+        if not isinstance(item, dict) or not isinstance(item.get("path"), str) or not item["path"].startswith("/"):
+            return None, f"requests[{index}] must have a path starting with /"
+        if item.get("method", "GET").upper() != "GET":
+            return None, f"requests[{index}]: only GET sub-requests can be batched"
+        sub_requests.append((item.get("id", index), item["path"]))
+    return sub_requests, None
+
+# Function matching a path to its route, returns (endpoint, view arguments), endpoint is None
+# for unknown paths and routes without GET
+def match_route(path):
+    try:
+        return current_app.url_map.bind("").match(urlsplit(path).path, method="GET")
+    except HTTPException:
+        return None, {}
+
+# Function telling if a route can run inside a batch, routes limited by endpoint or blueprint
+# would escape their limit
+def batchable(endpoint):
+    limits = current_app.config.get("RATE_LIMITS", {})
+    return endpoint not in UNBATCHABLE_ENDPOINTS and endpoint not in limits and endpoint.rpartition(".")[0] not in limits
+
+# Function resolving the single entity sub-requests of one route, returns path -> (status, body)
+def load_entities(endpoint, paths):
+    key, loader, encode, not_found = ENTITY_LOADERS[endpoint]
+    ids = [view_args["_id"] for view_args in paths.values()]
+    entities, from_database = get_entities(ids, key, lambda missing: loader(session, missing))
+    source = "database" if from_database else "cache"
+    return {
+        path: (200, encode(data, source)) if data is not None else (404, dumps(not_found))
+        for path, data in zip(paths, entities)
+    }
+
+# Function running a sub-request through its route handler, in its own request context.
+# The hooks of the app (rate limits, admission, tracing) ran once for the batch, which takes
+# an admission slot per unit of work itself (see run_batch)
+def dispatch(path):
+    url = urlsplit(path)
+    headers = { name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers }
+    environ = EnvironBuilder(path=url.path, query_string=url.query, method="GET", headers=headers,
+                             environ_base={ "REMOTE_ADDR": request.remote_addr }).get_environ()
+    with current_app.app_context(), current_app.request_context(environ):
+        try:
+            response = current_app.make_response(current_app.dispatch_request())
+        except HTTPException as e:
+            return e.code, dumps({ "message": e.description })
+        if response.is_json:
+            return response.status_code, response.get_data()
+        return response.status_code, dumps(response.get_data(as_text=True))
+
+# Route running several GET sub-requests against the API in one round trip. Identical
+# sub-requests run once and single players and teams are loaded together. Each sub-response
+# is a status and a body only: the headers of the routes (e.g. the ETag of single players
+# and teams) are not passed on, clients needing them request the route itself
+@batch.route('/batch', methods=['POST'])
+def run_batch():
+    try:
+        sub_requests, error = parse_batch(request.get_json(silent=True))
+        if error:
+            return jsonify({ "message": f"Bad Request: {error}" }), 400
+
+        # Grouping the distinct paths: single entities by route, the others run one by one
+        results, entity_paths, other_paths = {}, {}, []
+        for path in dict.fromkeys(path for _, path in sub_requests):
+            endpoint, view_args = match_route(path)
+            if endpoint is None:
+                results[path] = (404, dumps({ "message": "Not Found" }))
+            elif not batchable(endpoint):
+                results[path] = (400, dumps({ "message": "Bad Request: this route cannot be batched" }))
+            elif endpoint in ENTITY_LOADERS and not urlsplit(path).query:
+                entity_paths.setdefault(endpoint, {})[path] = view_args
+            else:
+                other_paths.append(path)
+
+        # The batch does the work of one request per entity route and per other path, it holds
+        # an admission slot for each so batches cannot exceed the capacity of the worker
+        admission = current_app.extensions.get("admission")
+        if admission is not None and not admission.admit_extra(len(entity_paths) + len(other_paths) - 1):
+            return overloaded()
+
+        for endpoint, paths in entity_paths.items():
+            results.update(load_entities(endpoint, paths))
+        for path in other_paths:
+            results[path] = dispatch(path)
+
+        # Responses in the order of the sub-requests, bodies spliced in as they are
+        body = b'{"responses":[' + b",".join(
+            b'{"id":' + dumps(sub_request_id) + b',"status":' + dumps(results[path][0]) + b',"body":' + results[path][1] + b'}'
+            for sub_request_id, path in sub_requests
+        ) + b']}'
+        return json_response(body), 200
+
+    except Exception as e:
+        return jsonify({ "error": "Error running the batch", "message": str(e) }), 500
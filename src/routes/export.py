@@ -0,0 +1,111 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from sqlalchemy import select
+import csv
+import io
+import zlib
+from itertools import islice
+from ..models import Player, Team
+from ..directory import team_directory
+from .. import db, sharding
+from ..serializers import dumps
+
+# Adding blueprint to the routes
+export = Blueprint('export', __name__)
+
+# Rows fetched from the server-side cursor per batch
+BATCH_SIZE = 1000
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+# Exported resources: column names and the statement selecting them, as plain tuples
+EXPORTS = {
+    "players": (
+        ("id", "name", "team_id", "team"),
+        lambda: select(Player.id, Player.name, Player.team_id, Team.name)
+            .outerjoin(Team, Player.team_id == Team.id).order_by(Player.id),
+    ),
+    "teams": (
+        ("id", "name"),
+        lambda: select(Team.id, Team.name).order_by(Team.id),
+    ),
+}
+
+# Generator of encoded batches of rows, streamed from a server-side cursor so only one
+# batch is in memory at a time whatever the size of the table
+def stream_rows(engine, statement, columns, format, batch_size=BATCH_SIZE):
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+        yield from encode_batches(result.partitions(), columns, format)
+
+# Generator of the encoded batches of the players of every shard, merged in id order. Team
+# names come from the team directory, teams stay on the primary
+def stream_sharded_players(columns, format, batch_size=BATCH_SIZE):
+    team_names = team_directory.names(db.session)
+    rows = ((row.id, row.name, row.team_id, team_names.get(row.team_id)) for row in sharding.router.stream_players(batch_size))
+    yield from encode_batches(iter(lambda: list(islice(rows, batch_size)), []), columns, format)
+
+# Generator encoding batches of row tuples as CSV (with a header row) or NDJSON
+def encode_batches(batches, columns, format):
+    if format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for batch in batches:
+            writer.writerows(batch)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    else:
+        for batch in batches:
+            yield b"".join(dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+# Generator compressing a stream of chunks into a single gzip stream
+def gzip_stream(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# Compressing when ?gzip asks for it, otherwise when Accept-Encoding accepts gzip with a
+# quality above 0 (gzip;q=0 refuses it)
+def wants_gzip():
+    if request.args.get("gzip") is not None:
+        return request.args.get("gzip").lower() in ("1", "true", "yes")
+    return request.accept_encodings["gzip"] > 0
+
+# Route to export a whole resource as CSV or NDJSON
+@export.route('/export/<resource>', methods=['GET'])
+def export_resource(resource):
+    try:
+        if resource not in EXPORTS:
+            return jsonify({ "message": "Export Not Found" }), 404
+
+        format = request.args.get("format", "ndjson").lower()
+        if format not in FORMATS:
+            return jsonify({ "message": f"Format must be one of {', '.join(FORMATS)}" }), 400
+
+        columns, statement = EXPORTS[resource]
+        # Players are spread over the shards when SHARD_URLS is set
+        if resource == "players" and sharding.router is not None:
+            chunks = stream_sharded_players(columns, format)
+        else:
+            chunks = stream_rows(db.engine, statement(), columns, format)
+        headers = { "Content-Disposition": f"attachment; filename={resource}.{format}" }
+        # Without ?gzip the encoding follows Accept-Encoding, caches must key on it
+        if request.args.get("gzip") is None:
+            headers["Vary"] = "Accept-Encoding"
+        if wants_gzip():
+            chunks = gzip_stream(chunks)
+            headers["Content-Encoding"] = "gzip"
+
+        return Response(stream_with_context(chunks), mimetype=FORMATS[format], headers=headers)
+
+    except Exception as e:
+        return jsonify({"Error": "An Error occurred while exporting", "message": str(e) }), 500
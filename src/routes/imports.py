@@ -0,0 +1,218 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required
+from sqlalchemy import insert, update, bindparam
+import csv
+import gzip
+import io
+from ..models import Player, Team
+from ..db import session
+from ..cache import invalidate, PLAYERS_TAG, TEAMS_TAG, player_tag, team_tag
+from ..serializers import loads, Field
+from .. import counts, sharding
+from .players import team_moving
+
+# Adding blueprint to the routes
+imports = Blueprint('imports', __name__)
+
+# Rows upserted per transaction
+BATCH_SIZE = 1000
+
+# Rejected rows reported in detail, the others are only counted
+MAX_REPORTED_ERRORS = 100
+
+FIELDS = {
+    "id": Field("id", int),
+    "name": Field("name", str, required=True, max_length=100),
+    "team_id": Field("team_id", int),
+    "team": Field("team", str, max_length=100),
+}
+
+# Function returning the request body as a text stream, read lazily
+def body_stream():
+    stream = request.stream
+    if request.headers.get("Content-Encoding", "").lower() == "gzip":
+        stream = gzip.GzipFile(fileobj=stream, mode="rb")
+    return io.TextIOWrapper(stream, encoding="utf-8", newline="")
+
+# Generator of (line number, row dict or None, error) parsed one line at a time
+def parse_rows(text, format):
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {key: value or None for key, value in row.items() if key}, None
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = loads(line)
+            except ValueError as e:
+                yield line_number, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "must be a JSON object"
+                continue
+            yield line_number, row, None
+
+# Function validating a parsed row, returns (row, error)
+def validate_row(row):
+    clean = {}
+    for name, field in FIELDS.items():
+        value, error = field.validate(row.get(name))
+        if error:
+            return None, f"{name} {error}"
+        clean[name] = value
+    if clean["team_id"] is None and clean["team"] is None:
+        return None, "team or team_id is required"
+    return clean, None
+
+# Upserting players in batches, keeping only one batch and the team name -> id map in memory
+class PlayerImport:
+    def __init__(self, db, create_teams=False):
+        self.db = db
+        self.create_teams = create_teams
+        self.team_ids = {}
+        self.known_team_ids = set()
+        self.summary = { "inserted": 0, "updated": 0, "rejected": 0, "teams_created": 0, "errors": [] }
+
+    def reject(self, line_number, reason):
+        self.summary["rejected"] += 1
+        if len(self.summary["errors"]) < MAX_REPORTED_ERRORS:
+            self.summary["errors"].append({ "line": line_number, "reason": reason })
+
+    # Resolving every team name and id of a batch with one query each
+    def resolve_teams(self, batch):
+        names = {row["team"] for _, row in batch if row["team_id"] is None} - self.team_ids.keys()
+        if names:
+            self.team_ids.update(self.db.query(Team.name, Team.id).filter(Team.name.in_(names)))
+            missing = names - self.team_ids.keys()
+            if missing and self.create_teams:
+                self.db.execute(insert(Team), [{ "name": name } for name in missing])
+                self.team_ids.update(self.db.query(Team.name, Team.id).filter(Team.name.in_(missing)))
+                self.summary["teams_created"] += len(missing)
+
+        ids = {row["team_id"] for _, row in batch if row["team_id"] is not None} - self.known_team_ids
+        if ids:
+            self.known_team_ids.update(team_id for (team_id,) in self.db.query(Team.id).filter(Team.id.in_(ids)))
+
+    # Function returning id -> team id of the existing players among ids
+    def existing_teams(self, ids):
+        if sharding.router is not None:
+            return {row.id: row.team_id for row in sharding.router.players_by_id(ids)}
+        return dict(self.db.query(Player.id, Player.team_id).filter(Player.id.in_(ids)))
+
+    def write(self, updates, inserts):
+        if updates:
+            players_table = Player.__table__
+            self.db.execute(
+                update(players_table).where(players_table.c.id == bindparam("_id"))
+                    .values(name=bindparam("name"), team_id=bindparam("team_id"), version=players_table.c.version + 1),
+                updates,
+            )
+        with_id = [row for row in inserts if row["id"] is not None]
+        without_id = [{ "name": row["name"], "team_id": row["team_id"] } for row in inserts if row["id"] is None]
+        if with_id:
+            self.db.execute(insert(Player), with_id)
+        if without_id:
+            self.db.execute(insert(Player), without_id)
+        self.db.commit()
+
+    # Writing the players on the shards of their teams. The teams created by the batch are
+    # committed first, the shards copy them. Updates go one by one since a player changing
+    # team may change shard. Returns the updates applied, a player deleted meanwhile is skipped
+    def write_sharded(self, updates, inserts):
+        self.db.commit()
+        applied = [
+            row for row in updates
+            if sharding.router.update_player(row["_id"], row["name"], row["team_id"])[0] == sharding.UPDATED
+        ]
+        if inserts:
+            sharding.router.insert_players(inserts)
+        return applied
+
+    def import_batch(self, batch):
+        teams_created = self.summary["teams_created"]
+        self.resolve_teams(batch)
+
+        rows, rows_by_id = [], {}
+        for line_number, row in batch:
+            team_id = row["team_id"] if row["team_id"] is not None else self.team_ids.get(row["team"])
+            if team_id is None or (row["team_id"] is not None and team_id not in self.known_team_ids):
+                self.reject(line_number, "team does not exist")
+                continue
+            # The last row wins when a batch repeats an id
+            if row["id"] is not None:
+                rows_by_id[row["id"]] = { "id": row["id"], "name": row["name"], "team_id": team_id }
+            else:
+                rows.append({ "id": None, "name": row["name"], "team_id": team_id })
+        rows.extend(rows_by_id.values())
+
+        # Rows with the id of an existing player update it, the others are inserted
+        ids = [row["id"] for row in rows if row["id"] is not None]
+        existing = self.existing_teams(ids) if ids else {}
+        updates = [{ "_id": row["id"], "name": row["name"], "team_id": row["team_id"] } for row in rows if row["id"] in existing]
+        inserts = [row for row in rows if row["id"] not in existing]
+
+        if sharding.router is not None:
+            updates = self.write_sharded(updates, inserts)
+        else:
+            self.write(updates, inserts)
+
+        # Clearing the cached entries of the updated players and the rosters of the teams the
+        # players joined or left, batch by batch
+        tags = {player_tag(row["_id"]) for row in updates} | {team_tag(existing[row["_id"]]) for row in updates}
+        tags |= {team_tag(row["team_id"]) for row in rows}
+        if tags:
+            invalidate(*tags)
+        # Counting the committed rows in the totals
+        counts.adjust("players", len(inserts))
+        counts.adjust("teams", self.summary["teams_created"] - teams_created)
+
+        self.summary["updated"] += len(updates)
+        self.summary["inserted"] += len(inserts)
+
+    def run(self, parsed_rows):
+        batch = []
+        for line_number, row, error in parsed_rows:
+            if error is None:
+                row, error = validate_row(row)
+            if error is not None:
+                self.reject(line_number, error)
+                continue
+            batch.append((line_number, row))
+            if len(batch) >= BATCH_SIZE:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        return self.summary
+
+# Route to upload players as CSV (name,team or team_id[,id]) or NDJSON, upserting them
+@imports.route('/import/players', methods=['POST'])
+@jwt_required() # Protecting route with JWT Auth
+def import_players():
+    try:
+        format = request.args.get("format")
+        if format is None:
+            format = "csv" if request.mimetype == "text/csv" else "ndjson"
+        if format not in ("csv", "ndjson"):
+            return jsonify({ "message": "Format must be one of csv, ndjson" }), 400
+
+        create_teams = request.args.get("create_teams", "").lower() in ("1", "true", "yes")
+        try:
+            summary = PlayerImport(session, create_teams=create_teams).run(parse_rows(body_stream(), format))
+        except sharding.TeamMoving:
+            # The batches before the one of the moving team are imported, rows with an id can
+            # be sent again safely
+            session.rollback()
+            invalidate(PLAYERS_TAG, TEAMS_TAG)
+            return team_moving()
+
+        # Clearing every cached view depending on players, and teams if some were created
+        invalidate(PLAYERS_TAG, *([TEAMS_TAG] if summary["teams_created"] else []))
+
+        return jsonify(summary), 200
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({"Error": "An Error occurred while importing players", "message": str(e) }), 500
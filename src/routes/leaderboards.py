@@ -0,0 +1,159 @@
+from flask import Blueprint, request, jsonify, url_for
+from sqlalchemy import select, insert, update
+from sqlalchemy.exc import IntegrityError
+from ..models import Player, PlayerStats
+from ..db import session
+from ..cache import get_entities, player_key
+from ..serializers import PLAYER_STATS, dumps, loads, json_response
+from ..jobs import enqueue_rebuild_leaderboards
+from .. import leaderboards as boards, sharding
+from .players import load_players_by_id
+
+# Adding blueprint to the routes
+leaderboards = Blueprint('leaderboards', __name__)
+
+# Longest leaderboard page
+MAX_LIMIT = 100
+
+# Function applying stat increments to a player row in one statement, the row is created on
+# the first increment. Returns False if the row appeared concurrently and the update must be retried
+def increment_stats(player_id, increments):
+    stats_table = PlayerStats.__table__
+    updated = session.execute(
+        update(stats_table).where(stats_table.c.player_id == player_id)
+            .values({ stat: stats_table.c[stat] + value for stat, value in increments.items() })
+    ).rowcount
+    if updated:
+        return True
+    try:
+        session.execute(insert(stats_table).values(player_id=player_id, **increments))
+        return True
+    except IntegrityError:
+        session.rollback()
+        return False
+
+# Answer of the stats routes while players are sharded: stats rows reference the players
+# table of the primary database, which no longer holds them
+def stats_unavailable():
+    return jsonify({ "message": "Not Implemented: player stats are not available while players are sharded" }), 501
+
+# Route to get the stats of a player
+@leaderboards.route('/players/<int:_id>/stats', methods=['GET'])
+def get_player_stats(_id):
+    try:
+        if sharding.router is not None:
+            return stats_unavailable()
+
+        row = session.execute(
+            select(Player.id, PlayerStats.goals, PlayerStats.assists, PlayerStats.appearances)
+                .outerjoin(PlayerStats, PlayerStats.player_id == Player.id).where(Player.id == _id)
+        ).first()
+        if not row:
+            return jsonify({ "message": "Player Not Found" }), 404
+
+        # A player without stats has all of them at 0
+        return json_response(dumps(PLAYER_STATS.to_dict([value or 0 for value in row]))), 200
+
+    except Exception as e:
+        return jsonify({ "error": "Error fetching the player stats", "message": str(e) }), 500
+
+# Route to record stats of a player, the body holds increments (e.g. a match: goals,
+# assists and one appearance). The database and the leaderboards are updated atomically
+@leaderboards.route('/players/<int:_id>/stats', methods=['POST'])
+def record_player_stats(_id):
+    data, errors = PLAYER_STATS.validate(request.get_json(silent=True))
+    try:
+        if sharding.router is not None:
+            return stats_unavailable()
+
+        if errors or not any(data.values()):
+            return jsonify({ "message": "Bad Request: goals, assists or appearances increments are required", "errors": errors }), 400
+
+        team_id = session.execute(select(Player.team_id).where(Player.id == _id)).scalar()
+        if team_id is None:
+            return jsonify({ "message": "Player Not Found" }), 404
+
+        increments = { stat: value for stat, value in data.items() if value }
+        if not increment_stats(_id, increments) and not increment_stats(_id, increments):
+            # Nothing was written: the player was deleted since it was read (the insert broke
+            # the foreign key), or the row keeps racing. The leaderboards are left untouched
+            session.rollback()
+            if session.execute(select(Player.id).where(Player.id == _id)).scalar() is None:
+                return jsonify({ "message": "Player Not Found" }), 404
+            return jsonify({ "message": "Conflict: the stats of the player are being recorded concurrently, retry" }), 409
+        session.commit()
+
+        # Applying the committed increments to the leaderboards
+        boards.record(_id, team_id, increments)
+
+        return get_player_stats(_id)
+
+    except Exception as e:
+        session.rollback()
+        return jsonify({ "error": "Error recording the player stats", "message": str(e) }), 500
+
+def parse_team_id():
+    team_id = request.args.get("team_id")
+    return int(team_id) if team_id is not None else None
+
+# Route to get the top players of a leaderboard, global or of a team (?team_id=)
+@leaderboards.route('/leaderboards/<stat>', methods=['GET'])
+def get_leaderboard(stat):
+    try:
+        if stat not in boards.STATS:
+            return jsonify({ "message": f"Leaderboard must be one of {', '.join(boards.STATS)}" }), 404
+        try:
+            team_id = parse_team_id()
+            limit = min(int(request.args.get("limit", 10)), MAX_LIMIT)
+        except ValueError:
+            return jsonify({ "message": "Bad Request: team_id and limit must be integers" }), 400
+
+        ranking = boards.top(stat, team_id, limit)
+
+        # Players come from their cache entries, one MGET for the whole page
+        ids = [player_id for player_id, _ in ranking]
+        players, _ = get_entities(ids, player_key, lambda missing: load_players_by_id(session, missing)) if ids else ([], False)
+        entries = []
+        for position, ((player_id, score), player) in enumerate(zip(ranking, players), start=1):
+            player = loads(player) if player is not None else { "id": player_id }
+            entries.append({ "rank": position, "score": score, "player": player })
+
+        return jsonify({ "stat": stat, "team_id": team_id, "data": entries }), 200
+
+    except Exception as e:
+        return jsonify({ "error": "Error fetching the leaderboard", "message": str(e) }), 500
+
+# Route to get the rank of a player in a leaderboard, global and in its team
+@leaderboards.route('/leaderboards/<stat>/players/<int:_id>', methods=['GET'])
+def get_player_rank(stat, _id):
+    try:
+        if sharding.router is not None:
+            return stats_unavailable()
+
+        if stat not in boards.STATS:
+            return jsonify({ "message": f"Leaderboard must be one of {', '.join(boards.STATS)}" }), 404
+
+        team_id = session.execute(select(Player.team_id).where(Player.id == _id)).scalar()
+        if team_id is None:
+            return jsonify({ "message": "Player Not Found" }), 404
+
+        ranks = {}
+        for board, board_team_id in (("global", None), ("team", team_id)):
+            rank = boards.rank(stat, _id, board_team_id)
+            ranks[board] = { "rank": rank[0], "score": rank[1] } if rank else None
+
+        return jsonify({ "stat": stat, "player_id": _id, "team_id": team_id, **ranks }), 200
+
+    except Exception as e:
+        return jsonify({ "error": "Error fetching the player rank", "message": str(e) }), 500
+
+# Route to rebuild the leaderboards from the stats table, it runs in the job worker
+@leaderboards.route('/leaderboards/rebuild', methods=['POST'])
+def rebuild_leaderboards():
+    try:
+        job = enqueue_rebuild_leaderboards()
+        job['status_url'] = url_for('job_status', job_id=job['id'])
+        return jsonify(job), 202
+
+    except Exception as e:
+        return jsonify({ "error": "Error enqueuing the leaderboards rebuild", "message": str(e) }), 500
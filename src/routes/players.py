@@ -1,93 +1,147 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import update, select, exists
+from sqlalchemy.orm.exc import StaleDataError
 from ..models import Player, Team
-from ..cache import redis_client
+from ..cache import cached_view, get_cached, load_view, get_entities, invalidate, PLAYERS_KEY, PLAYERS_TAG, TEAMS_TAG, player_key, player_tag, team_tag
 from ..db import session
-import json
+from ..directory import team_directory
+from ..serializers import PLAYER, PLAYER_UPDATE, dumps, envelope, json_response, parse_ids, encode_entities
+from ..concurrency import etag, if_match_version, not_modified
+from .. import leaderboards, counts, sharding
 
 # Adding blueprint to the routes
 players = Blueprint('players', __name__)
 
-# Route to get all players
+# Loader of the cached players list, players embed their team name so it depends on teams too
+@cached_view(PLAYERS_KEY, tags=[PLAYERS_TAG, TEAMS_TAG])
+def load_players(db):
+    if sharding.router is not None:
+        rows = sharding.router.all_players()
+    else:
+        rows = db.query(Player.id, Player.name, Player.team_id).order_by(Player.id)
+    return PLAYER.to_list(rows, team=team_directory.names(db))
+
+# Loader of single players by id with one IN query, each one cached under its own tag and
+# the tag of its team, which embeds its name
+def load_players_by_id(db, ids):
+    team_names = team_directory.names(db)
+    if sharding.router is not None:
+        rows = sharding.router.players_by_id(ids)
+    else:
+        rows = db.query(Player.id, Player.name, Player.team_id).filter(Player.id.in_(ids))
+    return {
+        row.id: (dumps(PLAYER.to_dict(row, team=team_names)), [player_tag(row.id), team_tag(row.team_id)])
+        for row in rows
+    }
+
+# Route to get all players, or only some of them with ?ids=1,2,3
 @players.route('/players', methods=['GET'])
 def get_players():
     try:
+        if request.args.get("ids") is not None:
+            return get_players_by_id(request.args["ids"])
+
+        # Total number of players, if asked for
+        total = counts.exact_total(session, "players") if counts.wants_total() else None
+
         # Attempting to get data from cache
-        cached_data = redis_client.get("get_players")
+        players_data = get_cached(PLAYERS_KEY)
 
         # Retrieving data from cache
-        if cached_data:
-            players_data = json.loads(cached_data)
-            return jsonify({ "data": players_data, "source": "cache"})
+        if players_data is not None:
+            return json_response(envelope(players_data, "cache", total))
 
-        # Getting all players from the database
-        players = session.query(Player).all()
-        players_data = [player.to_dict() for player in players]
-
-        # Caching the data 
-        redis_client.set("get_players", json.dumps(players_data), ex=15)
+        # Getting all players from the database and caching them
+        players_data = load_view(PLAYERS_KEY, session)
 
         # Returning all players in JSON format
-        return jsonify({ "data": players_data, "source": "database"}), 200
+        return json_response(envelope(players_data, "database", total)), 200
     
     except Exception as e:
         return jsonify({"Error": "An Error occurred while fetching players", "message": str(e) }), 500
 
+# Function answering a multi-get: players in the order of the ids, unknown ids get a marker
+def get_players_by_id(value):
+    ids, error = parse_ids(value)
+    if error:
+        return jsonify({ "message": f"Bad Request: {error}" }), 400
+
+    entities, from_database = get_entities(ids, player_key, lambda missing: load_players_by_id(session, missing))
+    return json_response(envelope(encode_entities(ids, entities), "database" if from_database else "cache")), 200
+
 # Route to get one player    
 @players.route("/players/<int:_id>", methods=["GET"])
 def get_player(_id):
     try:
         # Getting the requested player
-        player = session.query(Player).filter_by(id=_id).first()
+        if sharding.router is not None:
+            player = sharding.router.find_player(_id)
+        else:
+            player = session.query(Player.id, Player.name, Player.team_id, Player.version).filter_by(id=_id).first()
 
         # Verifying if user exists 
         if not player:
             return jsonify({ "message": "Player Not Found" }), 404
+
+        # The client copy is still current
+        if not_modified(player.version):
+            return "", 304, { "ETag": etag(player.version) }
         
         # Getting team name instead of displaying team id
-        team = session.query(Team).filter_by(id=player.team_id).first()
-
-        # Returning user info if this one exists 
-        player_data = [{ "id" : player.id, "name": player.name, "team": team.name }]  
-
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_players")
+        team_names = { player.team_id: team_directory.name(player.team_id, session) }
 
-        # Returning the player in JSON format
-        return jsonify({ "data": player_data, "source": "database" }), 200
+        # Returning the player in JSON format, its version is the ETag
+        response = json_response(envelope(PLAYER.encode([player], team=team_names), "database"))
+        response.headers["ETag"] = etag(player.version)
+        return response, 200
 
     except Exception as e:
         return jsonify({ "error" : "Error fetching the player", "message" : str(e) }), 500
 
+# Answer to writes to the players of a team moving between shards, it only lasts the copy
+def team_moving():
+    response = jsonify({ "message": "Service Unavailable: the team of the player is being moved, retry later" })
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
 # Creating a new player
 @players.route("/players", methods=["POST"])
 def create_player():
 
-    # Getting data form body
-    data = request.get_json()
+    # Getting data form body and validating it
+    data, errors = PLAYER.validate(request.get_json(silent=True))
     team_id = data.get("team_id")
     name = data.get("name")
 
     try:
         # Checking if the name is empty
-        if name is None or team_id is None:
-            return jsonify({ "message": "Bad Request: Player name and Team are required"}), 400
+        if "is required" in errors.values():
+            return jsonify({ "message": "Bad Request: Player name and Team are required", "errors": errors }), 400
+        if errors:
+            return jsonify({ "message": "Bad Request: Invalid player data", "errors": errors }), 400
 
         # Checking if team exists before inserting 
-        team = session.query(Team).filter_by(id=team_id).first()
-        if not team: 
+        if not team_directory.exists(team_id, session): 
             return jsonify({ "message": "Player cannot be inserted since Team does not exist"}), 400 
         
-        # Inserting new player if everything is correct
-        new_player = Player(name=name, team_id=team_id)
-        session.add(new_player)
-        session.commit()
+        # Inserting new player if everything is correct, on the shard of its team when sharded
+        if sharding.router is not None:
+            sharding.router.insert_player(name, team_id)
+        else:
+            new_player = Player(name=name, team_id=team_id)
+            session.add(new_player)
+            session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_players")
+        # Clearing every cached view depending on players
+        invalidate(PLAYERS_TAG, team_tag(team_id))
+        counts.adjust("players", 1)
 
         # Returning successfully added message
         return jsonify({ "message": "Player created successfully" }), 200
-        
+
+    except sharding.TeamMoving:
+        return team_moving()
+
     except Exception as e:
         session.rollback()
         return jsonify({ "error": "Error inserting a new player", "message": str(e) }), 500
@@ -95,54 +149,111 @@ def create_player():
 # Route to update a Player 
 @players.route("/players/<int:_id>", methods=["PUT"])
 def update_player(_id):
-    # Getting data form body
-    data = request.get_json()
+    # Getting data form body and validating it
+    data, errors = PLAYER_UPDATE.validate(request.get_json(silent=True))
     team_id = data.get("team_id")
+    expected_version = if_match_version()
     
     try:
-        # Getting information about the player
-        player = session.query(Player).filter_by(id=_id).first()
-        if not player:
-            return jsonify({ "message": "Player Not Found"}), 404
+        if errors:
+            return jsonify({ "message": "Bad Request: Invalid player data", "errors": errors }), 400
+
+        # Updating the player in a single statement, only if it is still at the expected
+        # version and the new team exists. Only its team is read before, locked in the same
+        # transaction, so concurrent updates can never overwrite each other. The version always
+        # changes, so the affected row count is also right on MySQL where it only counts rows
+        # actually changed
+        players_table = Player.__table__
+        if sharding.router is not None:
+            outcome, player = sharding.router.update_player(_id, data.get("name"), team_id, expected_version)
+            updated = outcome == sharding.UPDATED
+            version = player.version if player is not None else None
+            old_team_id = player.team_id if player is not None else None
+        else:
+            old_team_id = session.execute(select(players_table.c.team_id).where(players_table.c.id == _id).with_for_update()).scalar()
+            statement = (
+                update(players_table)
+                .where(players_table.c.id == _id)
+                .where(exists().where(Team.__table__.c.id == team_id))
+                .values(name=data.get("name"), team_id=team_id, version=players_table.c.version + 1)
+            )
+            if expected_version is not None:
+                statement = statement.where(players_table.c.version == expected_version)
+            updated = session.execute(statement).rowcount
+            session.commit()
 
-        # Checking if the new team exists before inserting 
-        team = session.query(Team).filter_by(id=team_id).first()
-        if not team: 
+        # Nothing was updated, finding out why
+        if not updated:
+            if sharding.router is None:
+                version = session.execute(select(players_table.c.version).where(players_table.c.id == _id)).scalar()
+            if version is None:
+                return jsonify({ "message": "Player Not Found"}), 404
+            if expected_version is not None and version != expected_version:
+                return jsonify({ "message": "Precondition Failed: Player was modified by another request" }), 412, { "ETag": etag(version) }
             return jsonify({ "message": "Player cannot be updated since Team does not exist"}), 400 
-        
-        # Updating the current player
-        player.name = data.get("name")
-        player.team_id = team_id
-        session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_players")
+        # Clearing every cached view depending on players, the player itself and the rosters
+        # of its old and new teams
+        invalidate(PLAYERS_TAG, player_tag(_id), *{team_tag(old_team_id), team_tag(team_id)})
+
+        # Moving the player to the leaderboards of its team, if it is ranked
+        leaderboards.move_player(_id, team_id)
 
         # Returning successfully updated message
-        return jsonify({ "message": "Player updated successfully" }), 200
-        
+        response = jsonify({ "message": "Player updated successfully" })
+        if expected_version is not None:
+            response.headers["ETag"] = etag(expected_version + 1)
+        return response, 200
+
+    except sharding.TeamMoving:
+        return team_moving()
+
     except Exception as e:
         session.rollback()
         return jsonify({ "error": "Error updating the player", "message": str(e) }), 500
     
 @players.route("/players/<int:_id>", methods=["DELETE"])
 def delete_player(_id):
+    expected_version = if_match_version()
     try:
-        # Getting the player to delete
-        player = session.query(Player).filter_by(id=_id).first()
-        if not player: 
-            return jsonify({ "message": "Player Not Found"}), 404
+        if sharding.router is not None:
+            # Deleting the player from its shard, at the version that was read
+            outcome, player = sharding.router.delete_player(_id, expected_version)
+            if outcome == sharding.NOT_FOUND:
+                return jsonify({ "message": "Player Not Found"}), 404
+            if outcome == sharding.CONFLICT:
+                return jsonify({ "message": "Precondition Failed: Player was modified by another request" }), 412, { "ETag": etag(player.version) }
+            team_id = player.team_id
+        else:
+            # Getting the player to delete
+            player = session.query(Player).filter_by(id=_id).first()
+            if not player: 
+                return jsonify({ "message": "Player Not Found"}), 404
+
+            # Only deleting the version the client has seen
+            if expected_version is not None and player.version != expected_version:
+                return jsonify({ "message": "Precondition Failed: Player was modified by another request" }), 412, { "ETag": etag(player.version) }
 
-        # Deleting player
-        session.delete(player)
-        session.commit()
+            # Deleting player, the delete is conditional on the version that was read
+            team_id = player.team_id
+            session.delete(player)
+            session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_players")
+        # Clearing every cached view depending on players
+        invalidate(PLAYERS_TAG, player_tag(_id), team_tag(team_id))
+        leaderboards.remove_players(_id)
+        counts.adjust("players", -1)
 
         # Returning successfully deleted message
         return jsonify({ "message": "Player deleted successfully"}), 200
 
+    except StaleDataError:
+        session.rollback()
+        return jsonify({ "message": "Precondition Failed: Player was modified by another request" }), 412
+
+    except sharding.TeamMoving:
+        return team_moving()
+
     except Exception as e:
         session.rollback()
-        return jsonify({ "error": "Error deleting the player", "message": str(e) }), 500
\ No newline at end of file
+        return jsonify({ "error": "Error deleting the player", "message": str(e) }), 500
@@ -1,33 +1,96 @@
 from flask import Blueprint, request, jsonify
-from ..models import Team
-from ..cache import redis_client
+from sqlalchemy import update, select, delete
+from ..models import Team, Player
+from ..cache import cached_view, get_cached, set_cached, load_view, get_entities, invalidate, TEAMS_KEY, TEAMS_AND_PLAYERS_KEY, PLAYERS_TAG, TEAMS_TAG, team_key, team_players_key, team_tag, ENTITY_TTL
 from ..db import session
-import json
+from ..directory import team_directory
+from ..serializers import PLAYER, TEAM, dumps, envelope, json_response, parse_ids, encode_entities
+from ..concurrency import etag, if_match_version, not_modified
+from .. import leaderboards, counts, sharding
+from .players import team_moving
 
 # Adding blueprint to the routes
 teams = Blueprint('teams', __name__)
 
-# Route to get all teams
+# Loader of the cached teams list
+@cached_view(TEAMS_KEY, tags=[TEAMS_TAG])
+def load_teams(db):
+    return TEAM.to_list(db.query(Team.id, Team.name).order_by(Team.id))
+
+# Function grouping (id, name, team_id) player rows by team, teams in id order
+def build_rosters(team_names, players):
+    team_list = []
+    rosters = {}
+    for team_id, name in team_names.items():
+        team_data = { "id": team_id, "name": name, "players": [] }
+        rosters[team_id] = team_data["players"]
+        team_list.append(team_data)
+    for player in players:
+        if player.team_id in rosters:
+            rosters[player.team_id].append(PLAYER.to_dict(player, team=team_names))
+    return team_list
+
+# Loader of the cached rosters, they embed players so it depends on both
+@cached_view(TEAMS_AND_PLAYERS_KEY, tags=[TEAMS_TAG, PLAYERS_TAG])
+def load_teams_and_players(db):
+    # Teams come from the team directory and players from a single query, grouped by team
+    if sharding.router is not None:
+        players = sharding.router.all_players()
+    else:
+        players = db.query(Player.id, Player.name, Player.team_id).order_by(Player.id)
+    return build_rosters(team_directory.names(db), players)
+
+# Loader of single teams by id with one IN query, each one cached under its own tag
+def load_teams_by_id(db, ids):
+    rows = db.query(Team.id, Team.name).filter(Team.id.in_(ids))
+    return { row.id: (dumps(TEAM.to_dict(row)), [team_tag(row.id)]) for row in rows }
+
+# Loader of the roster of one team, the (team_id, id, name) index serves it without touching
+# the table. It is tagged with its team only: writes moving a player clear the rosters of its
+# old and new teams, renames clear the team. Returns None for unknown teams
+def load_team_players(db, team_id):
+    team_name = team_directory.name(team_id, db)
+    if team_name is None:
+        return None
+    if sharding.router is not None:
+        rows = sharding.router.players_of_team(team_id)
+    else:
+        rows = db.query(Player.id, Player.name, Player.team_id).filter(Player.team_id == team_id).order_by(Player.id).all()
+    data = dumps(PLAYER.to_list(rows, team={ team_id: team_name }))
+    set_cached(team_players_key(team_id), data, [team_tag(team_id)], ENTITY_TTL)
+    return data
+
+# Function answering a multi-get: teams in the order of the ids, unknown ids get a marker
+def get_teams_by_id(value):
+    ids, error = parse_ids(value)
+    if error:
+        return jsonify({ "message": f"Bad Request: {error}" }), 400
+
+    entities, from_database = get_entities(ids, team_key, lambda missing: load_teams_by_id(session, missing))
+    return json_response(envelope(encode_entities(ids, entities), "database" if from_database else "cache")), 200
+
+# Route to get all teams, or only some of them with ?ids=1,2,3
 @teams.route('/teams', methods=['GET'])
 def get_teams():
     try:
+        if request.args.get("ids") is not None:
+            return get_teams_by_id(request.args["ids"])
+
+        # Total number of teams, if asked for
+        total = counts.exact_total(session, "teams") if counts.wants_total() else None
+
         # Attempting to get data from cache
-        cached_data = redis_client.get("get_teams")
+        teams_data = get_cached(TEAMS_KEY)
 
         # Retrieving data from cache
-        if cached_data:
-            teams_data = json.loads(cached_data)
-            return jsonify({ "data": teams_data, "source": "cache"})
+        if teams_data is not None:
+            return json_response(envelope(teams_data, "cache", total))
 
-        # Getting all teams from the database
-        teams = session.query(Team).all()
-        teams_data = [team.to_dict() for team in teams]
-
-        # Caching the data 
-        redis_client.set("get_teams", json.dumps(teams_data), ex=15)
+        # Getting all teams from the database and caching them
+        teams_data = load_view(TEAMS_KEY, session)
 
         # Returning all teams in JSON format
-        return jsonify({ "data": teams_data, "source": "database"}), 200
+        return json_response(envelope(teams_data, "database", total)), 200
     
     except Exception as e:
         return jsonify({"Error": "An Error occurred while fetching teams", "message": str(e) }), 500
@@ -36,22 +99,26 @@ def get_teams():
 @teams.route('/teams', methods=['POST'])
 def create_team():
     try:
-        # Getting data from the request
-        data = request.get_json()
+        # Getting data from the request and validating it
+        data, errors = TEAM.validate(request.get_json(silent=True))
         name = data.get('name')
 
         # Cheching if the field name is in the json sent
-        if name is None:
-            return jsonify({ "message": "The team name is invalid"}), 400
+        if errors:
+            return jsonify({ "message": "The team name is invalid", "errors": errors }), 400
 
         # Creating a new team
         team = Team(name=name)
         session.add(team)
         session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_teams")
-        redis_client.delete("get_teams_and_players")
+        # Choosing the shard of its players
+        if sharding.router is not None:
+            sharding.router.place_team(team.id)
+
+        # Clearing every cached view depending on teams
+        invalidate(TEAMS_TAG)
+        counts.adjust("teams", 1)
 
         # Returning the new team in JSON format
         return jsonify({ "message": "Team Created Successfully", "Team": data}), 201
@@ -70,13 +137,13 @@ def get_team(_id):
         # Checking if team exists
         if not team:
             return jsonify({ "message": "Team Not Found" }), 404
+
+        # The client copy is still current
+        if not_modified(team.version):
+            return "", 304, { "ETag": etag(team.version) }
         
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_teams")
-        redis_client.delete("get_teams_and_players")
-        
-        # Returning the new team in JSON format
-        return jsonify({ "message": "Team Found Successfully", "Team": { 'name': team.name } }), 200
+        # Returning the new team in JSON format, its version is the ETag
+        return jsonify({ "message": "Team Found Successfully", "Team": { 'name': team.name } }), 200, { "ETag": etag(team.version) }
     
     except Exception as e:
         return jsonify({"Error": "An Error occurred while fetching a team", "message": str(e) }), 500
@@ -84,32 +151,43 @@ def get_team(_id):
 # Route to update a team
 @teams.route('/teams/<int:_id>', methods=['PUT'])
 def update_team(_id):
+    expected_version = if_match_version()
     try:
-        # Getting data from the request
-        data = request.get_json()
+        # Getting data from the request and validating it
+        data, errors = TEAM.validate(request.get_json(silent=True))
         new_name = data.get('name')
 
         # Validating if body is properly sent
-        if not new_name:
-            return jsonify({ "message": "Not a valid object" }), 400
-
-        # Getting the selected team
-        team = session.query(Team).filter_by(id=_id).first()
-
-        # Checking if team exists
-        if not team:
-            return jsonify({ "message": "Team Not Found" }), 404
+        if errors:
+            return jsonify({ "message": "Not a valid object", "errors": errors }), 400
 
-        # Updating the team
-        team.name = new_name
+        # Updating the team in a single statement, only if it is still at the expected version
+        teams_table = Team.__table__
+        statement = (
+            update(teams_table)
+            .where(teams_table.c.id == _id)
+            .values(name=new_name, version=teams_table.c.version + 1)
+        )
+        if expected_version is not None:
+            statement = statement.where(teams_table.c.version == expected_version)
+        updated = session.execute(statement).rowcount
         session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_teams")
-        redis_client.delete("get_teams_and_players")
+        # Nothing was updated, finding out why
+        if not updated:
+            version = session.execute(select(teams_table.c.version).where(teams_table.c.id == _id)).scalar()
+            if version is None:
+                return jsonify({ "message": "Team Not Found" }), 404
+            return jsonify({ "message": "Precondition Failed: Team was modified by another request" }), 412, { "ETag": etag(version) }
+
+        # Clearing every cached view depending on teams
+        invalidate(TEAMS_TAG, team_tag(_id))
 
         # Returning the updated team in JSON format
-        return jsonify({ "message": "Team Updated Successfully", "Team": { "id": team.id, "name": team.name }}), 200
+        response = jsonify({ "message": "Team Updated Successfully", "Team": { "id": _id, "name": new_name }})
+        if expected_version is not None:
+            response.headers["ETag"] = etag(expected_version + 1)
+        return response, 200
     
     except Exception as e:
         session.rollback()
@@ -118,54 +196,99 @@ def update_team(_id):
 # Route to delete a team
 @teams.route('/teams/<int:_id>', methods=['DELETE'])
 def delete_team(_id):
+    expected_version = if_match_version()
     try:
-        # Getting the selected team
-        team = session.query(Team).filter_by(id=_id).first()
+        # Deleting the team and its players with two set-based statements, the players are
+        # never loaded so the time does not depend on the roster size. The players are deleted
+        # explicitly because migration 0004 cannot add ON DELETE CASCADE on SQLite: its foreign
+        # keys are enforced (src/db.py) without cascading, so the team delete would fail
+        teams_table, players_table = Team.__table__, Player.__table__
 
-        # Checking if team exists
-        if not team:
-            return jsonify({ "message": "Team Not Found" }), 404
+        # Refusing the delete of a team being moved before anything is deleted
+        if sharding.router is not None:
+            sharding.router.writable_shard(_id)
 
-        # Deleting the team
-        session.delete(team)
+        statement = delete(teams_table).where(teams_table.c.id == _id)
+        if expected_version is not None:
+            statement = statement.where(teams_table.c.version == expected_version)
+        players_deleted = session.execute(delete(players_table).where(players_table.c.team_id == _id)).rowcount
+        deleted = session.execute(statement).rowcount
+
+        # Nothing was deleted, keeping the players and finding out why
+        if not deleted:
+            session.rollback()
+            version = session.execute(select(teams_table.c.version).where(teams_table.c.id == _id)).scalar()
+            if version is None:
+                # Deleting the players a previous delete left on the shard of the team, when
+                # it failed after the team was gone
+                leftovers = sharding.router.delete_team(_id) if sharding.router is not None else 0
+                if leftovers:
+                    invalidate(PLAYERS_TAG, team_tag(_id))
+                    counts.adjust("players", -leftovers)
+                return jsonify({ "message": "Team Not Found" }), 404
+            return jsonify({ "message": "Precondition Failed: Team was modified by another request" }), 412, { "ETag": etag(version) }
         session.commit()
 
-        # Clearing the cache for the get_teams endpoint
-        redis_client.delete("get_teams")
-        redis_client.delete("get_teams_and_players")
+        # The players of the team are on its shard, a failure here leaves them for a retry
+        if sharding.router is not None:
+            players_deleted += sharding.router.delete_team(_id)
+
+        # Clearing every cached view depending on the team or its players, cached players
+        # are tagged with their team so they all go with the team tag
+        invalidate(TEAMS_TAG, PLAYERS_TAG, team_tag(_id))
+        leaderboards.remove_team(_id)
+        counts.adjust("teams", -1)
+        counts.adjust("players", -players_deleted)
 
         # Returning success message
         return jsonify({ "message": "Team Deleted Successfully" }), 200
+
+    except sharding.TeamMoving:
+        session.rollback()
+        return team_moving()
     
     except Exception as e:
         session.rollback()
         return jsonify({"Error": "An Error occurred while deleting the team", "message": str(e) }), 500
     
+# Route to get the players of one team
+@teams.route('/teams/<int:_id>/players', methods=['GET'])
+def get_team_players(_id):
+    try:
+        # Number of players of the team, if asked for
+        total = counts.filtered_total(session, "players", "team_id", _id, [team_tag(_id)]) if counts.wants_total() else None
+
+        # Attempting to get data from cache
+        players_data = get_cached(team_players_key(_id))
+
+        if players_data is not None:
+            return json_response(envelope(players_data, "cache", total))
+
+        # Getting the players of the team from the database and caching them
+        players_data = load_team_players(session, _id)
+        if players_data is None:
+            return jsonify({ "message": "Team Not Found" }), 404
+
+        return json_response(envelope(players_data, "database", total)), 200
+
+    except Exception as e:
+        return jsonify({"Error": "An Error occurred while fetching the team players", "message": str(e) }), 500
+
 # Route to get all teams and their respective players
 @teams.route('/teams/players', methods=['GET'])
 def get_teams_and_players():
     try:
         # Attempting to get data from cache
-        cached_data = redis_client.get("get_teams_and_players")
-
-        if cached_data:
-            teams_data = json.loads(cached_data)
-            return jsonify({ "data": teams_data, "source": "cache"})
+        teams_data = get_cached(TEAMS_AND_PLAYERS_KEY)
 
-        # Getting all teams from the database
-        teams = session.query(Team).all()
-        team_list = []
-        for team in teams:
-            players = [player.to_dict() for player in team.player]
-            team_data = team.to_dict()
-            team_data["players"] = players
-            team_list.append(team_data)
+        if teams_data is not None:
+            return json_response(envelope(teams_data, "cache"))
 
-        # Caching the data 
-        redis_client.set("get_teams_and_players", json.dumps(team_list), ex=15)
+        # Getting all teams and their players from the database and caching them
+        team_list = load_view(TEAMS_AND_PLAYERS_KEY, session)
 
         # Returning all teams in JSON format
-        return jsonify({ "data": team_list, "source": "database"}), 200
+        return json_response(envelope(team_list, "database")), 200
     
     except Exception as e:
         return jsonify({"Error": "An Error occurred while fetching teams", "message": str(e) }), 500
\ No newline at end of file
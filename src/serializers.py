@@ -0,0 +1,167 @@
+import json
+from flask import Response
+from .tracing import span
+
+# orjson is used when installed, it encodes straight to bytes several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+# Function to encode a Python object to JSON bytes
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encoder.encode(obj).encode()
+
+# Function to decode JSON bytes or text
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Output column of a resource: the response key, read from the row at the same position,
+# optionally translated through a lookup mapping passed at encode time (e.g. team id -> name)
+class Column:
+    def __init__(self, name, lookup=None):
+        self.name = name
+        self.lookup = lookup
+
+# Input field of a resource, validated in request bodies
+class Field:
+    def __init__(self, name, type, required=False, max_length=None, min_value=None):
+        self.name = name
+        self.type = type
+        self.required = required
+        self.max_length = max_length
+        self.min_value = min_value
+
+    # Function returning (value, error), integers also accept numeric strings
+    def validate(self, value):
+        if value is None:
+            return None, "is required" if self.required else None
+        if self.type is int:
+            if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+                # isdigit also accepts digits int() does not parse, e.g. superscripts
+                try:
+                    value = int(value)
+                except ValueError:
+                    return None, "must be an integer"
+            if not isinstance(value, int) or isinstance(value, bool):
+                return None, "must be an integer"
+            if self.min_value is not None and value < self.min_value:
+                return None, f"must be at least {self.min_value}"
+        elif self.type is str:
+            if not isinstance(value, str):
+                return None, "must be a string"
+            if self.required and not value.strip():
+                return None, "is required"
+            if self.max_length is not None and len(value) > self.max_length:
+                return None, f"must be at most {self.max_length} characters"
+        return value, None
+
+# Schema of a resource. The row builder is compiled once, when the schema is declared, into
+# a function building the response dict straight from a row tuple, no ORM object involved
+class Schema:
+    def __init__(self, columns, fields=()):
+        self.columns = columns
+        self.fields = fields
+        self._build = self._compile()
+
+    def _compile(self):
+        items = []
+        for index, column in enumerate(self.columns):
+            value = f"row[{index}]"
+            if column.lookup is not None:
+                value = f"lookups[{column.lookup!r}].get({value})"
+            items.append(f"{column.name!r}: {value}")
+        source = f"def build(row, lookups):\n    return {{{', '.join(items)}}}\n"
+        namespace = {}
+        exec(compile(source, f"<schema {', '.join(c.name for c in self.columns)}>", "exec"), namespace)
+        return namespace["build"]
+
+    # Function building the dict of one row
+    def to_dict(self, row, **lookups):
+        return self._build(row, lookups)
+
+    # Function building the dicts of many rows
+    def to_list(self, rows, **lookups):
+        build = self._build
+        return [build(row, lookups) for row in rows]
+
+    # Function encoding many rows to JSON bytes
+    def encode(self, rows, **lookups):
+        with span("json.encode", schema=", ".join(column.name for column in self.columns)):
+            return dumps(self.to_list(rows, **lookups))
+
+    # Function validating a request body, returns (data, errors). Only declared fields are
+    # kept, absent optional fields are left out
+    def validate(self, body):
+        if not isinstance(body, dict):
+            return {}, {"body": "must be a JSON object"}
+        data, errors = {}, {}
+        for field in self.fields:
+            value, error = field.validate(body.get(field.name))
+            if error:
+                errors[field.name] = error
+            elif field.name in body:
+                data[field.name] = value
+        return data, errors
+
+# Schemas of the resources, rows are (id, name, team_id) for players and (id, name) for teams
+PLAYER = Schema(
+    columns=[Column("id"), Column("name"), Column("team", lookup="team")],
+    fields=[Field("name", str, required=True, max_length=100), Field("team_id", int, required=True)],
+)
+PLAYER_UPDATE = Schema(
+    columns=PLAYER.columns,
+    fields=[Field("name", str, max_length=100), Field("team_id", int)],
+)
+TEAM = Schema(
+    columns=[Column("id"), Column("name")],
+    fields=[Field("name", str, required=True, max_length=100)],
+)
+
+# Stats rows are (player_id, goals, assists, appearances), writes carry increments, which
+# never take a stat below zero
+PLAYER_STATS = Schema(
+    columns=[Column("player_id"), Column("goals"), Column("assists"), Column("appearances")],
+    fields=[Field("goals", int, min_value=0), Field("assists", int, min_value=0), Field("appearances", int, min_value=0)],
+)
+
+# Most ids a multi-get request can ask for
+MAX_IDS = 100
+
+# Function parsing a comma separated list of ids (e.g. ?ids=1,2,3), returns (ids, error)
+def parse_ids(value, max_ids=MAX_IDS):
+    try:
+        ids = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError:
+        return None, "ids must be a comma separated list of integers"
+    if not ids:
+        return None, "ids must not be empty"
+    if len(ids) > max_ids:
+        return None, f"at most {max_ids} ids can be requested at once"
+    return ids, None
+
+# Function encoding a list of entities already encoded, or None for the ids that were not
+# found, which get an explicit marker
+def encode_entities(ids, entities):
+    return b"[" + b",".join(
+        data if data is not None else dumps({"id": entity_id, "error": "Not Found"})
+        for entity_id, data in zip(ids, entities)
+    ) + b"]"
+
+# Function wrapping already encoded data in the response envelope, cached bytes are
+# spliced in as they are without decoding them. total is an optional (count, exact) pair
+def envelope(data, source, total=None):
+    body = b'{"data":' + data + b',"source":' + dumps(source)
+    if total is not None:
+        body += b',"total":' + dumps({"count": total[0], "exact": total[1]})
+    return body + b'}'
+
+# Function to build a JSON response from encoded bytes
+def json_response(body, status=200):
+    return Response(body, status=status, mimetype="application/json")
@@ -0,0 +1,427 @@
+import heapq
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import create_engine, event, select, insert, update, delete, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+from .cache import get_version, invalidate, SHARDS_TAG
+from .db import get_pool_options, enable_sqlite_foreign_keys
+from .migrate import upgrade
+from .models import Player, Team, TeamShard, PlayerId
+
+# Horizontal sharding of the players by team across the databases of SHARD_URLS. The primary
+# database (DATABASE_URL or MYSQL_*) keeps users, teams, the shard directory (team -> shard)
+# and the player id sequence. Teams without a directory row are on shard 0, so listing the
+# primary first keeps the existing players where they are. Each shard holds a copy of the
+# teams of its players (id and name) for the foreign key, names are always read from the
+# primary. Rows a shard holds for a team placed elsewhere (a move in progress or an
+# interrupted one) are never returned
+
+players_table = Player.__table__
+teams_table = Team.__table__
+PLAYER_COLUMNS = (players_table.c.id, players_table.c.name, players_table.c.team_id)
+
+# Players copied per statement when a team moves
+COPY_BATCH_SIZE = 1000
+
+# Outcomes of the writes, mirroring the answers of the routes
+UPDATED = "updated"
+DELETED = "deleted"
+NOT_FOUND = "not_found"
+CONFLICT = "conflict"
+NO_TEAM = "no_team"
+
+# Raised by writes to the players of a team being moved, they are retried once it has moved
+class TeamMoving(Exception):
+    pass
+
+# Generator dropping the second copy of a player from rows merged in id order. A player
+# changing to a team of another shard is on both shards, each copy owned by the shard of its
+# team, between the commit of the copy and the delete of the original
+def unique_players(rows):
+    last_id = None
+    for row in rows:
+        if row.id != last_id:
+            yield row
+        last_id = row.id
+
+class ShardRouter:
+    def __init__(self, urls, primary, move_grace=1.0):
+        self.primary = primary
+        self.engines = [self._engine(url) for url in urls]
+        self.sessions = [sessionmaker(bind=engine) for engine in self.engines]
+        self.executor = ThreadPoolExecutor(max_workers=len(self.engines), thread_name_prefix="shard")
+        # Time left to writes that read the directory before a move started
+        self.move_grace = move_grace
+        # (version, team id -> shard) swapped as a whole, like the team directory
+        self._placements = (None, {})
+        self._sequence_synced = False
+
+    def _engine(self, url):
+        if url == self.primary.url.render_as_string(hide_password=False):
+            return self.primary
+        engine = create_engine(url, **get_pool_options(url))
+        if url.startswith("sqlite"):
+            event.listen(engine, "connect", enable_sqlite_foreign_keys)
+        return engine
+
+    # Function applying the migrations to every shard, returns shard -> applied versions
+    def create_schema(self):
+        return {index: upgrade(engine) for index, engine in enumerate(self.engines)}
+
+    # Function returning the team id -> shard mapping, reloaded when a team is placed or moved
+    def placements(self):
+        version = get_version(SHARDS_TAG)
+        loaded_version, placements = self._placements
+        if version != loaded_version:
+            with self.primary.connect() as connection:
+                placements = dict(connection.execute(select(TeamShard.team_id, TeamShard.shard)).all())
+            self._placements = (version, placements)
+        return placements
+
+    def shard_of(self, team_id):
+        return self.placements().get(team_id, 0)
+
+    # Function returning the shard to write the players of a team to, read from the primary
+    # rather than the cached directory so a move is seen at once
+    def writable_shard(self, team_id):
+        with self.primary.connect() as connection:
+            row = connection.execute(
+                select(TeamShard.shard, TeamShard.state).where(TeamShard.team_id == team_id)
+            ).first()
+        if row is None:
+            return 0
+        if row.state == "moving":
+            raise TeamMoving(team_id)
+        return row.shard
+
+    # Function placing a new team, spreading teams by id
+    def place_team(self, team_id):
+        shard = team_id % len(self.engines)
+        with self.primary.begin() as connection:
+            connection.execute(insert(TeamShard.__table__).values(team_id=team_id, shard=shard, state="active"))
+        invalidate(SHARDS_TAG)
+        return shard
+
+    # Function running fn(session, shard) on every shard in parallel, returns the results in
+    # shard order
+    def fan_out(self, fn):
+        def run(index):
+            with self.sessions[index]() as db:
+                return fn(db, index)
+        return list(self.executor.map(run, range(len(self.engines))))
+
+    # Keeping the rows of the teams placed on the shard they come from
+    def _owned(self, rows, index):
+        placements = self.placements()
+        return [row for row in rows if placements.get(row.team_id, 0) == index]
+
+    # Function returning the (id, name, team_id) rows of every player in id order: each shard
+    # sorts its players and the sorted streams are merged
+    def all_players(self):
+        results = self.fan_out(lambda db, index: self._owned(
+            db.execute(select(*PLAYER_COLUMNS).order_by(players_table.c.id)).all(), index
+        ))
+        return list(unique_players(heapq.merge(*results, key=lambda row: row.id)))
+
+    # Generator of the (id, name, team_id) rows of every player in id order, read from a
+    # server-side cursor on each shard and merged as they come, so memory stays bounded
+    def stream_players(self, batch_size=COPY_BATCH_SIZE):
+        placements = self.placements()
+
+        def shard_rows(index):
+            with self.engines[index].connect() as connection:
+                result = connection.execution_options(stream_results=True, yield_per=batch_size).execute(
+                    select(*PLAYER_COLUMNS).order_by(players_table.c.id)
+                )
+                for row in result:
+                    if placements.get(row.team_id, 0) == index:
+                        yield row
+
+        return unique_players(heapq.merge(*(shard_rows(index) for index in range(len(self.engines))), key=lambda row: row.id))
+
+    def players_by_id(self, ids):
+        results = self.fan_out(lambda db, index: self._owned(
+            db.execute(select(*PLAYER_COLUMNS).where(players_table.c.id.in_(ids))).all(), index
+        ))
+        return list({row.id: row for rows in results for row in rows}.values())
+
+    def players_by_name(self, names):
+        results = self.fan_out(lambda db, index: self._owned(
+            db.execute(select(*PLAYER_COLUMNS).where(players_table.c.name.in_(names))).all(), index
+        ))
+        return [row for rows in results for row in rows]
+
+    def players_of_team(self, team_id):
+        with self.sessions[self.shard_of(team_id)]() as db:
+            return db.execute(
+                select(*PLAYER_COLUMNS).where(players_table.c.team_id == team_id).order_by(players_table.c.id)
+            ).all()
+
+    # Function returning the (id, name, team_id, version) row of a player, None if not found
+    def find_player(self, player_id):
+        results = self.fan_out(lambda db, index: self._owned(
+            db.execute(select(*PLAYER_COLUMNS, players_table.c.version).where(players_table.c.id == player_id)).all(),
+            index,
+        ))
+        return next((row for rows in results for row in rows), None)
+
+    def count_players_of_team(self, team_id):
+        with self.sessions[self.shard_of(team_id)]() as db:
+            return db.execute(select(func.count()).select_from(players_table).where(players_table.c.team_id == team_id)).scalar()
+
+    def count_players(self):
+        results = self.fan_out(lambda db, index: self._owned(
+            db.execute(select(players_table.c.team_id, func.count().label("players")).group_by(players_table.c.team_id)).all(),
+            index,
+        ))
+        return sum(row.players for rows in results for row in rows)
+
+    # Function moving the player id sequence past the players inserted without it, e.g. before
+    # sharding was enabled
+    def sync_sequence(self):
+        self._advance_sequence(max(self.fan_out(lambda db, index: db.execute(select(func.max(players_table.c.id))).scalar() or 0)))
+        self._sequence_synced = True
+
+    # Function moving the player id sequence past an id handed out without it
+    def _advance_sequence(self, last_id):
+        player_ids = PlayerId.__table__
+        try:
+            with self.primary.begin() as connection:
+                if (connection.execute(select(func.max(player_ids.c.id))).scalar() or 0) < last_id:
+                    connection.execute(insert(player_ids).values(id=last_id))
+        except IntegrityError:
+            pass
+
+    # Function handing out player ids unique across shards, in one transaction
+    def next_player_ids(self, count):
+        if not count:
+            return []
+        if not self._sequence_synced:
+            self.sync_sequence()
+        player_ids = PlayerId.__table__
+        with self.primary.begin() as connection:
+            ids = [connection.execute(insert(player_ids)).inserted_primary_key[0] for _ in range(count)]
+            # The last id is kept, the sequence never goes back
+            connection.execute(delete(player_ids).where(player_ids.c.id < max(ids)))
+        return ids
+
+    def next_player_id(self):
+        return self.next_player_ids(1)[0]
+
+    # Copying a team to a shard before writing its first players there
+    def _replicate_team(self, db, index, team_id):
+        if self.engines[index] is self.primary:
+            return
+        if db.execute(select(teams_table.c.id).where(teams_table.c.id == team_id)).first() is None:
+            with self.primary.connect() as connection:
+                name = connection.execute(select(teams_table.c.name).where(teams_table.c.id == team_id)).scalar()
+            db.execute(insert(teams_table).values(id=team_id, name=name))
+
+    def team_exists(self, team_id):
+        with self.primary.connect() as connection:
+            return connection.execute(select(teams_table.c.id).where(teams_table.c.id == team_id)).first() is not None
+
+    # Function inserting players on the shards of their teams, one statement per shard. Rows
+    # are dicts of name, team_id and optionally id (e.g. imported players), the others get
+    # ids from the sequence. With the (job id, chunk) marker of an import chunk, each shard
+    # records it with its rows and a shard that already has it is skipped. Returns the ids of
+    # the rows in order, None for the skipped ones
+    def insert_players(self, rows, marker=None):
+        shards = {team_id: self.writable_shard(team_id) for team_id in {row["team_id"] for row in rows}}
+        given_ids = [row["id"] for row in rows if row.get("id") is not None]
+        if given_ids:
+            self._advance_sequence(max(given_ids))
+        new_ids = iter(self.next_player_ids(len(rows) - len(given_ids)))
+
+        ids, shard_rows = [], {}
+        for row in rows:
+            player_id = row["id"] if row.get("id") is not None else next(new_ids)
+            ids.append(player_id)
+            shard_rows.setdefault(shards[row["team_id"]], []).append({ "id": player_id, "name": row["name"], "team_id": row["team_id"] })
+        from .populatedb import chunk_written, mark_chunk_written
+        skipped = set()
+        for index, values in shard_rows.items():
+            with self.sessions[index]() as db:
+                if marker is not None and chunk_written(db, marker):
+                    skipped.update(row["id"] for row in values)
+                    continue
+                for team_id in {row["team_id"] for row in values}:
+                    self._replicate_team(db, index, team_id)
+                db.execute(insert(players_table), values)
+                if marker is not None:
+                    mark_chunk_written(db, marker)
+                db.commit()
+        return [player_id if player_id not in skipped else None for player_id in ids]
+
+    def insert_player(self, name, team_id):
+        return self.insert_players([{ "name": name, "team_id": team_id }])[0]
+
+    # Function updating a player, only at the expected version if given. A player changing to
+    # a team of another shard is copied there, then deleted from its shard at the version that
+    # was read. A player written concurrently is read again, unless a version was expected.
+    # Returns (outcome, (id, name, team_id, version) row of the player as read before the write)
+    def update_player(self, player_id, name, team_id, expected_version=None):
+        player = self.find_player(player_id)
+        if player is None:
+            return NOT_FOUND, None
+        if expected_version is not None and player.version != expected_version:
+            return CONFLICT, player
+        if team_id is None or not self.team_exists(team_id):
+            return NO_TEAM, player
+
+        source, target = self.writable_shard(player.team_id), self.writable_shard(team_id)
+        values = { "name": name, "team_id": team_id, "version": player.version + 1 }
+        at_version = (players_table.c.id == player_id) & (players_table.c.version == player.version)
+
+        if source == target:
+            with self.sessions[source]() as db:
+                updated = db.execute(update(players_table).where(at_version).values(**values)).rowcount
+                db.commit()
+            if updated:
+                return UPDATED, player
+            return self._concurrent_update(player_id, name, team_id, expected_version)
+
+        with self.sessions[target]() as db:
+            self._replicate_team(db, target, team_id)
+            db.execute(insert(players_table).values(id=player_id, **values))
+            db.commit()
+        with self.sessions[source]() as db:
+            deleted = db.execute(delete(players_table).where(at_version)).rowcount
+            db.commit()
+        if not deleted:
+            # Updated concurrently, dropping the copy
+            with self.sessions[target]() as db:
+                db.execute(delete(players_table).where(players_table.c.id == player_id))
+                db.commit()
+            return self._concurrent_update(player_id, name, team_id, expected_version)
+        return UPDATED, player
+
+    def _concurrent_update(self, player_id, name, team_id, expected_version):
+        if expected_version is None:
+            return self.update_player(player_id, name, team_id)
+        player = self.find_player(player_id)
+        return (CONFLICT, player) if player is not None else (NOT_FOUND, None)
+
+    # Function deleting a player, only at the expected version if given. Returns (outcome,
+    # (id, name, team_id, version) row of the player deleted or found)
+    def delete_player(self, player_id, expected_version=None):
+        player = self.find_player(player_id)
+        if player is None:
+            return NOT_FOUND, None
+        if expected_version is not None and player.version != expected_version:
+            return CONFLICT, player
+
+        with self.sessions[self.writable_shard(player.team_id)]() as db:
+            deleted = db.execute(delete(players_table).where(
+                (players_table.c.id == player_id) & (players_table.c.version == player.version)
+            )).rowcount
+            db.commit()
+        if deleted:
+            return DELETED, player
+        # Written concurrently, reading it again
+        return self.delete_player(player_id, expected_version)
+
+    # Function deleting the players of a deleted team and its directory row, returns the
+    # number of deleted players. Running it again deletes what an interrupted run left
+    def delete_team(self, team_id):
+        index = self.writable_shard(team_id)
+        with self.sessions[index]() as db:
+            deleted = db.execute(delete(players_table).where(players_table.c.team_id == team_id)).rowcount
+            if self.engines[index] is not self.primary:
+                db.execute(delete(teams_table).where(teams_table.c.id == team_id))
+            db.commit()
+        with self.primary.begin() as connection:
+            placed = connection.execute(delete(TeamShard.__table__).where(TeamShard.team_id == team_id)).rowcount
+        if placed:
+            invalidate(SHARDS_TAG)
+        return deleted
+
+    def _set_placement(self, team_id, shard, state):
+        directory = TeamShard.__table__
+        with self.primary.begin() as connection:
+            updated = connection.execute(
+                update(directory).where(directory.c.team_id == team_id).values(shard=shard, state=state)
+            ).rowcount
+            if not updated:
+                connection.execute(insert(directory).values(team_id=team_id, shard=shard, state=state))
+        invalidate(SHARDS_TAG)
+
+    # Function moving the players of a team to another shard while it keeps serving reads.
+    # Writes to the team are refused (TeamMoving) during the copy, readers keep reading the
+    # source until the directory points to the target. Returns the number of moved players
+    def move_team(self, team_id, target):
+        if not 0 <= target < len(self.engines):
+            raise ValueError(f"Shard {target} does not exist, there are {len(self.engines)} shards")
+        source = self.writable_shard(team_id)
+        if source == target:
+            return 0
+
+        self._set_placement(team_id, source, "moving")
+        time.sleep(self.move_grace)
+        moved = 0
+        try:
+            with self.sessions[source]() as source_db, self.sessions[target]() as target_db:
+                # Leftovers of an interrupted move
+                target_db.execute(delete(players_table).where(players_table.c.team_id == team_id))
+                self._replicate_team(target_db, target, team_id)
+
+                # Copying in id order, one batch per statement
+                columns = (*PLAYER_COLUMNS, players_table.c.version)
+                last_id = None
+                while True:
+                    statement = select(*columns).where(players_table.c.team_id == team_id).order_by(players_table.c.id).limit(COPY_BATCH_SIZE)
+                    if last_id is not None:
+                        statement = statement.where(players_table.c.id > last_id)
+                    rows = source_db.execute(statement).all()
+                    if not rows:
+                        break
+                    target_db.execute(insert(players_table), [row._asdict() for row in rows])
+                    moved += len(rows)
+                    last_id = rows[-1].id
+                target_db.commit()
+        except Exception:
+            self._set_placement(team_id, source, "active")
+            raise
+
+        # The target serves the team from now on, then the source copies are dropped
+        self._set_placement(team_id, target, "active")
+        with self.sessions[source]() as db:
+            db.execute(delete(players_table).where(players_table.c.team_id == team_id))
+            if self.engines[source] is not self.primary:
+                db.execute(delete(teams_table).where(teams_table.c.id == team_id))
+            db.commit()
+        return moved
+
+# Router of the app, None when SHARD_URLS is not set (single database)
+router = None
+
+# Function returning the databases of SHARD_URLS (comma separated database URLs)
+def shard_urls():
+    return [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+
+# Function to set up the shard router from SHARD_URLS, no connection is opened here
+def init_sharding(primary):
+    global router
+    urls = shard_urls()
+    if router is None and urls:
+        router = ShardRouter(urls, primary, move_grace=float(os.getenv("SHARD_MOVE_GRACE", 1.0)))
+    return router
+
+# Moving a team between shards: python -m src.sharding move TEAM_ID SHARD
+if __name__ == '__main__':
+    import argparse
+    from . import create_app
+
+    parser = argparse.ArgumentParser(prog='python -m src.sharding')
+    commands = parser.add_subparsers(dest='command', required=True)
+    move_parser = commands.add_parser('move', help='move the players of a team to another shard')
+    move_parser.add_argument('team_id', type=int)
+    move_parser.add_argument('shard', type=int)
+    args = parser.parse_args()
+
+    create_app()
+    if router is None:
+        parser.error('SHARD_URLS is not set')
+    print(f'Moved {router.move_team(args.team_id, args.shard)} players of team {args.team_id} to shard {args.shard}')
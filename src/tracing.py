@@ -0,0 +1,269 @@
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Lightweight request tracing. A sampled request gets a root span, the route handler, every
+# SQL statement, every Redis command and JSON encoding get child spans, and the whole trace
+# is handed to the exporter when the request ends. The trace context comes from the W3C
+# traceparent header set by nginx. Requests that are not sampled only pay for one context
+# variable lookup per instrumented call
+
+# Current span of the running request (thread, greenlet or task), None when not sampled
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Longest SQL statement text kept on a span
+MAX_STATEMENT_LENGTH = 500
+
+def new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+class Span:
+    def __init__(self, name, trace_id, parent_id, spans, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = None
+        # Spans of the trace, shared by every span of the request
+        self.spans = spans
+        self._token = None
+
+    def child(self, name, **attributes):
+        return Span(name, self.trace_id, self.span_id, self.spans, attributes)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end(exc)
+        _current_span.reset(self._token)
+        return False
+
+    def end(self, exc=None):
+        self.duration = time.perf_counter() - self._started
+        if exc is not None:
+            self.error = f"{type(exc).__name__}: {exc}"
+        self.spans.append(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+# Shared no-op span of the requests that are not sampled
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+NOOP_SPAN = _NoopSpan()
+
+# Function to open a child span of the current one, a no-op outside sampled requests
+def span(name, **attributes):
+    parent = _current_span.get()
+    if parent is None:
+        return NOOP_SPAN
+    return parent.child(name, **attributes)
+
+# Decorator tracing every call of a function as a span
+def traced(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Exporters receive the finished spans of one trace
+class StdoutExporter:
+    def export(self, spans):
+        sys.stdout.write("".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans))
+        sys.stdout.flush()
+
+class FileExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+# Head-based sampling: the decision is taken once per request, when it starts. A request whose
+# traceparent is flagged as sampled is always traced, so a trace is never missing parts
+class Sampler:
+    def __init__(self, rate):
+        self.rate = rate
+
+    def should_sample(self, parent_sampled):
+        return parent_sampled or random.random() < self.rate
+
+class Tracer:
+    def __init__(self, exporter, sampler):
+        self.exporter = exporter
+        self.sampler = sampler
+
+    # Function starting the root span of a request, None when it is not sampled
+    def start_request(self, name, traceparent=None, **attributes):
+        trace_id, parent_id, parent_sampled = None, None, False
+        match = TRACEPARENT.match((traceparent or "").strip().lower())
+        if match and match.group(1) != "0" * 32:
+            trace_id, parent_id, parent_sampled = match.group(1), match.group(2), int(match.group(3), 16) & 1 == 1
+        if not self.sampler.should_sample(parent_sampled):
+            return None
+        root = Span(name, trace_id or new_id(128), parent_id, [], attributes)
+        root._token = _current_span.set(root)
+        return root
+
+    def end_request(self, root, exc=None):
+        root.end(exc)
+        try:
+            _current_span.reset(root._token)
+        except ValueError:
+            # Ended from another context than the one it started in
+            _current_span.set(None)
+        try:
+            self.exporter.export(root.spans)
+        except Exception as e:
+            print(f"Error exporting trace {root.trace_id}: {e}")
+
+# Function building the exporter from TRACE_EXPORTER: stdout or file:<path>
+def exporter_from_env():
+    value = os.getenv("TRACE_EXPORTER", "")
+    if value == "stdout":
+        return StdoutExporter()
+    if value.startswith("file:"):
+        return FileExporter(value[len("file:"):])
+    return None
+
+# SQL statements, each one a span with its text
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    parent = _current_span.get()
+    if parent is not None:
+        context._trace_span = parent.child("db.query", statement=statement[:MAX_STATEMENT_LENGTH], executemany=executemany)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace_span = getattr(context, "_trace_span", None)
+    if trace_span is not None:
+        trace_span.attributes["rows"] = cursor.rowcount
+        trace_span.end()
+
+def _handle_error(exception_context):
+    context = exception_context.execution_context
+    trace_span = getattr(context, "_trace_span", None) if context is not None else None
+    if trace_span is not None:
+        trace_span.end(exception_context.original_exception)
+
+_db_instrumented = False
+
+def instrument_sqlalchemy():
+    global _db_instrumented
+    if not _db_instrumented:
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+        _db_instrumented = True
+
+# Redis commands of a client, each command (or pipeline) a span with the command names
+def instrument_redis(client):
+    if getattr(client, "_traced", False):
+        return client
+    execute_command = client.execute_command
+    pipeline = client.pipeline
+
+    def traced_execute_command(*args, **options):
+        with span("redis", command=str(args[0])):
+            return execute_command(*args, **options)
+
+    def traced_pipeline(*args, **kwargs):
+        pipe = pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def traced_execute(*execute_args, **execute_kwargs):
+            with span("redis.pipeline", commands=[str(command[0][0]) for command in pipe.command_stack]):
+                return execute(*execute_args, **execute_kwargs)
+
+        pipe.execute = traced_execute
+        return pipe
+
+    client.execute_command = traced_execute_command
+    client.pipeline = traced_pipeline
+    client._traced = True
+    return client
+
+# Tracer of the process, set by init_tracing() when TRACE_EXPORTER is configured
+tracer = None
+
+# Function enabling tracing on the app: TRACE_EXPORTER picks the exporter (stdout or
+# file:<path>), TRACE_SAMPLE_RATE the share of requests traced (default 0.01). Without an
+# exporter nothing is instrumented at all. Called once the blueprints are registered
+def init_tracing(app, exporter=None):
+    global tracer
+    from flask import g, request
+    from .cache import get_redis
+
+    exporter = exporter or exporter_from_env()
+    if exporter is None:
+        return None
+    tracer = Tracer(exporter, Sampler(float(os.getenv("TRACE_SAMPLE_RATE", 0.01))))
+
+    instrument_sqlalchemy()
+    instrument_redis(get_redis())
+
+    def start_trace():
+        root = tracer.start_request(
+            f"{request.method} {request.url_rule.rule if request.url_rule else request.path}",
+            request.headers.get("traceparent"),
+            method=request.method,
+            path=request.path,
+        )
+        if root is not None:
+            g.trace_root = root
+
+    def add_trace_headers(response):
+        root = g.get("trace_root")
+        if root is not None:
+            root.attributes["status"] = response.status_code
+            response.headers["traceparent"] = f"00-{root.trace_id}-{root.span_id}-01"
+        return response
+
+    def end_trace(exception=None):
+        root = g.pop("trace_root", None)
+        if root is not None:
+            tracer.end_request(root, exception)
+
+    # The trace starts before every other hook (rate limiting, admission) and ends last
+    app.before_request_funcs.setdefault(None, []).insert(0, start_trace)
+    app.after_request(add_trace_headers)
+    app.teardown_request(end_trace)
+
+    # Route handlers get their own span, apart from the hooks around them
+    for endpoint, view in list(app.view_functions.items()):
+        app.view_functions[endpoint] = traced(f"handler {endpoint}")(view)
+    return tracer
@@ -0,0 +1,42 @@
+import pytest
+import json
+from main import app
+from unittest.mock import patch
+
+# Admission control of the app
+admission = app.extensions["admission"]
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture holding every slot of the worker, as requests in flight would, with a short wait
+@pytest.fixture
+def saturated():
+    for _ in range(admission.max_in_flight):
+        admission._slots.acquire()
+    with patch.object(admission, "wait_budget", 0.01):
+        yield admission
+    for _ in range(admission.max_in_flight):
+        admission._slots.release()
+
+# Testing requests past the slots are shed with a 503 and a Retry-After [GET /api/teams]
+def test_shed_when_saturated(client, saturated):
+    response = client.get("/api/teams")
+    assert response.status_code == 503
+    assert response.headers.get("Retry-After") == "1"
+    assert "overloaded" in json.loads(response.data).get("message")
+
+    # The probes still answer
+    assert client.get("/health").status_code == 200
+
+# Testing a request gives its slot back once answered
+def test_slot_released(client):
+    assert client.get("/api/teams").status_code == 200
+    for _ in range(admission.max_in_flight):
+        assert admission._slots.acquire(blocking=False)
+    assert not admission._slots.acquire(blocking=False)
+    for _ in range(admission.max_in_flight):
+        admission._slots.release()
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import uuid
+import main # Creating the Flask app loads the environment (.env)
+from src.db import session
+from src.models import Team
+from src.cache import get_redis, invalidate, PLAYERS_TAG, TEAMS_TAG
+from src.counts import count_key
+from src.aio.app import app as asgi_app
+from src.aio import db as aio_db, cache as aio_cache
+
+# Function sending one request to the ASGI app, returns (status, headers, JSON body)
+def request(method, path, body=None, headers=None):
+    async def send_request():
+        messages = []
+
+        async def receive():
+            return { "type": "http.request", "body": json.dumps(body).encode() if body is not None else b"", "more_body": False }
+
+        async def send(message):
+            messages.append(message)
+
+        route_path, _, query = path.partition("?")
+        scope = { "type": "http", "method": method, "path": route_path, "query_string": query.encode(),
+                  "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()] }
+        try:
+            await asgi_app(scope, receive, send)
+        finally:
+            # Every test runs its own event loop, the clients are bound to it
+            await aio_db.dispose_db()
+            await aio_cache.close_cache()
+
+        response_headers = { name.decode(): value.decode() for name, value in messages[0]["headers"] }
+        data = messages[1]["body"]
+        return messages[0]["status"], response_headers, json.loads(data) if data else None
+
+    return asyncio.run(send_request())
+
+# Function getting a URL from the Flask app, returns (status, JSON body)
+def flask_request(path, headers=None):
+    with main.app.test_client() as client:
+        response = client.get(path, headers=headers)
+        return response.status_code, json.loads(response.data) if response.data else None
+
+def insert_team():
+    team = Team(name = f"Team_{uuid.uuid4()}")
+    session.add(team)
+    session.commit()
+    return team.id
+
+# Testing player creation and reads through the ASGI app
+def test_create_and_get_player():
+    _team_id = insert_team()
+    _name = f"Player_{uuid.uuid4()}"
+
+    status, _, data = request("POST", "/api/players", { "name": _name, "team_id": _team_id })
+    assert status == 200
+    assert data.get("message") == "Player created successfully"
+
+    # The new player is in the list, recomputed since the creation invalidated it
+    status, _, data = request("GET", "/api/players")
+    assert status == 200
+    player = next(player for player in data.get("data") if player.get("name") == _name)
+
+    # The single player comes with its ETag
+    status, headers, data = request("GET", f"/api/players/{player['id']}")
+    assert status == 200
+    assert data.get("data")[0].get("name") == _name
+    assert headers.get("ETag") == '"1"'
+
+# Testing creation errors match the Flask app
+def test_create_player_errors():
+    status, _, data = request("POST", "/api/players", { "name": "No Team" })
+    assert status == 400
+    assert data.get("message") == "Bad Request: Player name and Team are required"
+
+    status, _, data = request("POST", "/api/players", { "name": "Unknown Team", "team_id": insert_team() + 1000000 })
+    assert status == 400
+    assert "Team does not exist" in data.get("message")
+
+# Testing unknown routes and methods
+def test_not_found():
+    assert request("GET", "/api/unknown")[0] == 404
+    assert request("DELETE", "/api/teams")[0] == 405
+    assert request("GET", f"/api/teams/{insert_team() + 1000000}")[0] == 404
+
+# Testing the player routes are refused while players are sharded, teams are still served
+def test_player_routes_refused_sharded(monkeypatch):
+    monkeypatch.setenv("SHARD_URLS", "sqlite:///shard_0.db,sqlite:///shard_1.db")
+    status, _, data = request("POST", "/api/players", { "name": "Sharded", "team_id": insert_team() })
+    assert status == 501
+    assert "sharded" in data.get("message")
+    assert request("GET", "/api/players")[0] == 501
+    assert request("GET", "/api/teams")[0] == 200
+
+# Testing query strings get the same answers as from the Flask app [?ids= and ?total=1]
+def test_query_strings_match_flask():
+    _team_id = insert_team()
+    request("POST", "/api/players", { "name": f"Player_{uuid.uuid4()}", "team_id": _team_id })
+    player_id = flask_request("/api/players")[1].get("data")[-1].get("id")
+
+    for path in (f"/api/players?ids={player_id},999999999", f"/api/teams?ids={_team_id}", "/api/players?ids=a,b",
+                 "/api/players?total=1", "/api/teams?total=1"):
+        flask_status, flask_data = flask_request(path)
+        status, _, data = request("GET", path)
+        assert status == flask_status
+        # Only where the data was read from differs between the first and second read
+        data.pop("source", None)
+        flask_data.pop("source", None)
+        assert data == flask_data
+
+    # Both apps answer 304 to any of the ETags listed in If-None-Match
+    headers = { "If-None-Match": 'W/"0", "1"' }
+    assert request("GET", f"/api/teams/{_team_id}", headers=headers)[0] == 304
+    assert flask_request(f"/api/teams/{_team_id}", headers=headers)[0] == 304
+
+    # Leaving no cached view or counter behind, the other tests insert rows directly
+    invalidate(PLAYERS_TAG, TEAMS_TAG)
+    get_redis().delete(count_key("players"), count_key("teams"))
@@ -0,0 +1,109 @@
+import pytest
+import json
+import uuid
+from main import app
+from unittest.mock import patch
+from src.db import session
+from src.models import Player, Team
+from src.routes import batch
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture creating a team with two players, returns (team id, player ids)
+@pytest.fixture
+def roster(client):
+    team_name = f"Team_{uuid.uuid4()}"
+    client.post("/api/teams", json={ "name": team_name })
+    team_id = session.query(Team).filter_by(name=team_name).first().id
+    players = [Player(name=f"Player_{uuid.uuid4().hex[:8]}", team_id=team_id) for _ in range(2)]
+    session.add_all(players)
+    session.commit()
+    yield team_id, [player.id for player in players]
+
+def run_batch(client, *paths):
+    response = client.post("/api/batch", json={ "requests": [{ "id": index, "path": path } for index, path in enumerate(paths)] })
+    return response.status_code, json.loads(response.data).get("responses")
+
+# Testing sub-requests answer like their routes, in request order [POST /batch endpoint]
+def test_batch(client, roster):
+    team_id, player_ids = roster
+    status, responses = run_batch(
+        client, "/api/teams", f"/api/players/{player_ids[0]}", f"/api/teams/{team_id}",
+        f"/api/teams/{team_id}/players", "/api/players/999999999",
+    )
+    assert status == 200
+    assert [response["id"] for response in responses] == [0, 1, 2, 3, 4]
+    assert [response["status"] for response in responses] == [200, 200, 200, 200, 404]
+
+    # Same bodies as the routes themselves
+    player = json.loads(client.get(f"/api/players/{player_ids[0]}").data)
+    assert responses[1]["body"]["data"] == player["data"]
+    assert responses[2]["body"] == json.loads(client.get(f"/api/teams/{team_id}").data)
+    assert [p["id"] for p in responses[3]["body"]["data"]] == player_ids
+    assert responses[4]["body"] == { "message": "Player Not Found" }
+
+# Testing identical sub-requests run once and single players are loaded together
+def test_batch_dedupe_and_dataloader(client, roster):
+    team_id, player_ids = roster
+    paths = [f"/api/players/{player_ids[0]}", f"/api/players/{player_ids[1]}", f"/api/players/{player_ids[0]}",
+             f"/api/teams/{team_id}/players", f"/api/teams/{team_id}/players"]
+
+    with patch("src.routes.batch.get_entities", wraps=batch.get_entities) as mock_get_entities, \
+         patch("src.routes.batch.dispatch", wraps=batch.dispatch) as mock_dispatch:
+        status, responses = run_batch(client, *paths)
+
+    assert status == 200
+    assert [response["body"]["data"][0]["id"] for response in responses[:3]] == [player_ids[0], player_ids[1], player_ids[0]]
+    assert mock_get_entities.call_count == 1
+    assert mock_get_entities.call_args.args[0] == player_ids
+    assert mock_dispatch.call_count == 1
+    assert responses[3]["body"] == responses[4]["body"]
+
+# Testing invalid batches [400]
+def test_batch_invalid(client):
+    assert client.post("/api/batch", json={ "requests": [] }).status_code == 400
+    assert client.post("/api/batch", json={ "requests": [{ "path": "/api/teams" }] * 21 }).status_code == 400
+    assert client.post("/api/batch", json={ "requests": [{ "method": "POST", "path": "/api/teams" }] }).status_code == 400
+
+    status, responses = run_batch(client, "/api/unknown", "/api/export/players", "/api/batch", "/populate", "/jobs/unknown")
+    assert [response["status"] for response in responses] == [404, 400, 404, 400, 400]
+
+# Testing rate limited routes cannot be batched, they would escape their limit
+def test_batch_rate_limited(client):
+    limits = app.config["RATE_LIMITS"]
+    with patch.dict(limits, { "teams": (1, 60, "ip") }):
+        status, responses = run_batch(client, "/api/teams", "/api/players")
+    assert [response["status"] for response in responses] == [400, 200]
+
+# Testing a batch takes an admission slot per unit of work, it is shed when they are not free
+def test_batch_admission(client, roster):
+    team_id, player_ids = roster
+    admission = app.extensions["admission"]
+
+    # Leaving a single slot free, the one the batch itself is admitted with
+    for _ in range(admission.max_in_flight - 1):
+        admission._slots.acquire()
+    try:
+        with patch.object(admission, "wait_budget", 0.01):
+            response = client.post("/api/batch", json={ "requests": [{ "path": "/api/teams" }, { "path": f"/api/teams/{team_id}/players" }] })
+            assert response.status_code == 503
+            assert response.headers.get("Retry-After") == "1"
+
+            # Single players are loaded together, one unit of work
+            status, responses = run_batch(client, *[f"/api/players/{player_id}" for player_id in player_ids])
+            assert status == 200
+            assert [response["status"] for response in responses] == [200, 200]
+    finally:
+        for _ in range(admission.max_in_flight - 1):
+            admission._slots.release()
+
+    # Every slot was given back
+    assert run_batch(client, "/api/teams", f"/api/teams/{team_id}/players")[0] == 200
+    for _ in range(admission.max_in_flight):
+        assert admission._slots.acquire(blocking=False)
+    for _ in range(admission.max_in_flight):
+        admission._slots.release()
@@ -0,0 +1,36 @@
+import json
+from collections import Counter
+from src.datagen import generate
+from src.routes.imports import parse_rows, validate_row
+
+# Testing the same seed always gives the same files
+def test_generate_deterministic(tmp_path):
+    first = generate(tmp_path / "first", teams=5, players=200, seed=7)
+    second = generate(tmp_path / "second", teams=5, players=200, seed=7)
+    for first_path, second_path in zip(first, second):
+        with open(first_path, "rb") as f, open(second_path, "rb") as g:
+            assert f.read() == g.read()
+
+# Testing the shape of the dataset and that the importers accept it
+def test_generate_shape(tmp_path):
+    generate(tmp_path, teams=10, players=2000, distribution="zipf", skew=1.5, name_length=(10, 12), seed=1)
+
+    with open(tmp_path / "teams.json") as f:
+        teams = json.load(f)
+    with open(tmp_path / "players.json") as f:
+        players = json.load(f)
+    assert len(teams) == 10
+    assert len({team["name"] for team in teams}) == 10
+    assert len(players) == 2000
+    assert all(10 <= len(player["name"]) <= 12 for player in players)
+
+    # Skewed: the largest team has many more players than the smallest
+    sizes = Counter(player["team_id"] for player in players).most_common()
+    assert sizes[0][1] > 5 * sizes[-1][1]
+
+    # Every CSV and NDJSON row is a valid import row
+    for format in ("csv", "ndjson"):
+        with open(tmp_path / f"players.{format}", newline="") as f:
+            rows = list(parse_rows(f, format))
+        assert len(rows) == 2000
+        assert all(error is None and validate_row(row)[1] is None for _, row, error in rows)
@@ -0,0 +1,70 @@
+import pytest
+import uuid
+from main import app
+from src.cache import get_version, invalidate, TEAMS_TAG
+from src.db import session
+from src.directory import TeamDirectory, team_directory
+from src.models import Team
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture to insert a single team in the database, yields its id and name
+@pytest.fixture
+def insert_team():
+    team = Team(name = f"Team_{uuid.uuid4()}")
+    session.add(team)
+    session.commit()
+    yield team.id, team.name
+
+# Testing the mapping is kept until the version of the teams tag moves, then reloaded
+def test_reload_on_version_change(insert_team):
+    team_id, team_name = insert_team
+    directory = TeamDirectory()
+    version = get_version(TEAMS_TAG)
+    assert directory.loaded(version) is None
+    assert directory.names(session).get(team_id) == team_name
+    assert directory.loaded(version) is directory.names(session)
+
+    # A team written without a version bump is not seen by the loaded mapping
+    team = Team(name = f"Team_{uuid.uuid4()}")
+    session.add(team)
+    session.commit()
+    new_id = team.id
+    assert new_id not in directory.names(session)
+
+    invalidate(TEAMS_TAG)
+    assert get_version(TEAMS_TAG) == version + 1
+    assert directory.loaded(version + 1) is None
+    assert new_id in directory.names(session)
+    assert directory.loaded(version + 1) is not None
+
+# Testing a team missing from the mapping is looked up in the database
+def test_name_falls_back_to_database():
+    directory = TeamDirectory()
+    directory.names(session)
+    team = Team(name = f"Team_{uuid.uuid4()}")
+    session.add(team)
+    session.commit()
+
+    assert directory.name(team.id, session) == team.name
+    assert directory.exists(team.id, session)
+    assert directory.name(None, session) is None
+    assert not directory.exists(999999999, session)
+
+# Testing lookups follow renames and deletes [PUT|DELETE /teams/<int:id>]
+def test_lookups_after_rename_and_delete(client, insert_team):
+    team_id, team_name = insert_team
+    assert team_directory.name(team_id, session) == team_name
+
+    assert client.put(f"/api/teams/{team_id}", json={ "name": f"updated_{team_name}" }).status_code == 200
+    assert team_directory.name(team_id, session) == f"updated_{team_name}"
+    assert team_directory.exists(team_id, session)
+
+    assert client.delete(f"/api/teams/{team_id}").status_code == 200
+    assert team_directory.name(team_id, session) is None
+    assert not team_directory.exists(team_id, session)
+    assert team_id not in team_directory.names(session)
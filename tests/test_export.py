@@ -0,0 +1,86 @@
+import pytest
+import csv
+import gzip
+import io
+import json
+import uuid
+from main import app
+from src.db import session
+from src.models import Team, Player
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture inserting a team with two players, returns ((team id, name), player id -> name)
+@pytest.fixture
+def roster():
+    team = Team(name = f"Team_{uuid.uuid4()}")
+    session.add(team)
+    session.commit()
+    players = [Player(name = f"Player_{uuid.uuid4()}", team_id = team.id) for _ in range(2)]
+    session.add_all(players)
+    session.commit()
+    yield (team.id, team.name), { player.id: player.name for player in players }
+
+# Testing the NDJSON export, one object per line [GET /export/<resource> endpoint]
+def test_export_ndjson(client, roster):
+    (team_id, team_name), player_names = roster
+    player_ids = list(player_names)
+    response = client.get("/api/export/players")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers.get("Content-Disposition") == "attachment; filename=players.ndjson"
+
+    players = { row["id"]: row for row in map(json.loads, response.data.decode().splitlines()) }
+    assert players[player_ids[0]] == {
+        "id": player_ids[0], "name": player_names[player_ids[0]], "team_id": team_id, "team": team_name,
+    }
+    assert player_ids[1] in players
+
+# Testing the CSV export, a header row then one row per team [?format=csv]
+def test_export_csv(client, roster):
+    (team_id, team_name), _ = roster
+    response = client.get("/api/export/teams?format=csv")
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+
+    rows = list(csv.reader(io.StringIO(response.data.decode())))
+    assert rows[0] == ["id", "name"]
+    assert [str(team_id), team_name] in rows[1:]
+
+# Testing the compressed export is the plain one gzipped [?gzip=1 and Accept-Encoding]
+def test_export_gzip(client, roster):
+    plain = client.get("/api/export/teams").data
+
+    response = client.get("/api/export/teams?gzip=1")
+    assert response.headers.get("Content-Encoding") == "gzip"
+    assert "Vary" not in response.headers
+    assert gzip.decompress(response.data) == plain
+
+    # Chosen from Accept-Encoding, caches must keep both encodings apart
+    response = client.get("/api/export/teams", headers={ "Accept-Encoding": "gzip, deflate" })
+    assert response.headers.get("Content-Encoding") == "gzip"
+    assert response.headers.get("Vary") == "Accept-Encoding"
+    assert gzip.decompress(response.data) == plain
+    assert client.get("/api/export/teams").headers.get("Vary") == "Accept-Encoding"
+
+    # A quality of 0 refuses gzip
+    for accept_encoding in ("gzip;q=0", "deflate, gzip;q=0", "identity"):
+        response = client.get("/api/export/teams", headers={ "Accept-Encoding": accept_encoding })
+        assert "Content-Encoding" not in response.headers
+        assert response.data == plain
+    response = client.get("/api/export/teams", headers={ "Accept-Encoding": "gzip;q=0.5" })
+    assert response.headers.get("Content-Encoding") == "gzip"
+
+# Testing unknown resources [404] and formats [400]
+def test_export_invalid(client):
+    response = client.get("/api/export/unknown")
+    assert response.status_code == 404
+    assert json.loads(response.data).get("message") == "Export Not Found"
+
+    response = client.get("/api/export/teams?format=xml")
+    assert response.status_code == 400
+    assert "Format must be one of" in json.loads(response.data).get("message")
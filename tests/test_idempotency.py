@@ -0,0 +1,74 @@
+import pytest
+import hashlib
+import json
+import threading
+import time
+import uuid
+from main import app
+from unittest.mock import patch
+from src.db import session
+from src.models import Team
+from src.cache import get_redis
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+def post_team(client, name, key):
+    return client.post("/api/teams", json={ "name": name }, headers={ "Idempotency-Key": key })
+
+# Testing a retried create runs once and gets the first response [POST /teams with Idempotency-Key]
+def test_retry_replays_response(client):
+    name, key = f"Team_{uuid.uuid4()}", str(uuid.uuid4())
+
+    first = post_team(client, name, key)
+    retry = post_team(client, name, key)
+    assert first.status_code == retry.status_code == 201
+    assert retry.data == first.data
+    assert retry.headers.get("Idempotent-Replayed") == "true"
+    assert session.query(Team).filter_by(name=name).count() == 1
+
+    # Another key is another request, failing on the name already taken
+    assert post_team(client, name, str(uuid.uuid4())).status_code == 500
+
+# Testing a key reused for another request is rejected [422]
+def test_key_reused_with_another_body(client):
+    key = str(uuid.uuid4())
+    assert post_team(client, f"Team_{uuid.uuid4()}", key).status_code == 201
+    assert post_team(client, f"Team_{uuid.uuid4()}", key).status_code == 422
+
+# Testing a retry waits for the response of the request still in flight
+def test_concurrent_retry_waits(client):
+    name, key = f"Team_{uuid.uuid4()}", str(uuid.uuid4())
+    body = json.dumps({ "name": name }).encode()
+    record_key = f"idempotency:127.0.0.1:POST:/api/teams:{key}"
+    fingerprint = hashlib.sha256(body).hexdigest()
+    get_redis().hset(record_key, mapping={ "state": "in_flight", "fingerprint": fingerprint })
+
+    # The first request completes while the retry waits
+    def complete():
+        time.sleep(0.2)
+        get_redis().hset(record_key, mapping={ "state": "done", "status": 201, "mimetype": "application/json", "body": b'{"first": true}' })
+    threading.Thread(target=complete).start()
+
+    response = client.post("/api/teams", data=body, content_type="application/json", headers={ "Idempotency-Key": key })
+    assert response.status_code == 201
+    assert json.loads(response.data) == { "first": True }
+    assert session.query(Team).filter_by(name=name).count() == 0
+
+# Testing a failed request releases its key so the retry runs again
+def test_server_error_releases_key(client):
+    name, key = f"Team_{uuid.uuid4()}", str(uuid.uuid4())
+    with patch('src.db.session.commit') as mock_commit:
+        mock_commit.side_effect = Exception("Simulated database error")
+        assert post_team(client, name, key).status_code == 500
+
+    response = post_team(client, name, key)
+    assert response.status_code == 201
+    assert response.headers.get("Idempotent-Replayed") is None
+
+# Testing an invalid key [400]
+def test_invalid_key(client):
+    assert post_team(client, f"Team_{uuid.uuid4()}", "k" * 256).status_code == 400
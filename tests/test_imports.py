@@ -0,0 +1,80 @@
+import pytest
+import json
+import uuid
+from main import app
+from src.db import session
+from src.models import User, Player, Team
+from werkzeug.security import generate_password_hash
+from flask_jwt_extended import get_csrf_token
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture to log in a user, the import endpoint requires authentication.
+# Returns the CSRF header that state changing requests send along with the JWT cookie
+@pytest.fixture
+def login(client):
+    _username = f"User_{(uuid.uuid4().int % 999999) + 1}"
+    _password = "TestingPassword"
+    session.add(User(username=_username, password=generate_password_hash(_password, method="pbkdf2:sha256")))
+    session.commit()
+    response = client.post("/login", json = { "username": _username, "password": _password })
+    assert response.status_code == 200
+    with app.app_context():
+        return { "X-CSRF-TOKEN": get_csrf_token(json.loads(response.data).get("access_token")) }
+
+# Fixture to insert a single team in the database as sample
+@pytest.fixture
+def insert_team():
+    team_name = f"Team_{uuid.uuid4()}"
+    team = Team(name = team_name)
+    session.add(team)
+    session.commit()
+    yield team_name
+
+# Testing CSV upload [POST /api/import/players]
+def test_import_players_csv(client, login, insert_team):
+    # Two valid players referencing the team by name and one with an unknown team
+    _name = f"Player_{uuid.uuid4()}"
+    body = f"name,team\n{_name},{insert_team}\n{_name}_2,{insert_team}\n{_name}_3,Unknown_{uuid.uuid4()}\n"
+    response = client.post("/api/import/players", data=body, content_type="text/csv", headers=login)
+    data = json.loads(response.data)
+
+    # Asserts to verify the summary of the import
+    assert response.status_code == 200
+    assert data.get("inserted") == 2
+    assert data.get("rejected") == 1
+    assert data.get("errors")[0].get("line") == 4
+
+    # Verifying the players were saved in the team
+    assert session.query(Player).filter_by(name=_name).first() is not None
+
+# Testing NDJSON upload updating an existing player [POST /api/import/players]
+def test_import_players_ndjson_update(client, login, insert_team):
+    _team_id = session.query(Team).filter_by(name=insert_team).first().id
+    player = Player(name = f"Player_{uuid.uuid4()}", team_id = _team_id)
+    session.add(player)
+    session.commit()
+    _id = player.id
+
+    # Sending the existing player id with a new name and a row with invalid JSON
+    body = json.dumps({ "id": _id, "name": "renamed", "team_id": _team_id }) + "\n{not json\n"
+    response = client.post("/api/import/players", data=body, content_type="application/x-ndjson", headers=login)
+    data = json.loads(response.data)
+
+    # Asserts to verify the player was updated and the broken row rejected
+    assert response.status_code == 200
+    assert data.get("updated") == 1
+    assert data.get("rejected") == 1
+    session.expire_all()
+    assert session.query(Player).filter_by(id=_id).first().name == "renamed"
+
+# Testing error 401 when uploading without logging in
+def test_import_players_unauthorized(client):
+    response = client.post("/api/import/players", data="name,team\n", content_type="text/csv")
+
+    # Assert that the request is rejected
+    assert response.status_code == 401
@@ -0,0 +1,120 @@
+import pytest
+import json
+import time
+import uuid
+from main import app
+from unittest.mock import patch
+from src import jobs, populatedb
+from src.cache import get_redis
+from src.db import session
+from src.models import Team, Player
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture clearing the state of the populate job, without its rate limit (2 per 5 minutes)
+@pytest.fixture
+def populate_job():
+    job_id = jobs.populate_job_id("teams.json", "players.json")
+    redis_client = get_redis()
+    redis_client.delete(jobs.job_key(job_id), jobs.lock_key(job_id))
+    with patch.dict(app.config["RATE_LIMITS"]):
+        app.config["RATE_LIMITS"].pop("populate", None)
+        yield job_id
+    redis_client.delete(jobs.job_key(job_id))
+    redis_client.lrem(jobs.QUEUE_KEY, 0, job_id)
+
+# Testing the import is enqueued once, repeated calls return the same job [GET|POST /populate]
+def test_populate_enqueued(client, populate_job):
+    response = client.get("/populate")
+    assert response.status_code == 202
+    job = json.loads(response.data)
+    assert job.get("id") == populate_job
+    assert job.get("status") == "queued"
+    assert job.get("status_url") == f"/jobs/{populate_job}"
+
+    response = client.post("/populate")
+    assert response.status_code == 202
+    assert json.loads(response.data).get("id") == populate_job
+    assert get_redis().lrange(jobs.QUEUE_KEY, 0, -1).count(populate_job.encode()) == 1
+
+# Testing the progress of a job [GET /jobs/<job_id>]
+def test_job_status(client, populate_job):
+    client.get("/populate")
+
+    response = client.get(f"/jobs/{populate_job}")
+    assert response.status_code == 200
+    job = json.loads(response.data)
+    assert job.get("status") == "queued"
+    assert (job.get("rows_done"), job.get("chunks_done")) == (0, 0)
+
+    assert client.get(f"/jobs/{uuid.uuid4()}").status_code == 404
+
+# Testing a failed job resumes from its last completed chunk, a chunk that failed after its
+# rows were written is replayed without duplicating them. Players with the same name on the
+# same team are all imported
+def test_run_job_resumes(client):
+    teams = [Team(name = f"Team_{uuid.uuid4()}") for _ in range(2)]
+    session.add_all(teams)
+    session.commit()
+    team_ids = [team.id for team in teams]
+    player_name = f"Player_{uuid.uuid4()}"
+    datasets = {
+        "teams": [{ "name": team.name } for team in teams],
+        "players": [{ "name": f"Player_{uuid.uuid4()}", "team_id": team_ids[index % 2] } for index in range(5)],
+    }
+    datasets["players"][3:5] = [{ "name": player_name, "team_id": team_ids[0] }] * 2
+
+    job_id = f"populate-{uuid.uuid4().hex[:16]}"
+    get_redis().hset(jobs.job_key(job_id), mapping={
+        "status": "queued", "teams_file": "teams", "players_file": "players",
+        "chunks_done": 0, "rows_done": 0, "updated_at": time.time(),
+    })
+
+    # Work: one chunk of teams, then players in chunks of 2. The second players chunk fails
+    # once, after its rows were written
+    calls = []
+    def import_players_chunk(db, rows, marker):
+        calls.append(rows)
+        inserted = populatedb.import_players_chunk(db, rows, marker)
+        if len(calls) == 2:
+            raise RuntimeError("connection lost")
+        return inserted
+
+    with patch.object(jobs, "load_dataset", lambda name: datasets[name]), \
+         patch.object(jobs, "chunks", lambda rows: populatedb.chunks(rows, 2)), \
+         patch.object(jobs, "import_players_chunk", side_effect=import_players_chunk):
+        jobs.run_job(job_id)
+        job = jobs.get_job(job_id)
+        assert (job.get("status"), job.get("chunks_done"), job.get("error")) == ("failed", 2, "connection lost")
+
+        jobs.run_job(job_id)
+
+    job = json.loads(client.get(f"/jobs/{job_id}").data)
+    assert job.get("status") == "completed"
+    assert (job.get("rows_done"), job.get("rows_total"), job.get("chunks_done")) == (7, 7, 4)
+
+    # The first players chunk ran once, the failed one was replayed
+    assert len(calls) == 4
+    assert calls[2] == calls[1]
+    names = [player.get("name") for player in datasets["players"]]
+    assert session.query(Player).filter(Player.name.in_(names)).count() == 5
+    assert session.query(Player).filter_by(name=player_name, team_id=team_ids[0]).count() == 2
+    get_redis().delete(jobs.job_key(job_id))
+
+# Testing a dataset file is read row by row, whatever its layout and the size of the reads
+def test_load_dataset_streamed(tmp_path):
+    rows = [{ "name": f"Player, \"{index}\" [é]", "team_id": index } for index in range(50)]
+    (tmp_path / "pretty.json").write_text(json.dumps(rows, indent=4, ensure_ascii=False), encoding="utf-8")
+    (tmp_path / "compact.json").write_text(json.dumps(rows, separators=(",", ":")), encoding="utf-8")
+    (tmp_path / "empty.json").write_text(" [ ]\n", encoding="utf-8")
+
+    with patch.object(populatedb, "DATA_DIR", str(tmp_path)):
+        for name in ("pretty.json", "compact.json"):
+            for read_size in (1, 7, 4096):
+                assert list(populatedb.load_dataset(name, read_size)) == rows
+        assert list(populatedb.load_dataset("empty.json")) == []
+        assert [len(chunk) for chunk in populatedb.chunks(populatedb.load_dataset("compact.json"), 20)] == [20, 20, 10]
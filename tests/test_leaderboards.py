@@ -0,0 +1,146 @@
+import pytest
+import uuid
+from unittest.mock import patch
+from sqlalchemy import delete
+from main import app
+from src.db import session
+from src.models import Player, Team
+from src import leaderboards
+from src.jobs import run_job
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture inserting a team and returning its id
+@pytest.fixture
+def team_id():
+    team = Team(name=f"Team_{uuid.uuid4().hex[:8]}")
+    session.add(team)
+    session.commit()
+    yield team.id
+
+# Fixture inserting a player and returning its id
+@pytest.fixture
+def player_id(team_id):
+    player = Player(name=f"Player_{uuid.uuid4().hex[:8]}", team_id=team_id)
+    session.add(player)
+    session.commit()
+    yield player.id
+
+# Testing stats of a player without any [GET /players/<id>/stats endpoint]
+def test_get_player_stats_empty(client, player_id):
+    response = client.get(f'/api/players/{player_id}/stats')
+    assert response.status_code == 200
+    assert response.json == {"player_id": player_id, "goals": 0, "assists": 0, "appearances": 0}
+
+# Testing stats of a player that does not exist [GET /players/<id>/stats endpoint]
+def test_get_player_stats_not_found(client):
+    response = client.get('/api/players/999999999/stats')
+    assert response.status_code == 404
+
+# Testing recording stats adds up [POST /players/<id>/stats endpoint]
+def test_record_player_stats(client, player_id):
+    response = client.post(f'/api/players/{player_id}/stats', json={"goals": 2, "appearances": 1})
+    assert response.status_code == 200
+    response = client.post(f'/api/players/{player_id}/stats', json={"goals": 1, "assists": 1, "appearances": 1})
+    assert response.status_code == 200
+    assert response.json == {"player_id": player_id, "goals": 3, "assists": 1, "appearances": 2}
+
+# Testing recording stats without increments [POST /players/<id>/stats endpoint]
+def test_record_player_stats_invalid(client, player_id):
+    assert client.post(f'/api/players/{player_id}/stats', json={}).status_code == 400
+    assert client.post(f'/api/players/{player_id}/stats', json={"goals": "many"}).status_code == 400
+    assert client.post('/api/players/999999999/stats', json={"goals": 1}).status_code == 404
+
+    # Increments never take a stat below zero
+    response = client.post(f'/api/players/{player_id}/stats', json={"goals": -1, "appearances": 1})
+    assert response.status_code == 400
+    assert response.json["errors"] == {"goals": "must be at least 0"}
+    assert client.get(f'/api/players/{player_id}/stats').json["appearances"] == 0
+
+# Testing a player deleted while its stats are recorded is not ranked [POST /players/<id>/stats endpoint]
+def test_record_player_stats_player_deleted(client, player_id):
+    def delete_player_first(_id, increments):
+        session.execute(delete(Player.__table__).where(Player.__table__.c.id == _id))
+        session.commit()
+        return False
+
+    with patch("src.routes.leaderboards.increment_stats", side_effect=delete_player_first), \
+         patch("src.routes.leaderboards.boards.record") as mock_record:
+        response = client.post(f'/api/players/{player_id}/stats', json={"goals": 1})
+    assert response.status_code == 404
+    mock_record.assert_not_called()
+    assert leaderboards.rank("goals", player_id) is None
+
+# Testing the top players of the global and team leaderboards [GET /leaderboards/<stat> endpoint]
+def test_get_leaderboard(client, team_id):
+    scorers = []
+    for goals in (5, 9, 7):
+        player = Player(name=f"Player_{uuid.uuid4().hex[:8]}", team_id=team_id)
+        session.add(player)
+        session.commit()
+        scorers.append((player.id, goals))
+        client.post(f'/api/players/{player.id}/stats', json={"goals": goals})
+
+    response = client.get(f'/api/leaderboards/goals?team_id={team_id}&limit=2')
+    assert response.status_code == 200
+    data = response.json["data"]
+    assert [(entry["player"]["id"], entry["score"]) for entry in data] == [scorers[1], scorers[2]]
+    assert [entry["rank"] for entry in data] == [1, 2]
+
+    # Global leaderboard ranks every player by score
+    data = client.get('/api/leaderboards/goals?limit=100').json["data"]
+    scores = [entry["score"] for entry in data]
+    assert scores == sorted(scores, reverse=True)
+
+# Testing an unknown leaderboard and invalid parameters [GET /leaderboards/<stat> endpoint]
+def test_get_leaderboard_invalid(client):
+    assert client.get('/api/leaderboards/fouls').status_code == 404
+    assert client.get('/api/leaderboards/goals?limit=ten').status_code == 400
+
+# Testing the rank of a player [GET /leaderboards/<stat>/players/<id> endpoint]
+def test_get_player_rank(client, team_id, player_id):
+    assert client.get(f'/api/leaderboards/assists/players/{player_id}').json["team"] is None
+
+    client.post(f'/api/players/{player_id}/stats', json={"assists": 4})
+    response = client.get(f'/api/leaderboards/assists/players/{player_id}')
+    assert response.status_code == 200
+    assert response.json["team"] == {"rank": 1, "score": 4}
+    assert response.json["global"]["score"] == 4
+
+# Testing a player changing team is moved to the leaderboards of the new team
+def test_player_moved_with_team(client, team_id, player_id):
+    client.post(f'/api/players/{player_id}/stats', json={"goals": 3})
+    other_team = Team(name=f"Team_{uuid.uuid4().hex[:8]}")
+    session.add(other_team)
+    session.commit()
+    other_team_id = other_team.id
+
+    response = client.put(f'/api/players/{player_id}', json={"name": "Moved", "team_id": other_team_id})
+    assert response.status_code == 200
+    assert leaderboards.top("goals", team_id) == []
+    assert leaderboards.top("goals", other_team_id) == [(player_id, 3)]
+
+# Testing deleted players and teams leave the leaderboards
+def test_deleted_players_removed(client, team_id, player_id):
+    client.post(f'/api/players/{player_id}/stats', json={"goals": 1})
+    assert client.delete(f'/api/teams/{team_id}').status_code == 200
+    assert leaderboards.rank("goals", player_id) is None
+    assert leaderboards.top("goals", team_id) == []
+
+# Testing the rebuild restores the leaderboards from the stats table [POST /leaderboards/rebuild endpoint]
+def test_rebuild_leaderboards(client, team_id, player_id):
+    client.post(f'/api/players/{player_id}/stats', json={"goals": 6, "appearances": 2})
+    leaderboards.remove_players(player_id)
+    assert leaderboards.rank("goals", player_id, team_id) is None
+
+    response = client.post('/api/leaderboards/rebuild')
+    assert response.status_code == 202
+    run_job(response.json["id"])
+
+    assert client.get(response.json["status_url"]).json["status"] == "completed"
+    assert leaderboards.rank("goals", player_id, team_id) == (1, 6)
+    assert leaderboards.rank("appearances", player_id) is not None
@@ -0,0 +1,59 @@
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from src.migrate import upgrade, downgrade, status, load_migrations
+
+# Create an empty SQLite database to run the migrations against
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    yield engine
+    engine.dispose()
+
+def query_plan(engine, statement, **params):
+    with engine.connect() as connection:
+        return " ".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {statement}"), params))
+
+# Testing every migration is applied once and recorded
+def test_upgrade(engine):
+    versions = [version for version, _ in load_migrations()]
+    assert upgrade(engine) == versions
+    assert upgrade(engine) == []
+    assert all(applied for _, applied in status(engine))
+
+    tables = inspect(engine).get_table_names()
+    assert {"users", "teams", "players", "schema_migrations"} <= set(tables)
+
+# Testing the migrations adopt a schema created before they existed
+def test_upgrade_existing_schema(engine):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE teams (id INTEGER PRIMARY KEY, name VARCHAR(100) UNIQUE, created_at DATETIME, updated_at DATETIME)"))
+    upgrade(engine)
+    assert "ix_teams_updated_at" in {index["name"] for index in inspect(engine).get_indexes("teams")}
+
+# Testing migrations are reverted last first
+def test_downgrade(engine):
+    versions = [version for version, _ in load_migrations()]
+    upgrade(engine)
+    assert downgrade(engine) == versions[-1:]
+    assert dict(status(engine))[versions[-1]] is False
+    assert downgrade(engine, steps=len(versions)) == list(reversed(versions[:-1]))
+    assert "players" not in inspect(engine).get_table_names()
+
+# Testing the hot queries of the routes are served by the indexes
+def test_query_plans(engine):
+    upgrade(engine)
+
+    # Roster of a team, read from the index alone and already ordered
+    plan = query_plan(engine, "SELECT id, name, team_id FROM players WHERE team_id = :team_id ORDER BY id", team_id=1)
+    assert "COVERING INDEX ix_players_team_id_id_name" in plan
+    assert "TEMP B-TREE" not in plan
+
+    # Import deduplication on (name, team_id)
+    plan = query_plan(engine, "SELECT name, team_id FROM players WHERE name IN ('a', 'b')")
+    assert "COVERING INDEX ix_players_name_team_id" in plan
+
+    # Changes since a point in time
+    plan = query_plan(engine, "SELECT id FROM players WHERE updated_at > :since", since="2024-01-01")
+    assert "ix_players_updated_at" in plan
+    plan = query_plan(engine, "SELECT id FROM teams WHERE updated_at > :since", since="2024-01-01")
+    assert "ix_teams_updated_at" in plan
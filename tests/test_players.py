@@ -5,6 +5,7 @@ from main import app
 from unittest.mock import patch
 from src.db import session
 from src.models import Player, Team
+from src.cache import invalidate, PLAYERS_TAG, TEAMS_TAG
 
 # Create a test client to use the app
 @pytest.fixture
@@ -122,6 +123,106 @@ def test_delete_player(client, insert_player):
     assert response.status_code == 200
     assert data.get("message") == "Player deleted successfully"
 
+# Testing multi-get [GET /players?ids=]
+def test_get_players_by_id(client, insert_player, insert_team):
+    _id = session.query(Player).filter_by(name=insert_player).first().id
+    _missing = _id + 1000000
+
+    # Players come back in request order, unknown ids with a marker
+    response = client.get(f"/api/players?ids={_missing},{_id}")
+    data = json.loads(response.data)
+    assert response.status_code == 200
+    assert data.get("data")[0] == { "id": _missing, "error": "Not Found" }
+    assert data.get("data")[1].get("name") == insert_player
+
+    # The second request is served from the cache, until the player is updated
+    response = client.get(f"/api/players?ids={_id}")
+    assert json.loads(response.data).get("source") == "cache"
+    client.put(f"/api/players/{_id}", json={ "name": f"updated_{insert_player}", "team_id": insert_team })
+    data = json.loads(client.get(f"/api/players?ids={_id}").data)
+    assert data.get("data")[0].get("name") == f"updated_{insert_player}"
+
+    # Invalid lists are rejected
+    assert client.get("/api/players?ids=1,abc").status_code == 400
+
+# Testing optimistic concurrency on update [PUT /players/<int:id> with If-Match]
+def test_update_player_if_match(client, insert_player, insert_team):
+    _id = session.query(Player).filter_by(name=insert_player).first().id
+
+    # The ETag of the player is its current version
+    etag = client.get(f"/api/players/{_id}").headers.get("ETag")
+    assert etag is not None
+
+    # The first update with the ETag applies and gives the next ETag
+    payload = { "name": f"updated_{insert_player}", "team_id": insert_team }
+    response = client.put(f"/api/players/{_id}", json=payload, headers={ "If-Match": etag })
+    assert response.status_code == 200
+    assert response.headers.get("ETag") != etag
+
+    # A second update with the old ETag is rejected
+    response = client.put(f"/api/players/{_id}", json=payload, headers={ "If-Match": etag })
+    assert response.status_code == 412
+
+    # Deleting with the old ETag is rejected too, the current one succeeds
+    assert client.delete(f"/api/players/{_id}", headers={ "If-Match": etag }).status_code == 412
+    current = client.get(f"/api/players/{_id}").headers.get("ETag")
+    assert client.delete(f"/api/players/{_id}", headers={ "If-Match": current }).status_code == 200
+
+# Testing a client copy that is still current is not sent again [GET /players/<int:id>]
+def test_get_player_not_modified(client, insert_player):
+    _id = session.query(Player).filter_by(name=insert_player).first().id
+    etag = client.get(f"/api/players/{_id}").headers.get("ETag")
+
+    response = client.get(f"/api/players/{_id}", headers={ "If-None-Match": etag })
+    assert response.status_code == 304
+
+# Testing the total of players is exact and follows writes [GET /players?total=1]
+def test_get_players_total(client, insert_player, insert_team):
+    total = json.loads(client.get("/api/players?total=1").data).get("total")
+    assert total == { "count": session.query(Player).count(), "exact": True }
+
+    # Totals are only included when asked for
+    assert "total" not in json.loads(client.get("/api/players").data)
+
+    client.post("/api/players", json={ "name": f"Player_{uuid.uuid4().hex[:8]}", "team_id": insert_team })
+    assert json.loads(client.get("/api/players?total=1").data).get("total").get("count") == total["count"] + 1
+
+    # Leaving the players list uncached for the database error tests
+    invalidate(PLAYERS_TAG)
+
+# Function reading each view twice, the second read comes from the cache
+def prime(client, paths):
+    for path in paths:
+        client.get(path)
+        assert json.loads(client.get(path).data).get("source") == "cache", path
+
+# Function returning path -> source of the next read of each view
+def sources(client, paths):
+    return { path: json.loads(client.get(path).data).get("source") for path in paths }
+
+# Testing player writes clear every cached view showing players, the players list, the rosters
+# of all teams and of its team, and the player itself [POST, PUT, DELETE /players]
+def test_player_writes_invalidate_views(client, insert_team):
+    player_name = f"Player_{uuid.uuid4().hex[:8]}"
+    views = ["/api/players", "/api/teams/players", f"/api/teams/{insert_team}/players"]
+
+    prime(client, views)
+    assert client.post("/api/players", json={ "name": player_name, "team_id": insert_team }).status_code == 200
+    assert sources(client, views) == dict.fromkeys(views, "database")
+
+    _id = session.query(Player).filter_by(name=player_name).first().id
+    views.append(f"/api/players?ids={_id}")
+    prime(client, views)
+    assert client.put(f"/api/players/{_id}", json={ "name": f"updated_{player_name}", "team_id": insert_team }).status_code == 200
+    assert sources(client, views) == dict.fromkeys(views, "database")
+
+    prime(client, views)
+    assert client.delete(f"/api/players/{_id}").status_code == 200
+    assert sources(client, views) == dict.fromkeys(views, "database")
+
+    # Leaving the views uncached for the database error tests
+    invalidate(PLAYERS_TAG, TEAMS_TAG)
+
 # SECTION: Testing Error Handling in the Requests 
 
 # Testing exception when player is not found [404]
@@ -146,6 +247,14 @@ def test_exception_create_player_invalid_body(client):
     assert response.status_code == 400
     assert "Bad Request" in data.get("message")
 
+# Testing exception when the team id is not a number int() can parse [400]
+def test_exception_create_player_invalid_team_id(client):
+    response = client.post("/api/players", json={ "name": "team_name", "team_id": "²" })
+    data = json.loads(response.data)
+
+    assert response.status_code == 400
+    assert data.get("errors") == { "team_id": "must be an integer" }
+
 # Testing exception when team id doesn't exist [400]
 def test_exception_create_player_invalid_team(client):
     # Inserting the new player through the endpoint
@@ -0,0 +1,32 @@
+import threading
+from unittest.mock import patch
+from src.cache import PLAYERS_TAG, team_tag
+from src.purge import ProxyPurge
+
+# Testing refreshes are queued once per URL and the queue is capped
+def test_refreshes_coalesced():
+    purge = ProxyPurge("http://proxy:8080", max_workers=1, max_pending=2)
+    started, release = threading.Event(), threading.Event()
+    fetched = []
+
+    def urlopen(url, timeout):
+        fetched.append(url)
+        started.set()
+        release.wait(5)
+        raise OSError("not a real proxy")
+
+    with patch("src.purge.urllib.request.urlopen", side_effect=urlopen):
+        # The worker fetches /api/players, /api/teams/players waits
+        purge([PLAYERS_TAG])
+        assert started.wait(5)
+
+        # /api/players is queued again since its fetch started, /api/teams/players is
+        # already queued, then the queue is full
+        purge([PLAYERS_TAG])
+        assert purge.submit("/api/teams/1") is False
+        purge([team_tag(1)])
+
+        release.set()
+        purge._executor.shutdown(wait=True)
+
+    assert fetched == ["http://proxy:8080/api/players", "http://proxy:8080/api/teams/players", "http://proxy:8080/api/players"]
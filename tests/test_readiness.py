@@ -0,0 +1,62 @@
+import pytest
+import json
+from flask import Flask
+from main import app
+from unittest.mock import patch
+from src.readiness import init_readiness
+
+# Readiness checks of the app
+readiness = app.extensions["readiness"]
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Every test starts without a cached result
+@pytest.fixture(autouse=True)
+def reset_readiness():
+    readiness._result = None
+    yield
+    readiness._result = None
+
+# Testing a worker with a usable database and Redis is ready [GET /ready endpoint]
+def test_ready(client):
+    response = client.get("/ready")
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data.get("status") == "ready"
+    assert data["checks"]["database"]["status"] == "ok"
+    assert data["checks"]["redis"]["status"] == "ok"
+
+# Testing a worker that just used the database does not query it again
+def test_ready_database_from_traffic(client):
+    client.get("/api/teams/1")
+    data = json.loads(client.get("/ready").data)
+    assert data["checks"]["database"]["source"] == "traffic"
+
+# Testing probe results are cached between healthchecks
+def test_ready_cached(client):
+    with patch.object(readiness.probes["redis"], "check", return_value={ "status": "ok" }) as mock_check:
+        client.get("/ready")
+        client.get("/ready")
+    assert mock_check.call_count == 1
+
+# Testing a worker whose Redis is down is not ready [503]
+def test_not_ready_redis_down(client):
+    with patch("src.readiness.get_redis") as mock_redis:
+        mock_redis.return_value.ping.side_effect = Exception("Connection refused")
+        response = client.get("/ready")
+    assert response.status_code == 503
+    data = json.loads(response.data)
+    assert data.get("status") == "not ready"
+    assert data["checks"]["redis"] == { "status": "failing", "error": "Connection refused" }
+
+# Testing the settings are read when the app is created, after .env is loaded
+def test_readiness_settings(monkeypatch):
+    monkeypatch.setenv("READY_CACHE_TTL", "7")
+    monkeypatch.setenv("READY_REDIS_MAX_LATENCY", "0.5")
+    settings = init_readiness(Flask(__name__))
+    assert settings.ttl == 7
+    assert settings.probes["redis"].max_latency == 0.5
@@ -0,0 +1,100 @@
+import pytest
+import time
+import uuid
+from main import app
+from src.cache import get_redis, invalidate, load_view, HITS_KEY, INVALIDATED_CHANNEL, PLAYERS_KEY, TEAMS_KEY, TEAMS_AND_PLAYERS_KEY, PLAYERS_TAG, TEAMS_TAG
+from src.db import session
+from src.models import Team
+from src.refresher import CacheRefresher, LOCK_KEY
+
+# Fixture giving a refresher over an empty access count and leader lock, the views it cached
+# are cleared afterwards
+@pytest.fixture
+def refresher():
+    redis_client = get_redis()
+    redis_client.delete(HITS_KEY, LOCK_KEY)
+    refresher = CacheRefresher(interval=0.05, refresh_ahead=3.0, hot_threshold=2)
+    yield refresher
+    if refresher.is_alive():
+        refresher.stop()
+        refresher.join(5)
+    redis_client.delete(HITS_KEY, LOCK_KEY)
+    invalidate(PLAYERS_TAG, TEAMS_TAG)
+
+# Testing hot keys are the registered views accessed at least hot_threshold times
+def test_hot_keys(refresher):
+    redis_client = get_redis()
+    redis_client.zincrby(HITS_KEY, 5, TEAMS_KEY)
+    redis_client.zincrby(HITS_KEY, 1, PLAYERS_KEY)
+    redis_client.zincrby(HITS_KEY, 5, "not_a_view")
+    assert refresher.hot_keys() == [TEAMS_KEY]
+
+    # Decaying halves the counts and drops the cold ones
+    refresher.decay()
+    assert refresher.hot_keys() == [TEAMS_KEY]
+    assert redis_client.zscore(HITS_KEY, PLAYERS_KEY) is None
+
+# Testing the hot views missing or about to expire are refreshed, the others are not
+def test_expiring_keys(refresher):
+    redis_client = get_redis()
+    invalidate(PLAYERS_TAG, TEAMS_TAG)
+    for key in (TEAMS_KEY, PLAYERS_KEY, TEAMS_AND_PLAYERS_KEY):
+        redis_client.zincrby(HITS_KEY, 5, key)
+    load_view(PLAYERS_KEY, session)
+    load_view(TEAMS_AND_PLAYERS_KEY, session)
+    redis_client.pexpire(PLAYERS_KEY, 1000)
+    redis_client.expire(TEAMS_AND_PLAYERS_KEY, 60)
+
+    assert sorted(refresher.expiring_keys()) == sorted([TEAMS_KEY, PLAYERS_KEY])
+
+# Testing a burst of invalidations is taken at once and each hot view refreshed once
+def test_invalidations_drained(refresher):
+    redis_client = get_redis()
+    redis_client.zincrby(HITS_KEY, 5, TEAMS_KEY)
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(INVALIDATED_CHANNEL)
+    pubsub.get_message(timeout=0.1)
+    try:
+        for _ in range(3):
+            load_view(TEAMS_KEY, session)
+            invalidate(TEAMS_TAG)
+        invalidated = refresher.invalidated_keys(pubsub)
+        assert TEAMS_KEY in invalidated
+        assert refresher.invalidated_keys(pubsub) == set()
+        assert refresher.keys_to_refresh(invalidated) == [TEAMS_KEY]
+    finally:
+        pubsub.close()
+
+# Testing a hot view is cached again right after it is invalidated
+def test_refresh_on_invalidation(refresher):
+    redis_client = get_redis()
+    redis_client.zincrby(HITS_KEY, 5, TEAMS_KEY)
+    refresher.start()
+
+    # Waiting for the views to be warmed
+    deadline = time.monotonic() + 5
+    while redis_client.get(TEAMS_KEY) is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert redis_client.get(TEAMS_KEY) is not None
+
+    team_name = f"Team_{uuid.uuid4()}"
+    session.add(Team(name = team_name))
+    session.commit()
+    invalidate(TEAMS_TAG)
+
+    deadline = time.monotonic() + 5
+    while (redis_client.get(TEAMS_KEY) is None or team_name.encode() not in redis_client.get(TEAMS_KEY)) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert team_name.encode() in redis_client.get(TEAMS_KEY)
+
+# Testing only one refresher is the leader until its lock expires
+def test_leader(refresher):
+    other = CacheRefresher(interval=0.05)
+    assert refresher.is_leader()
+    assert refresher.is_leader()
+    assert not other.is_leader()
+    assert 0 < get_redis().pttl(LOCK_KEY) <= 5000
+
+    get_redis().delete(LOCK_KEY)
+    assert other.is_leader()
+    assert not refresher.is_leader()
@@ -0,0 +1,273 @@
+import pytest
+import json
+import uuid
+from main import app
+from sqlalchemy import create_engine, select
+from src import db, sharding
+from src.db import session
+from src.models import User, Player, Team
+from src.sharding import ShardRouter
+from src.populatedb import import_players_chunk
+from werkzeug.security import generate_password_hash
+from flask_jwt_extended import get_csrf_token
+
+# Create a test client to use the app
+@pytest.fixture
+def client():
+    with app.test_client() as client:
+        yield client
+
+# Fixture to log in a user, the import endpoint requires authentication
+@pytest.fixture
+def login(client):
+    _username = f"User_{(uuid.uuid4().int % 999999) + 1}"
+    session.add(User(username=_username, password=generate_password_hash("TestingPassword", method="pbkdf2:sha256")))
+    session.commit()
+    response = client.post("/login", json = { "username": _username, "password": "TestingPassword" })
+    with app.app_context():
+        return { "X-CSRF-TOKEN": get_csrf_token(json.loads(response.data).get("access_token")) }
+
+# Router over the app database and a second SQLite file, set as the router of the app
+@pytest.fixture
+def app_router(tmp_path):
+    urls = [db.engine.url.render_as_string(hide_password=False), f"sqlite:///{tmp_path}/shard_1.db"]
+    sharding.router = ShardRouter(urls, db.engine, move_grace=0)
+    sharding.router.create_schema()
+    yield sharding.router
+    sharding.router.engines[1].dispose()
+    sharding.router = None
+
+# Router over three SQLite files, the first one is also the primary database
+@pytest.fixture
+def router(tmp_path):
+    urls = [f"sqlite:///{tmp_path}/shard_{index}.db" for index in range(3)]
+    primary = create_engine(urls[0])
+    router = ShardRouter(urls, primary, move_grace=0)
+    router.create_schema()
+    yield router
+    for engine in router.engines:
+        engine.dispose()
+
+def add_team(router, name):
+    with router.primary.begin() as connection:
+        team_id = connection.execute(Team.__table__.insert().values(name=name)).inserted_primary_key[0]
+    router.place_team(team_id)
+    return team_id
+
+def shard_player_ids(router, index):
+    with router.sessions[index]() as db:
+        return [player_id for (player_id,) in db.execute(select(Player.id).order_by(Player.id))]
+
+# Testing players are placed by team and collections are merged in id order across shards
+def test_players_placed_by_team(router):
+    team_ids = [add_team(router, f"Team_{index}") for index in range(3)]
+    player_ids = [router.insert_player(f"Player_{index}", team_ids[index % 3]) for index in range(9)]
+
+    # Ids are unique across shards and every shard holds the players of its teams only
+    assert len(set(player_ids)) == 9
+    for team_id in team_ids:
+        shard = router.shard_of(team_id)
+        assert shard == team_id % 3
+        assert {row.id for row in router.players_of_team(team_id)} <= set(shard_player_ids(router, shard))
+
+    assert [row.id for row in router.all_players()] == sorted(player_ids)
+    assert sorted(row.id for row in router.players_by_id(player_ids[:4])) == sorted(player_ids[:4])
+    assert router.count_players() == 9
+
+# Testing updates moving a player to a team of another shard, and deletes
+def test_update_and_delete_player(router):
+    first_team, second_team = add_team(router, "Team_a"), add_team(router, "Team_b")
+    player_id = router.insert_player("Player", first_team)
+
+    outcome, player = router.update_player(player_id, "Player", second_team, expected_version=2)
+    assert (outcome, player.version) == (sharding.CONFLICT, 1)
+    outcome, player = router.update_player(player_id, "Moved", second_team, expected_version=1)
+    assert (outcome, player.team_id) == (sharding.UPDATED, first_team)
+    assert router.find_player(player_id).team_id == second_team
+    assert router.find_player(player_id).version == 2
+    assert player_id in shard_player_ids(router, router.shard_of(second_team))
+    assert player_id not in shard_player_ids(router, router.shard_of(first_team))
+    assert router.update_player(player_id, "Moved", 999999)[0] == sharding.NO_TEAM
+
+    assert router.delete_player(player_id)[0] == sharding.DELETED
+    assert router.find_player(player_id) is None
+    assert router.delete_player(player_id) == (sharding.NOT_FOUND, None)
+
+# Testing a player copied to the shard of its new team, and not yet deleted from its shard,
+# is listed once
+def test_player_listed_once_while_changing_shard(router):
+    first_team, second_team = add_team(router, "Team_a"), add_team(router, "Team_b")
+    player_id = router.insert_player("Player", first_team)
+
+    # The state between the two commits of a cross-shard update
+    target = router.shard_of(second_team)
+    with router.sessions[target]() as db:
+        router._replicate_team(db, target, second_team)
+        db.execute(Player.__table__.insert().values(id=player_id, name="Moved", team_id=second_team, version=2))
+        db.commit()
+
+    assert [row.id for row in router.all_players()] == [player_id]
+    assert [row.id for row in router.stream_players()] == [player_id]
+    assert [row.id for row in router.players_by_id([player_id])] == [player_id]
+
+# Testing a team moved to another shard keeps its players and serves them from there
+def test_move_team(router):
+    team_id = add_team(router, "Team_moving")
+    player_ids = [router.insert_player(f"Player_{index}", team_id) for index in range(5)]
+    source = router.shard_of(team_id)
+    target = (source + 1) % 3
+
+    assert router.move_team(team_id, target) == 5
+    assert router.shard_of(team_id) == target
+    assert [row.id for row in router.players_of_team(team_id)] == player_ids
+    assert shard_player_ids(router, source) == []
+    assert [row.id for row in router.all_players()] == player_ids
+
+    # Writes go to the new shard
+    player_id = router.insert_player("Player_new", team_id)
+    assert player_id in shard_player_ids(router, target)
+
+# Testing writes to a team being moved are refused while reads go on
+def test_writes_refused_while_moving(router):
+    team_id = add_team(router, "Team_frozen")
+    player_id = router.insert_player("Player", team_id)
+    router._set_placement(team_id, router.shard_of(team_id), "moving")
+
+    with pytest.raises(sharding.TeamMoving):
+        router.insert_player("Player_new", team_id)
+    assert router.find_player(player_id).id == player_id
+
+# Testing the routes through the router [players and teams endpoints]
+def test_routes_sharded(client, app_router):
+    team_name = f"Team_{uuid.uuid4()}"
+    assert client.post("/api/teams", json={ "name": team_name }).status_code == 201
+    team_id = session.query(Team).filter_by(name=team_name).first().id
+
+    assert client.post("/api/players", json={ "name": "Sharded", "team_id": team_id }).status_code == 200
+    players = json.loads(client.get(f"/api/teams/{team_id}/players").data).get("data")
+    assert [player.get("name") for player in players] == ["Sharded"]
+    player_id = players[0].get("id")
+
+    # The player is found on its shard
+    response = client.get(f"/api/players/{player_id}")
+    assert response.status_code == 200
+    assert response.headers.get("ETag") == '"1"'
+    assert player_id in [player.get("id") for player in json.loads(client.get("/api/players").data).get("data")]
+
+    assert app_router.move_team(team_id, 1 - app_router.shard_of(team_id)) == 1
+    assert client.get(f"/api/players/{player_id}").status_code == 200
+    assert client.delete(f"/api/teams/{team_id}").status_code == 200
+    assert client.get(f"/api/players/{player_id}").status_code == 404
+
+# Testing updates moving a player to a team of another shard, and deletes, through the routes
+# [PUT|DELETE /api/players/<id>]
+def test_update_and_delete_player_sharded(client, app_router):
+    team_ids = []
+    for _ in range(2):
+        team_name = f"Team_{uuid.uuid4()}"
+        client.post("/api/teams", json={ "name": team_name })
+        team_ids.append(session.query(Team).filter_by(name=team_name).first().id)
+    app_router.move_team(team_ids[1], 1 - app_router.shard_of(team_ids[0]))
+    player_id = app_router.insert_player("Player", team_ids[0])
+    client.get(f"/api/teams/{team_ids[0]}/players")
+
+    response = client.put(f"/api/players/{player_id}", json={ "name": "Moved", "team_id": team_ids[1] }, headers={ "If-Match": '"1"' })
+    assert response.status_code == 200
+    assert response.headers.get("ETag") == '"2"'
+    assert player_id in shard_player_ids(app_router, app_router.shard_of(team_ids[1]))
+    assert player_id not in shard_player_ids(app_router, app_router.shard_of(team_ids[0]))
+    assert json.loads(client.get(f"/api/teams/{team_ids[0]}/players").data).get("data") == []
+    players = json.loads(client.get("/api/players").data).get("data")
+    assert [player.get("name") for player in players if player.get("id") == player_id] == ["Moved"]
+
+    # Only the version last seen is deleted
+    assert client.delete(f"/api/players/{player_id}", headers={ "If-Match": '"1"' }).status_code == 412
+    assert client.delete(f"/api/players/{player_id}", headers={ "If-Match": '"2"' }).status_code == 200
+    assert client.get(f"/api/players/{player_id}").status_code == 404
+    assert client.delete(f"/api/players/{player_id}").status_code == 404
+    assert json.loads(client.get(f"/api/teams/{team_ids[1]}/players").data).get("data") == []
+
+# Testing a team being moved is not deleted, and a delete interrupted after the team was gone
+# is finished by the next one [DELETE /api/teams/<id>]
+def test_delete_team_sharded(client, app_router):
+    team_name = f"Team_{uuid.uuid4()}"
+    assert client.post("/api/teams", json={ "name": team_name }).status_code == 201
+    team_id = session.query(Team).filter_by(name=team_name).first().id
+    app_router.move_team(team_id, 1)
+    app_router.insert_player("Player", team_id)
+
+    app_router._set_placement(team_id, 1, "moving")
+    assert client.delete(f"/api/teams/{team_id}").status_code == 503
+    assert app_router.team_exists(team_id)
+    app_router._set_placement(team_id, 1, "active")
+
+    # The team is gone from the primary but its players are still on the shard
+    with app_router.primary.begin() as connection:
+        connection.execute(Team.__table__.delete().where(Team.__table__.c.id == team_id))
+    assert shard_player_ids(app_router, 1) != []
+    assert client.delete(f"/api/teams/{team_id}").status_code == 404
+    assert shard_player_ids(app_router, 1) == []
+
+# Testing the players export streams every shard in id order [GET /api/export/players]
+def test_export_sharded(client, app_router):
+    team_ids = []
+    for _ in range(2):
+        team_name = f"Team_{uuid.uuid4()}"
+        client.post("/api/teams", json={ "name": team_name })
+        team_ids.append(session.query(Team).filter_by(name=team_name).first().id)
+    app_router.move_team(team_ids[1], 1 - app_router.shard_of(team_ids[0]))
+    player_ids = [app_router.insert_player(f"Player_{index}", team_ids[index % 2]) for index in range(4)]
+
+    response = client.get("/api/export/players")
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row["id"] for row in rows] == sorted(row.id for row in app_router.all_players())
+    assert {row["id"]: row["team_id"] for row in rows if row["id"] in player_ids} == {
+        player_id: team_ids[index % 2] for index, player_id in enumerate(player_ids)
+    }
+    assert all(row["team"] is not None for row in rows if row["id"] in player_ids)
+
+# Testing imported players go to the shard of their team with ids of the sequence
+# [POST /api/import/players]
+def test_import_sharded(client, login, app_router):
+    team_name = f"Team_{uuid.uuid4()}"
+    assert client.post("/api/teams", json={ "name": team_name }).status_code == 201
+    team_id = session.query(Team).filter_by(name=team_name).first().id
+    app_router.move_team(team_id, 1)
+    existing_id = app_router.insert_player("Existing", team_id)
+
+    body = "\n".join(json.dumps(row) for row in [
+        { "name": "Imported", "team_id": team_id },
+        { "id": existing_id, "name": "Renamed", "team_id": team_id },
+    ])
+    response = client.post("/api/import/players", data=body, headers=login, content_type="application/x-ndjson")
+    assert json.loads(response.data).get("inserted") == 1
+    assert json.loads(response.data).get("updated") == 1
+
+    players = json.loads(client.get(f"/api/teams/{team_id}/players").data).get("data")
+    assert sorted(player.get("name") for player in players) == ["Imported", "Renamed"]
+    assert len({player.get("id") for player in players}) == 2
+    assert shard_player_ids(app_router, 1) == sorted(player.get("id") for player in players)
+
+# Testing the populate job imports players through the router, a replayed chunk adds nothing
+# on any shard
+def test_populate_chunk_sharded(router):
+    team_ids = [add_team(router, f"Team_populated_{index}") for index in range(2)]
+    sharding.router = router
+    try:
+        rows = [{ "name": f"Player_{index}", "team_id": team_ids[index % 2] } for index in range(4)]
+        with router.sessions[0]() as primary:
+            assert import_players_chunk(primary, rows, ("job", 0)) == 4
+            assert import_players_chunk(primary, rows, ("job", 0)) == 0
+            assert import_players_chunk(primary, rows[:1], ("job", 1)) == 1
+    finally:
+        sharding.router = None
+    assert [row.name for row in router.players_of_team(team_ids[0])] == ["Player_0", "Player_2", "Player_0"]
+    assert [row.name for row in router.players_of_team(team_ids[1])] == ["Player_1", "Player_3"]
+
+# Testing the stats routes refuse sharded players instead of failing on the primary
+# [POST /api/players/<id>/stats]
+def test_stats_refused_sharded(client, app_router):
+    response = client.post("/api/players/1/stats", json={ "goals": 1 })
+    assert response.status_code == 501
+    assert client.get("/api/players/1/stats").status_code == 501
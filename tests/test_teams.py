@@ -4,7 +4,9 @@ import uuid
 from main import app
 from unittest.mock import patch
 from src.db import session
-from src.models import Team
+from src.models import Team, Player
+from src.cache import invalidate, PLAYERS_TAG, TEAMS_TAG
+from src import counts
 
 # Create a test client to use the app
 @pytest.fixture
@@ -105,6 +107,145 @@ def test_delete_team(client, insert_team):
     data = json.loads(response.data)
     assert data.get("message") == "Team Deleted Successfully"
 
+# Testing multi-get [GET /teams?ids=]
+def test_get_teams_by_id(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+
+    response = client.get(f"/api/teams?ids={_id},{_id + 1000000},{_id}")
+    data = json.loads(response.data).get("data")
+    assert response.status_code == 200
+    assert [team.get("name") for team in data] == [insert_team, None, insert_team]
+    assert data[1].get("error") == "Not Found"
+
+# Testing optimistic concurrency on update [PUT /teams/<int:id> with If-Match]
+def test_update_team_if_match(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    etag = client.get(f"/api/teams/{_id}").headers.get("ETag")
+
+    # Only the first update sent with the same ETag applies
+    response = client.put(f"/api/teams/{_id}", json={ "name": f"updated_{insert_team}" }, headers={ "If-Match": etag })
+    assert response.status_code == 200
+    response = client.put(f"/api/teams/{_id}", json={ "name": f"again_{insert_team}" }, headers={ "If-Match": etag })
+    assert response.status_code == 412
+
+# Testing the players of a deleted team are deleted with it [DELETE /teams/<int:id>]
+def test_delete_team_with_players(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    session.add_all([Player(name = f"Player_{uuid.uuid4()}", team_id = _id) for _ in range(3)])
+    session.commit()
+
+    response = client.delete(f"/api/teams/{_id}")
+    assert response.status_code == 200
+
+    # Neither the team nor its players remain
+    session.expire_all()
+    assert session.query(Team).filter_by(id=_id).first() is None
+    assert session.query(Player).filter_by(team_id=_id).count() == 0
+
+# Testing the roster of one team is cached and follows player writes [GET /teams/<int:id>/players]
+def test_get_team_players(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    other_team = Team(name = f"Team_{uuid.uuid4()}")
+    player = Player(name = f"Player_{uuid.uuid4()}", team_id = _id)
+    session.add_all([other_team, player])
+    session.commit()
+    other_id, player_id = other_team.id, player.id
+
+    response = client.get(f"/api/teams/{_id}/players")
+    assert response.status_code == 200
+    assert [p.get("id") for p in json.loads(response.data).get("data")] == [player_id]
+    assert json.loads(client.get(f"/api/teams/{_id}/players").data).get("source") == "cache"
+
+    # Moving the player clears the rosters of both teams
+    client.get(f"/api/teams/{other_id}/players")
+    response = client.put(f"/api/players/{player_id}", json={ "name": "Moved", "team_id": other_id })
+    assert response.status_code == 200
+    data = json.loads(client.get(f"/api/teams/{_id}/players").data)
+    assert data == { "data": [], "source": "database" }
+    data = json.loads(client.get(f"/api/teams/{other_id}/players").data)
+    assert data.get("source") == "database"
+    assert [p.get("id") for p in data.get("data")] == [player_id]
+
+    assert client.get("/api/teams/999999999/players").status_code == 404
+
+# Testing totals of teams and of one team's players are exact and follow writes [?total=1]
+def test_get_totals(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    session.add_all([Player(name = f"Player_{uuid.uuid4()}", team_id = _id) for _ in range(2)])
+    session.commit()
+
+    total = json.loads(client.get("/api/teams?total=1").data).get("total")
+    assert total == { "count": session.query(Team).count(), "exact": True }
+
+    total = json.loads(client.get(f"/api/teams/{_id}/players?total=1").data).get("total")
+    assert total == { "count": 2, "exact": True }
+
+    # Every team gets its own count, a team without players has none
+    other_name = f"Team_{uuid.uuid4()}"
+    client.post("/api/teams", json={ "name": other_name })
+    other_id = session.query(Team).filter_by(name=other_name).first().id
+    total = json.loads(client.get(f"/api/teams/{other_id}/players?total=1").data).get("total")
+    assert total == { "count": 0, "exact": True }
+
+    # The cached count follows the players joining the team
+    assert client.post("/api/players", json={ "name": "Joining", "team_id": other_id }).status_code == 200
+    total = json.loads(client.get(f"/api/teams/{other_id}/players?total=1").data).get("total")
+    assert total == { "count": 1, "exact": True }
+
+# Testing the players of a large team are estimated from the statistics instead of counted,
+# small teams are still counted [GET /teams/<int:id>/players?total=1]
+def test_get_team_players_total_estimated(client, insert_team):
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    session.add(Player(name = f"Player_{uuid.uuid4()}", team_id = _id))
+    session.commit()
+
+    with patch("src.counts.estimate_rows", return_value=counts.EXACT_COUNT_LIMIT + 1) as estimate_rows:
+        total = json.loads(client.get(f"/api/teams/{_id}/players?total=1").data).get("total")
+        assert total == { "count": counts.EXACT_COUNT_LIMIT + 1, "exact": False }
+
+        # The estimate is cached until the roster changes
+        estimate_rows.return_value = 5
+        total = json.loads(client.get(f"/api/teams/{_id}/players?total=1").data).get("total")
+        assert total == { "count": counts.EXACT_COUNT_LIMIT + 1, "exact": False }
+        assert client.post("/api/players", json={ "name": "Joining", "team_id": _id }).status_code == 200
+        total = json.loads(client.get(f"/api/teams/{_id}/players?total=1").data).get("total")
+        assert total == { "count": 2, "exact": True }
+
+# Function reading each view twice, the second read comes from the cache
+def prime(client, paths):
+    for path in paths:
+        client.get(path)
+        assert json.loads(client.get(path).data).get("source") == "cache", path
+
+# Function returning path -> source of the next read of each view
+def sources(client, paths):
+    return { path: json.loads(client.get(path).data).get("source") for path in paths }
+
+# Testing team writes clear every cached view showing teams or team names, the players list
+# and the rosters included [POST, PUT, DELETE /teams]
+def test_team_writes_invalidate_views(client, insert_team):
+    views = ["/api/teams", "/api/teams/players", "/api/players"]
+    prime(client, views)
+    assert client.post("/api/teams", json={ "name": f"Team_{uuid.uuid4()}" }).status_code == 201
+    assert sources(client, views[:2]) == dict.fromkeys(views[:2], "database")
+
+    _id = session.query(Team).filter_by(name=insert_team).first().id
+    session.add(Player(name = f"Player_{uuid.uuid4()}", team_id = _id))
+    session.commit()
+    views += [f"/api/teams?ids={_id}", f"/api/teams/{_id}/players"]
+    prime(client, views)
+    assert client.put(f"/api/teams/{_id}", json={ "name": f"updated_{insert_team}" }).status_code == 200
+    assert sources(client, views) == dict.fromkeys(views, "database")
+
+    # The roster of the deleted team is gone
+    prime(client, views)
+    assert client.delete(f"/api/teams/{_id}").status_code == 200
+    assert sources(client, views[:4]) == dict.fromkeys(views[:4], "database")
+    assert client.get(f"/api/teams/{_id}/players").status_code == 404
+
+    # Leaving the views uncached for the database error tests
+    invalidate(PLAYERS_TAG, TEAMS_TAG)
+
 # SECTION: Testing Error Handling in the Requests 
 
 # Testing exception when team is not found [404]
@@ -219,9 +360,9 @@ def test_database_error_update_team(client):
 def test_database_error_delete_team(client):
     _error = "Simulated database error"
     # Mock the database session to raise an exception
-    with patch('src.db.session.delete') as mock_delete:
-        # Make the query function raise an exception
-        mock_delete.side_effect = Exception(_error) 
+    with patch('src.db.session.execute') as mock_execute:
+        # Make the execute function raise an exception
+        mock_execute.side_effect = Exception(_error) 
 
         response = client.delete('/api/teams/1')
 
@@ -0,0 +1,47 @@
+import pytest
+from src import create_app
+from src.tracing import init_tracing
+
+# Exporter keeping the exported traces in memory
+class MemoryExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, spans):
+        self.traces.append([span.to_dict() for span in spans])
+
+# Create a test client of an app traced with the memory exporter, nothing sampled by default
+@pytest.fixture
+def traced(monkeypatch):
+    monkeypatch.setenv("TRACE_SAMPLE_RATE", "0")
+    exporter = MemoryExporter()
+    app = create_app()
+    init_tracing(app, exporter)
+    with app.test_client() as client:
+        yield client, exporter
+
+# Testing a request flagged as sampled by its traceparent gets a full trace
+def test_sampled_request(traced):
+    client, exporter = traced
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    response = client.get("/api/teams/players", headers={ "traceparent": f"00-{trace_id}-00f067aa0ba902b7-01" })
+
+    assert response.status_code == 200
+    assert response.headers.get("traceparent").startswith(f"00-{trace_id}-")
+
+    spans = exporter.traces[-1]
+    names = [span["name"] for span in spans]
+    assert all(span["trace_id"] == trace_id for span in spans)
+    assert names[-1] == "GET /api/teams/players"
+    assert spans[-1]["parent_id"] == "00f067aa0ba902b7"
+    assert "handler teams.get_teams_and_players" in names
+    assert "redis.pipeline" in names
+
+# Testing requests left out by the sampler are not traced
+def test_unsampled_request(traced):
+    client, exporter = traced
+    response = client.get("/api/teams", headers={ "traceparent": "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-00" })
+
+    assert response.status_code == 200
+    assert "traceparent" not in response.headers
+    assert exporter.traces == []
@@ -197,4 +197,25 @@ def test_database_error_login_user(client, insert_user):
         assert response.status_code == 500
         data = json.loads(response.data)
         assert data.get("Error") == "An Error occurred while Logging In"
-        assert _error in data.get("message")
\ No newline at end of file
+        assert _error in data.get("message")
+# SECTION: Testing Rate Limiting [429]
+
+# Testing error 429 when a client exceeds the login limit
+def test_login_rate_limited(client):
+    # Sending every request from the same unique client address
+    _headers = { "X-Real-IP": f"10.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}.{uuid.uuid4().int % 250}" }
+    _limit = app.config["RATE_LIMITS"]["auth.login"][0]
+
+    # Exhausting the limit with invalid credentials
+    for _ in range(_limit):
+        response = client.post("/login", json = { "username": "", "password": ""}, headers = _headers)
+        assert response.status_code == 401
+
+    # Requesting once more past the limit
+    response = client.post("/login", json = { "username": "", "password": ""}, headers = _headers)
+    data = json.loads(response.data)
+
+    # Asserts to verify the request was rejected with a retry hint
+    assert response.status_code == 429
+    assert data.get("message") == "Too Many Requests"
+    assert int(response.headers.get("Retry-After")) > 0